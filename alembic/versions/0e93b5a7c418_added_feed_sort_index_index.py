@@ -0,0 +1,24 @@
+"""Added feed sort index index.
+
+Revision ID: 0e93b5a7c418
+Revises: d81f4c6e2a07
+Create Date: 2026-10-19 20:12:31.604271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e93b5a7c418'
+down_revision = 'd81f4c6e2a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_feed_sort_index', 'feed', ['subscription_id', 'sort_index', 'remote_post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_feed_sort_index', table_name='feed')
@@ -0,0 +1,39 @@
+"""Added perceptual hash to file.
+
+Revision ID: 3f6a0c2d91b4
+Revises: 1aaccf605d25
+Create Date: 2026-10-19 10:12:40.118023
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a0c2d91b4'
+down_revision = '1aaccf605d25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file', sa.Column('phash', sa.BigInteger(), nullable=True))
+    
+    chunks = (
+        '(phash >> 48) & 65535',
+        '(phash >> 32) & 65535',
+        '(phash >> 16) & 65535',
+        'phash & 65535',
+    )
+    
+    for i, expression in enumerate(chunks):
+        op.add_column('file', sa.Column(f'phash_{i}', sa.Integer(), sa.Computed(expression), nullable=True))
+        op.create_index(f'ix_file_phash_{i}', 'file', [f'phash_{i}'])
+
+
+def downgrade():
+    for i in range(4):
+        op.drop_index(f'ix_file_phash_{i}', table_name='file')
+        op.drop_column('file', f'phash_{i}')
+    
+    op.drop_column('file', 'phash')
@@ -0,0 +1,47 @@
+"""Updated remote posts when their tags change.
+
+Revision ID: 4d9a1f7e2b58
+Revises: 0e93b5a7c418
+Create Date: 2026-10-19 22:41:07.318846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9a1f7e2b58'
+down_revision = '0e93b5a7c418'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tag_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        -- changing the tags also counts as updating the post, for incremental exports
+        -- (except for archive imports, which keep the time the posts were exported with)
+        UPDATE remote_post p
+            SET search_vector = hoordu_remote_post_vector(p.title, p.comment, hoordu_remote_post_tags(p.id)),
+                updated_time = CASE WHEN current_setting('hoordu.keep_updated_time', true) = 'on' THEN p.updated_time ELSE now() END
+            WHERE p.id IN (SELECT DISTINCT post_id FROM changed_tags);
+        RETURN NULL;
+    END
+    $$
+    """)
+
+
+def downgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tag_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE remote_post p
+            SET search_vector = hoordu_remote_post_vector(p.title, p.comment, hoordu_remote_post_tags(p.id))
+            WHERE p.id IN (SELECT DISTINCT post_id FROM changed_tags);
+        RETURN NULL;
+    END
+    $$
+    """)
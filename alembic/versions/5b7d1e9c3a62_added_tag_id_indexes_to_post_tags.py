@@ -0,0 +1,26 @@
+"""Added tag id indexes to post tags.
+
+Revision ID: 5b7d1e9c3a62
+Revises: 8c2e5d7a4b19
+Create Date: 2026-10-19 16:21:09.331847
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7d1e9c3a62'
+down_revision = '8c2e5d7a4b19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_post_tag_tag_id', 'post_tag', ['tag_id', 'post_id'])
+    op.create_index('ix_remote_post_tag_tag_id', 'remote_post_tag', ['tag_id', 'post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_remote_post_tag_tag_id', table_name='remote_post_tag')
+    op.drop_index('ix_post_tag_tag_id', table_name='post_tag')
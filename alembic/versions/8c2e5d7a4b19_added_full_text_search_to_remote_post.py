@@ -0,0 +1,104 @@
+"""Added full text search to remote post.
+
+Revision ID: 8c2e5d7a4b19
+Revises: 3f6a0c2d91b4
+Create Date: 2026-10-19 14:03:22.540118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5d7a4b19'
+down_revision = '3f6a0c2d91b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # requires the extension in psql-text-search/ to be installed
+    op.execute('CREATE EXTENSION IF NOT EXISTS hoordu')
+    
+    op.add_column('remote_post', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tags(integer) RETURNS text
+    LANGUAGE sql STABLE AS $$
+        SELECT coalesce(string_agg((CASE t.category WHEN 1 THEN 'general' WHEN 2 THEN 'group' WHEN 3 THEN 'artist' WHEN 4 THEN 'copyright' WHEN 5 THEN 'character' WHEN 6 THEN 'meta' END) || ':' || replace(t.tag, ' ', '_'), ' '), '')
+        FROM remote_post_tag pt
+        JOIN remote_tag t ON t.id = pt.tag_id
+        WHERE pt.post_id = $1
+    $$
+    """)
+    
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_vector(title text, comment text, tags text) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('hoordu_tags_v', tags), 'B')
+            || setweight(to_tsvector('simple', coalesce(comment, '')), 'C')
+    $$
+    """)
+    
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := hoordu_remote_post_vector(NEW.title, NEW.comment, hoordu_remote_post_tags(NEW.id));
+        RETURN NEW;
+    END
+    $$
+    """)
+    
+    op.execute("""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tag_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE remote_post p
+            SET search_vector = hoordu_remote_post_vector(p.title, p.comment, hoordu_remote_post_tags(p.id))
+            WHERE p.id IN (SELECT DISTINCT post_id FROM changed_tags);
+        RETURN NULL;
+    END
+    $$
+    """)
+    
+    op.execute("""
+    CREATE TRIGGER remote_post_search_vector
+        BEFORE INSERT OR UPDATE OF title, comment ON remote_post
+        FOR EACH ROW EXECUTE FUNCTION hoordu_remote_post_search_trigger()
+    """)
+    
+    op.execute("""
+    CREATE TRIGGER remote_post_tag_insert_search_vector
+        AFTER INSERT ON remote_post_tag
+        REFERENCING NEW TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION hoordu_remote_post_tag_search_trigger()
+    """)
+    
+    op.execute("""
+    CREATE TRIGGER remote_post_tag_delete_search_vector
+        AFTER DELETE ON remote_post_tag
+        REFERENCING OLD TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION hoordu_remote_post_tag_search_trigger()
+    """)
+    
+    # existing posts
+    op.execute('UPDATE remote_post SET search_vector = hoordu_remote_post_vector(title, comment, hoordu_remote_post_tags(id))')
+    
+    op.create_index('ix_remote_post_search_vector', 'remote_post', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_remote_post_search_vector', table_name='remote_post')
+    
+    op.execute('DROP TRIGGER remote_post_tag_delete_search_vector ON remote_post_tag')
+    op.execute('DROP TRIGGER remote_post_tag_insert_search_vector ON remote_post_tag')
+    op.execute('DROP TRIGGER remote_post_search_vector ON remote_post')
+    op.execute('DROP FUNCTION hoordu_remote_post_tag_search_trigger()')
+    op.execute('DROP FUNCTION hoordu_remote_post_search_trigger()')
+    op.execute('DROP FUNCTION hoordu_remote_post_vector(text, text, text)')
+    op.execute('DROP FUNCTION hoordu_remote_post_tags(integer)')
+    
+    op.drop_column('remote_post', 'search_vector')
@@ -0,0 +1,54 @@
+"""Added tag stats and autocomplete indexes.
+
+Revision ID: d81f4c6e2a07
+Revises: 5b7d1e9c3a62
+Create Date: 2026-10-19 18:47:55.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4c6e2a07'
+down_revision = '5b7d1e9c3a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    
+    for table, tag_table, post_table, post_tag_table in (
+        ('tag_stats', 'tag', 'post', 'post_tag'),
+        ('remote_tag_stats', 'remote_tag', 'remote_post', 'remote_post_tag'),
+    ):
+        op.create_table(table,
+            sa.Column('tag_id', sa.Integer(), nullable=False),
+            sa.Column('post_count', sa.Integer(), nullable=False),
+            sa.Column('last_used_time', sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(['tag_id'], [f'{tag_table}.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('tag_id')
+        )
+        op.create_index(f'ix_{table}_post_count', table, ['post_count'])
+        
+        op.create_index(f'ix_{tag_table}_tag_prefix', tag_table, [sa.text('lower(tag) text_pattern_ops')])
+        op.create_index(f'ix_{tag_table}_tag_trgm', tag_table, ['tag'], postgresql_using='gin', postgresql_ops={'tag': 'gin_trgm_ops'})
+        
+        # initial counts
+        op.execute(f"""
+        INSERT INTO {table} (tag_id, post_count, last_used_time)
+        SELECT t.id, count(pt.post_id), max(p.created_time)
+        FROM {tag_table} t
+        LEFT JOIN {post_tag_table} pt ON pt.tag_id = t.id
+        LEFT JOIN {post_table} p ON p.id = pt.post_id
+        GROUP BY t.id
+        """)
+
+
+def downgrade():
+    for table, tag_table in (('remote_tag_stats', 'remote_tag'), ('tag_stats', 'tag')):
+        op.drop_index(f'ix_{tag_table}_tag_trgm', table_name=tag_table)
+        op.drop_index(f'ix_{tag_table}_tag_prefix', table_name=tag_table)
+        op.drop_index(f'ix_{table}_post_count', table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,3 @@
+from .common import *
+from .export import *
+from .importer import *
@@ -0,0 +1,75 @@
+import contextlib
+import io
+from collections.abc import Iterator
+from typing import IO
+
+from sqlalchemy import Table, Column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from ..models import *
+
+__all__ = [
+    'ARCHIVE_VERSION',
+    'ARCHIVE_TABLES',
+    'archive_columns',
+    'open_archive',
+]
+
+
+ARCHIVE_VERSION = 1
+
+# every exported table and the columns it's paginated by, parents before children
+ARCHIVE_TABLES: list[tuple[Table, tuple[str, ...]]] = [
+    (Source.__table__, ('id',)),
+    (Plugin.__table__, ('id',)),
+    (Subscription.__table__, ('id',)),
+    (Tag.__table__, ('id',)),
+    (Post.__table__, ('id',)),
+    # the (tag_id, post_id) indexes cover the link tables
+    (post_tag, ('tag_id', 'post_id')),
+    (RemoteTag.__table__, ('id',)),
+    (TagTranslation.__table__, ('id',)),
+    (RemotePost.__table__, ('id',)),
+    (remote_post_tag, ('tag_id', 'post_id')),
+    (File.__table__, ('id',)),
+    (FeedEntry.__table__, ('subscription_id', 'remote_post_id')),
+    (Related.__table__, ('id',)),
+]
+
+# plugin configs hold credentials
+_EXCLUDED_COLUMNS = {
+    'plugin': {'config'},
+}
+
+def archive_columns(table: Table) -> list[Column]:
+    # generated columns and search vectors are recomputed by the database
+    excluded = _EXCLUDED_COLUMNS.get(table.name, ())
+    return [c for c in table.columns
+            if c.computed is None and not isinstance(c.type, TSVECTOR) and c.name not in excluded]
+
+@contextlib.contextmanager
+def open_archive(path: str, mode: str = 'rb') -> Iterator[IO[bytes]]:
+    """
+    Opens an archive, paths that end in .zst are (de)compressed with zstd
+    (requires the zstandard package).
+    """
+    
+    with open(path, mode) as f:
+        if not path.endswith('.zst'):
+            yield f
+            return
+        
+        try:
+            import zstandard
+            
+        except ImportError:
+            raise ValueError('zstd archives require the zstandard package')
+        
+        if 'r' in mode:
+            with zstandard.ZstdDecompressor().stream_reader(f, closefd=False) as reader:
+                # buffered, so it can be read line by line
+                yield io.BufferedReader(reader)
+                
+        else:
+            with zstandard.ZstdCompressor(threads=-1).stream_writer(f, closefd=False) as writer:
+                yield writer
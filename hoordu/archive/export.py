@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from enum import Enum
+from typing import IO, Any, Optional
+
+from sqlalchemy import Table, select, tuple_, or_
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ..models import *
+from .common import *
+
+__all__ = [
+    'ArchiveExporter',
+]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+        
+    elif isinstance(value, datetime):
+        return value.isoformat()
+        
+    elif isinstance(value, timedelta):
+        return value.total_seconds()
+        
+    elif isinstance(value, bytes):
+        return value.hex()
+        
+    elif isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else str(value)
+    
+    raise TypeError(f'can\'t encode {type(value).__name__}')
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_encode).encode
+
+
+class ArchiveExporter:
+    """
+    Writes the archive as JSON lines, a header followed by one
+    {"table": name, "row": {column: value}} line per row.
+    Every table is read in keyset batches, each one streamed from a server side
+    cursor, so memory use doesn't depend on the size of the database.
+    The whole export reads from a single snapshot.
+    
+    Incremental exports (since) only include the rows updated after that time,
+    link tables are included when their post was updated (which linking tags
+    or related urls to it does).
+    Deletions aren't exported.
+    """
+    
+    def __init__(self, session, batch_size: int = 10000, partition_size: int = 1000):
+        self.session = session
+        self.batch_size: int = batch_size
+        self.partition_size: int = partition_size
+        self.log: logging.Logger = logging.getLogger('hoordu.archive')
+    
+    def _since(self, table: Table, since: datetime):
+        if 'updated_time' in table.c:
+            return table.c.updated_time > since
+        
+        updated_posts = lambda model: select(model.id).where(model.updated_time > since)
+        
+        if table is post_tag:
+            return table.c.post_id.in_(updated_posts(Post))
+            
+        elif table is remote_post_tag:
+            return table.c.post_id.in_(updated_posts(RemotePost))
+            
+        elif table is FeedEntry.__table__:
+            return or_(
+                table.c.remote_post_id.in_(updated_posts(RemotePost)),
+                table.c.subscription_id.in_(updated_posts(Subscription))
+            )
+            
+        elif table is Related.__table__:
+            return table.c.related_to_id.in_(updated_posts(RemotePost))
+        
+        # small tables without timestamps are always exported
+        return None
+    
+    async def _export_table(self, connection: AsyncConnection, out: IO[bytes], table: Table, keys: tuple[str, ...], since: Optional[datetime]) -> int:
+        columns = archive_columns(table)
+        names = [c.name for c in columns]
+        key_columns = [table.c[k] for k in keys]
+        key_indexes = [names.index(k) for k in keys]
+        key = tuple_(*key_columns) if len(keys) > 1 else key_columns[0]
+        
+        statement = select(*columns).order_by(*key_columns).limit(self.batch_size)
+        if since is not None:
+            condition = self._since(table, since)
+            if condition is not None:
+                statement = statement.where(condition)
+        
+        statement = statement.execution_options(yield_per=self.partition_size)
+        
+        total = 0
+        last = None
+        while True:
+            batch = statement if last is None else statement.where(key > (tuple_(*last) if len(keys) > 1 else last[0]))
+            
+            count = 0
+            result = await connection.stream(batch)
+            async for rows in result.partitions():
+                out.write(''.join(
+                    _dumps({'table': table.name, 'row': dict(zip(names, row))}) + '\n'
+                    for row in rows
+                ).encode())
+                
+                count += len(rows)
+                last = [rows[-1][i] for i in key_indexes]
+            
+            total += count
+            if count < self.batch_size:
+                return total
+            
+            self.log.info('exported %s rows from %s', total, table.name)
+    
+    async def export(self, out: IO[bytes], since: Optional[datetime] = None) -> dict[str, int]:
+        """
+        Writes the archive to out and returns the number of rows exported from each table.
+        """
+        
+        header = {
+            'version': ARCHIVE_VERSION,
+            'created_time': datetime.now(timezone.utc),
+            'since': since,
+        }
+        out.write((_dumps(header) + '\n').encode())
+        
+        # a connection of its own, so the export reads from a single snapshot
+        # without touching the session's transaction
+        counts = {}
+        async with self.session.engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level='REPEATABLE READ')
+            async with connection.begin():
+                for table, keys in ARCHIVE_TABLES:
+                    started = time.monotonic()
+                    counts[table.name] = await self._export_table(connection, out, table, keys, since)
+                    self.log.info('exported %s rows from %s in %.1fs', counts[table.name], table.name, time.monotonic() - started)
+        
+        return counts
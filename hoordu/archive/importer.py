@@ -0,0 +1,318 @@
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import IO, Any, Callable, Optional
+
+from sqlalchemy import Table, DateTime, Interval, LargeBinary, Numeric
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ..cache import table_tags
+from ..models import *
+from ..tagstats import reconcile_tag_stats
+from .common import *
+
+__all__ = [
+    'TableImport',
+    'ArchiveImporter',
+]
+
+
+def _q(name: str) -> str:
+    return f'"{name}"'
+
+def _converter(column) -> Optional[Callable[[Any], Any]]:
+    # the inverse of the exporter's encoding, COPY needs the actual types
+    type = column.type
+    if isinstance(type, DateTime):
+        return datetime.fromisoformat
+        
+    elif isinstance(type, Interval):
+        return lambda value: timedelta(seconds=value)
+        
+    elif isinstance(type, LargeBinary):
+        return bytes.fromhex
+        
+    elif isinstance(type, Numeric):
+        return lambda value: Decimal(str(value))
+    
+    return None
+
+
+@dataclass
+class _Merge:
+    table: Table
+    # column -> (parent table, whether rows without the parent are skipped or the column is cleared)
+    parents: dict[str, tuple[str, bool]]
+    # how an archived row (s) is matched to an existing one (t), for tables with their own ids
+    match: Optional[str] = None
+    # columns that reference tables that are imported later, fixed up at the end
+    deferred: tuple[str, ...] = ()
+    
+    @property
+    def name(self) -> str:
+        return self.table.name
+    
+    @property
+    def serial(self) -> bool:
+        return 'id' in self.table.c and 'id' not in self.parents
+
+# rows without a natural key match when they are the same row,
+# e.g.: importing an incremental export into a restored archive
+_SAME_ROW = 't.id = s.id AND t.created_time = s.created_time'
+
+_MERGES = {merge.name: merge for merge in [
+    _Merge(Source.__table__, {}, 't.name = s.name', deferred=('preferred_plugin_id',)),
+    _Merge(Plugin.__table__, {'source_id': ('source', True)}, 't.name = s.name'),
+    _Merge(Subscription.__table__,
+        {'source_id': ('source', True), 'plugin_id': ('plugin', False)},
+        # both are unique
+        't.source_id = s.source_id AND (t.name = s.name OR t.repr = s.repr)'),
+    _Merge(Tag.__table__, {}, 't.category = s.category AND t.tag = s.tag'),
+    _Merge(Post.__table__, {}, _SAME_ROW),
+    _Merge(post_tag, {'post_id': ('post', True), 'tag_id': ('tag', True)}),
+    _Merge(RemoteTag.__table__, {'source_id': ('source', True)},
+        't.source_id = s.source_id AND t.category = s.category AND t.tag = s.tag'),
+    _Merge(TagTranslation.__table__, {'id': ('remote_tag', True), 'local_tag_id': ('tag', False)}),
+    _Merge(RemotePost.__table__, {'source_id': ('source', True)},
+        't.source_id = s.source_id AND t.original_id = s.original_id'),
+    _Merge(remote_post_tag, {'post_id': ('remote_post', True), 'tag_id': ('remote_tag', True)}),
+    _Merge(File.__table__, {'local_id': ('post', False), 'remote_id': ('remote_post', False)}, _SAME_ROW),
+    _Merge(FeedEntry.__table__, {'subscription_id': ('subscription', True), 'remote_post_id': ('remote_post', True)}),
+    _Merge(Related.__table__, {'related_to_id': ('remote_post', True), 'remote_id': ('remote_post', False)},
+        't.related_to_id = s.related_to_id AND t.url IS NOT DISTINCT FROM s.url'),
+]}
+
+
+@dataclass
+class TableImport:
+    loaded: int = 0
+    inserted: int = 0
+    updated: int = 0
+    # rows whose parents didn't exist
+    skipped: int = 0
+
+
+class ArchiveImporter:
+    """
+    Restores or merges an archive written by ArchiveExporter.
+
+    Rows are loaded with COPY into temporary staging tables and merged with a
+    handful of set based statements per table, all in a single transaction:
+    - references are remapped to the ids their parents got in this database
+      (or kept as they are, if the parent wasn't in the archive)
+    - rows are matched to existing ones by their natural key (source and
+      original id, category and tag, etc), matched rows are updated if the
+      archived row is newer
+    - new rows keep their id if it's free and get a new one otherwise
+    Restoring into an empty database keeps every id, so the file storage can
+    be copied as is, files that had to be given new ids can be written to a
+    manifest (old id, new id) to move them.
+    """
+    
+    def __init__(self, session, batch_size: int = 50000):
+        self.session = session
+        self.batch_size: int = batch_size
+        self.log: logging.Logger = logging.getLogger('hoordu.archive')
+    
+    async def _execute(self, connection: AsyncConnection, sql: str) -> int:
+        result = await connection.exec_driver_sql(sql)
+        return result.rowcount
+    
+    async def _stage(self, connection: AsyncConnection, driver, inp: IO[bytes]) -> dict[str, TableImport]:
+        columns = {table.name: archive_columns(table) for table, _ in ARCHIVE_TABLES}
+        counts = {name: TableImport() for name in columns}
+        
+        for table, _ in ARCHIVE_TABLES:
+            names = ', '.join(_q(c.name) for c in columns[table.name])
+            await connection.exec_driver_sql(
+                    f'CREATE TEMPORARY TABLE {_q("import_" + table.name)} ON COMMIT DROP '
+                    f'AS SELECT {names} FROM {_q(table.name)} WITH NO DATA')
+            
+            if _MERGES[table.name].serial:
+                await connection.exec_driver_sql(
+                        f'CREATE TEMPORARY TABLE {_q("import_map_" + table.name)} '
+                        '(old_id integer PRIMARY KEY, new_id integer, existing boolean NOT NULL) ON COMMIT DROP')
+        
+        converters = {name: [(c.name, _converter(c)) for c in cols] for name, cols in columns.items()}
+        buffers: dict[str, list[tuple]] = {name: [] for name in columns}
+        
+        async def flush(name):
+            rows = buffers[name]
+            if not rows:
+                return
+            
+            await driver.copy_records_to_table(f'import_{name}', records=rows, columns=[c.name for c in columns[name]])
+            counts[name].loaded += len(rows)
+            buffers[name] = []
+        
+        header = json.loads(inp.readline() or b'{}')
+        version = header.get('version')
+        if version is None or version > ARCHIVE_VERSION:
+            raise ValueError(f'unsupported archive version: {version}')
+        
+        for line in inp:
+            record = json.loads(line)
+            name = record['table']
+            if name not in buffers:
+                raise ValueError(f'unknown table in archive: {name}')
+            
+            row = record['row']
+            values = []
+            for column, convert in converters[name]:
+                value = row.get(column)
+                if value is not None and convert is not None:
+                    value = convert(value)
+                values.append(value)
+            
+            buffers[name].append(tuple(values))
+            if len(buffers[name]) >= self.batch_size:
+                await flush(name)
+        
+        for name in buffers:
+            await flush(name)
+            await connection.exec_driver_sql(f'ANALYZE {_q("import_" + name)}')
+        
+        return counts
+    
+    async def _remap(self, connection: AsyncConnection, merge: _Merge, counts: TableImport) -> None:
+        staging = _q(f'import_{merge.name}')
+        for column, (parent, required) in merge.parents.items():
+            # parents that were skipped are mapped to null, the ones that weren't in the archive keep their ids
+            c = _q(column)
+            await connection.exec_driver_sql(
+                    f'UPDATE {staging} s SET {c} = m.new_id FROM {_q("import_map_" + parent)} m '
+                    f'WHERE m.old_id = s.{c}')
+            
+            missing = f'NOT EXISTS (SELECT 1 FROM {_q(parent)} p WHERE p.id = s.{c})'
+            if not required:
+                await connection.exec_driver_sql(f'UPDATE {staging} s SET {c} = NULL WHERE s.{c} IS NOT NULL AND {missing}')
+                continue
+            
+            delete = f'DELETE FROM {staging} s WHERE s.{c} IS NULL OR {missing}'
+            if merge.serial:
+                # so their children are skipped too
+                result = await connection.exec_driver_sql(
+                        f'WITH skipped AS ({delete} RETURNING s.id) '
+                        f'INSERT INTO {_q("import_map_" + merge.name)} SELECT id, NULL, false FROM skipped')
+                        
+            else:
+                result = await connection.exec_driver_sql(delete)
+            
+            counts.skipped += result.rowcount
+    
+    async def _merge_serial(self, connection: AsyncConnection, merge: _Merge, counts: TableImport) -> None:
+        table = _q(merge.name)
+        staging = _q(f'import_{merge.name}')
+        mapping = _q(f'import_map_{merge.name}')
+        unmapped = f'NOT EXISTS (SELECT 1 FROM {mapping} m WHERE m.old_id = s.id)'
+        
+        if merge.match is not None:
+            await connection.exec_driver_sql(
+                    f'INSERT INTO {mapping} SELECT DISTINCT ON (s.id) s.id, t.id, true '
+                    f'FROM {staging} s JOIN {table} t ON {merge.match} ORDER BY s.id, t.id')
+        
+        # new rows keep their ids when they're free
+        await connection.exec_driver_sql(
+                f'INSERT INTO {mapping} SELECT s.id, s.id, false FROM {staging} s '
+                f'WHERE {unmapped} AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.id = s.id)')
+        
+        sequence = (await connection.exec_driver_sql(f"SELECT pg_get_serial_sequence('{merge.name}', 'id')")).scalar()
+        await connection.exec_driver_sql(
+                f"SELECT setval('{sequence}', greatest((SELECT max(id) FROM {table}), (SELECT max(new_id) FROM {mapping}), 1))")
+        await connection.exec_driver_sql(
+                f"INSERT INTO {mapping} SELECT s.id, nextval('{sequence}'), false FROM {staging} s WHERE {unmapped}")
+        
+        columns = [c.name for c in archive_columns(merge.table) if c.name != 'id']
+        inserted = ['NULL' if c in merge.deferred else f's.{_q(c)}' for c in columns]
+        counts.inserted = await self._execute(connection,
+                f'INSERT INTO {table} AS t (id, {", ".join(map(_q, columns))}) '
+                f'SELECT m.new_id, {", ".join(inserted)} FROM {staging} s JOIN {mapping} m ON m.old_id = s.id '
+                'WHERE NOT m.existing')
+        
+        if 'updated_time' in merge.table.c:
+            updated = [c for c in columns if c != 'created_time' and c not in merge.deferred]
+            counts.updated = await self._execute(connection,
+                    f'UPDATE {table} t SET ({", ".join(map(_q, updated))}) = ROW({", ".join(f"s.{_q(c)}" for c in updated)}) '
+                    f'FROM {staging} s JOIN {mapping} m ON m.old_id = s.id '
+                    'WHERE m.existing AND t.id = m.new_id AND t.updated_time < s.updated_time')
+    
+    async def _merge_link(self, connection: AsyncConnection, merge: _Merge, keys: tuple[str, ...], counts: TableImport) -> None:
+        table = _q(merge.name)
+        staging = _q(f'import_{merge.name}')
+        columns = [c.name for c in archive_columns(merge.table)]
+        same = ' AND '.join(f't.{_q(k)} = s.{_q(k)}' for k in keys)
+        
+        counts.inserted = await self._execute(connection,
+                f'INSERT INTO {table} AS t ({", ".join(map(_q, columns))}) '
+                f'SELECT DISTINCT ON ({", ".join(f"s.{_q(k)}" for k in keys)}) {", ".join(f"s.{_q(c)}" for c in columns)} '
+                f'FROM {staging} s WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {same})')
+        
+        if 'updated_time' in merge.table.c:
+            updated = [c for c in columns if c not in keys and c != 'created_time']
+            counts.updated = await self._execute(connection,
+                    f'UPDATE {table} t SET ({", ".join(map(_q, updated))}) = ROW({", ".join(f"s.{_q(c)}" for c in updated)}) '
+                    f'FROM {staging} s WHERE {same} AND t.updated_time < s.updated_time')
+    
+    async def _fix_deferred(self, connection: AsyncConnection, merge: _Merge) -> None:
+        # only preferred_plugin_id for now, plugins reference their source
+        for column in merge.deferred:
+            c = _q(column)
+            parent = merge.table.c[column].foreign_keys.copy().pop().column.table.name
+            await connection.exec_driver_sql(
+                    f'UPDATE {_q(merge.name)} t SET {c} = coalesce(mp.new_id, s.{c}) '
+                    f'FROM {_q("import_" + merge.name)} s '
+                    f'JOIN {_q("import_map_" + merge.name)} m ON m.old_id = s.id '
+                    f'LEFT JOIN {_q("import_map_" + parent)} mp ON mp.old_id = s.{c} '
+                    f'WHERE t.id = m.new_id AND t.{c} IS NULL AND s.{c} IS NOT NULL '
+                    f'AND EXISTS (SELECT 1 FROM {_q(parent)} p WHERE p.id = coalesce(mp.new_id, s.{c}))')
+    
+    async def run(self, inp: IO[bytes], manifest: Optional[str] = None) -> dict[str, TableImport]:
+        """
+        Imports the archive read from inp and returns what was done to each table.
+        If manifest is set, the old and new ids of the files that were given new ids
+        are written to it as csv.
+        """
+        
+        async with self.session.engine.connect() as connection:
+            raw = await connection.get_raw_connection()
+            driver = raw.driver_connection
+            
+            async with connection.begin():
+                # the tag links would otherwise bump the updated_time of every merged post
+                await connection.exec_driver_sql("SET LOCAL hoordu.keep_updated_time = 'on'")
+                
+                started = time.monotonic()
+                counts = await self._stage(connection, driver, inp)
+                self.log.info('loaded %s rows in %.1fs', sum(c.loaded for c in counts.values()), time.monotonic() - started)
+                
+                for table, keys in ARCHIVE_TABLES:
+                    started = time.monotonic()
+                    merge = _MERGES[table.name]
+                    await self._remap(connection, merge, counts[table.name])
+                    
+                    if merge.serial:
+                        await self._merge_serial(connection, merge, counts[table.name])
+                        
+                    else:
+                        await self._merge_link(connection, merge, keys, counts[table.name])
+                    
+                    self.log.info('merged %s in %.1fs', table.name, time.monotonic() - started)
+                
+                for merge in _MERGES.values():
+                    await self._fix_deferred(connection, merge)
+                
+                if manifest is not None:
+                    await driver.copy_from_query(
+                            'SELECT old_id, new_id FROM import_map_file WHERE old_id <> new_id ORDER BY old_id',
+                            output=manifest, format='csv')
+        
+        # the bulk statements skip the stats updates in RemotePost.add_tag
+        await reconcile_tag_stats(self.session)
+        
+        # every table was merged in bulk, anything cached from them is stale
+        await self.session.hoordu.cache.invalidate(set().union(*(table_tags(table, any_row=True) for table, _ in ARCHIVE_TABLES)))
+        
+        return counts
@@ -0,0 +1,31 @@
+from typing import Any
+
+from .base import *
+from .memory import *
+from .result import *
+
+def create_cache(settings: Any) -> ResultCache:
+    """
+    Creates the result cache from the `cache` setting, nothing is cached if it isn't set.
+    """
+    
+    options = dict(settings.get('cache') or {})
+    if not options:
+        return ResultCache()
+    
+    backend = options.pop('backend', 'memory')
+    size = options.pop('size', 1024)
+    ttl = options.get('ttl')
+    
+    local = LRUCache(size, ttl) if size else None
+    
+    if backend == 'memory':
+        return ResultCache(local)
+        
+    elif backend == 'redis':
+        # optional dependency
+        from .redis import RedisCache
+        return ResultCache(local, RedisCache(**options))
+        
+    else:
+        raise ValueError(f'unknown cache backend: {backend}')
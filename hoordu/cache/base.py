@@ -0,0 +1,43 @@
+import abc
+from dataclasses import dataclass
+from collections.abc import Iterable
+from typing import Any, Optional
+
+__all__ = [
+    'CacheEntry',
+    'CacheBackend',
+]
+
+
+@dataclass
+class CacheEntry:
+    # the version of every tag the value depends on, at the time it was loaded
+    versions: dict[str, int]
+    value: Any
+
+
+class CacheBackend:
+    """
+    Stores values under string keys, entries are tagged by the entities they depend on.
+    Invalidating a tag bumps its version, entries that were stored with an older
+    version of any of their tags are considered stale.
+    """
+    
+    @abc.abstractmethod
+    async def versions(self, tags: list[str]) -> dict[str, int]:
+        """
+        Returns the current version of every tag.
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        pass
+    
+    @abc.abstractmethod
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        pass
+    
+    @abc.abstractmethod
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        pass
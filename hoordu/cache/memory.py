@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Optional
+
+from .base import *
+
+__all__ = [
+    'LRUCache'
+]
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process cache, holds up to size entries and evicts the least recently used.
+    
+    Only the versions of the last max_tags invalidated tags are kept. Versions come
+    from a single counter, and tags that were evicted (or never invalidated) are at
+    the newest version evicted so far, so an entry can never see a tag go back to
+    the version it was stored with, at worst it's reloaded early.
+    """
+    
+    def __init__(self, size: int = 1024, ttl: Optional[float] = None, max_tags: Optional[int] = None):
+        self.size: int = size
+        self.ttl: Optional[float] = ttl
+        self.max_tags: int = max_tags or size * 16
+        
+        self._entries: OrderedDict[str, tuple[float, CacheEntry]] = OrderedDict()
+        self._versions: OrderedDict[str, int] = OrderedDict()
+        self._clock: int = 0
+        self._evicted: int = 0
+    
+    async def versions(self, tags: list[str]) -> dict[str, int]:
+        return {tag: self._versions.get(tag, self._evicted) for tag in tags}
+    
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        
+        expires, entry = item
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return entry
+    
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl else float('inf')
+        self._entries[key] = (expires, entry)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+    
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        # stale entries are dropped when they're read or evicted
+        for tag in tags:
+            self._clock += 1
+            self._versions[tag] = self._clock
+            self._versions.move_to_end(tag)
+        
+        while len(self._versions) > self.max_tags:
+            _, version = self._versions.popitem(last=False)
+            self._evicted = max(self._evicted, version)
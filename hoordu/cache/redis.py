@@ -0,0 +1,58 @@
+import pickle
+from collections.abc import Iterable
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from .base import *
+
+__all__ = [
+    'RedisCache'
+]
+
+
+class RedisCache(CacheBackend):
+    """
+    Shared cache (redis, valkey or anything that speaks the protocol), so every
+    process sees the same entries and invalidations.
+    Tag versions are counters that never expire, entries expire after ttl seconds.
+    """
+    
+    def __init__(self,
+        url: str = 'redis://localhost:6379',
+        ttl: Optional[int] = 3600,
+        prefix: str = 'hoordu:'
+    ):
+        self.ttl: Optional[int] = ttl
+        self.prefix: str = prefix
+        
+        self._redis = aioredis.from_url(url)
+    
+    def _tag(self, tag: str) -> str:
+        return f'{self.prefix}tag:{tag}'
+    
+    async def versions(self, tags: list[str]) -> dict[str, int]:
+        if not tags:
+            return {}
+        
+        values = await self._redis.mget([self._tag(tag) for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+    
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        data = await self._redis.get(self.prefix + key)
+        if data is None:
+            return None
+        
+        return pickle.loads(data)
+    
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        await self._redis.set(self.prefix + key, pickle.dumps(entry), ex=self.ttl)
+    
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        if not tags:
+            return
+        
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(self._tag(tag))
+            await pipe.execute()
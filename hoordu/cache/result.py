@@ -0,0 +1,185 @@
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any, Optional, TypeVar
+
+from sqlalchemy import Table, inspect
+from sqlalchemy.orm.base import NEVER_SET, NO_VALUE
+
+from .base import *
+from .memory import LRUCache
+
+__all__ = [
+    'ResultCache',
+    'entity_tags',
+    'table_tags',
+]
+
+
+T = TypeVar('T')
+
+
+def _row_tags(table: Table, values: dict[str, Any]) -> set[str]:
+    tags = {f'table:{table.name}'}
+    
+    for column in table.columns:
+        value = values.get(column.key)
+        if value is None:
+            continue
+        
+        if column.primary_key and len(table.primary_key.columns) == 1:
+            tags.add(f'{table.name}:{value}')
+        
+        # changes to a row also affect whatever it belongs to (a file's post, a post's source, etc)
+        for fk in column.foreign_keys:
+            tags.add(f'{fk.column.table.name}:{value}')
+    
+    return tags
+
+def entity_tags(obj: Any) -> set[str]:
+    """
+    Returns the tags of an orm instance: `table:<table>`, `<table>:<id>`
+    and `<table>:<id>` for every row it references.
+    Only the loaded state is used, so expired, deferred or deleted
+    attributes are never loaded from the database.
+    """
+    
+    state = inspect(obj)
+    mapper = state.mapper
+    table = mapper.local_table
+    
+    tags = set()
+    values = {}
+    if state.identity is not None and len(state.identity) == 1:
+        values[table.primary_key.columns[0].key] = state.identity[0]
+    
+    # the previous values of changed attributes, a file moved to another post changes both posts
+    previous = {}
+    for attr in mapper.column_attrs:
+        for column in attr.columns:
+            if column.table is not table or not (column.primary_key or column.foreign_keys):
+                continue
+            
+            if attr.key in state.dict:
+                value = state.dict[attr.key]
+                if value is not None:
+                    values[column.key] = value
+                    
+            elif state.key is not None:
+                # expired or never loaded, any row it could reference
+                tags.update(f'{fk.column.table.name}:*' for fk in column.foreign_keys)
+            
+            value = state.committed_state.get(attr.key, NO_VALUE)
+            if value is not None and value is not NO_VALUE and value is not NEVER_SET:
+                previous[column.key] = value
+    
+    return tags | _row_tags(table, values) | _row_tags(table, previous)
+
+def table_tags(table: Table, params: Optional[dict[str, Any]] = None, any_row: bool = False) -> set[str]:
+    """
+    Same as entity_tags for insert, update and delete statements.
+    any_row also adds `<table>:*`, which every entry tagged with a row of the table
+    depends on, for statements that can change rows without knowing their ids.
+    """
+    
+    tags = _row_tags(table, params or {})
+    if any_row:
+        tags.add(f'{table.name}:*')
+    
+    return tags
+
+def _with_any_row(tags: Iterable[str]) -> list[str]:
+    # `<table>:<id>` also depends on `<table>:*`
+    result = dict.fromkeys(tags)
+    for tag in list(result):
+        table, _, _ = tag.partition(':')
+        if table != 'table':
+            result[f'{table}:*'] = None
+    
+    return list(result)
+
+
+class ResultCache:
+    """
+    Caches the results of read queries.
+    Values are kept in an in-process LRU, and optionally in a shared backend
+    that also owns the tag versions so invalidations reach every process.
+    Cached values are shared between callers, they must not be modified.
+    Orm instances have to be loaded in HoorduSession.cache_session and merged into
+    the session that uses them with HoorduSession.merge_cached.
+    """
+    
+    def __init__(self,
+        local: Optional[LRUCache] = None,
+        shared: Optional[CacheBackend] = None
+    ):
+        self.local: Optional[LRUCache] = local
+        self.shared: Optional[CacheBackend] = shared
+    
+    @property
+    def enabled(self) -> bool:
+        return self.local is not None or self.shared is not None
+    
+    @property
+    def _authority(self) -> CacheBackend:
+        return self.shared if self.shared is not None else self.local
+    
+    async def _get(self, key: str) -> Optional[CacheEntry]:
+        authority = self._authority
+        
+        if self.local is not None:
+            entry = await self.local.get(key)
+            if entry is not None and await authority.versions(list(entry.versions)) == entry.versions:
+                return entry
+        
+        # another process may have already reloaded it
+        if self.shared is not None:
+            entry = await self.shared.get(key)
+            if entry is not None and await authority.versions(list(entry.versions)) == entry.versions:
+                if self.local is not None:
+                    await self.local.set(key, entry)
+                
+                return entry
+        
+        return None
+    
+    async def get_or_load(self,
+        key: str,
+        tags: Iterable[str],
+        loader: Callable[[], Awaitable[T]],
+        result_tags: Optional[Callable[[T], Iterable[str]]] = None
+    ) -> T:
+        """
+        Returns the cached value for key if none of its tags were invalidated since it
+        was loaded, otherwise calls loader and caches the result.
+        result_tags can add tags that are only known after loading (e.g.: the ids of the results).
+        """
+        
+        if not self.enabled:
+            return await loader()
+        
+        entry = await self._get(key)
+        if entry is not None:
+            return entry.value
+        
+        # the versions are read before loading, so a write that happens
+        # while loading leaves the new entry already stale
+        authority = self._authority
+        versions = await authority.versions(_with_any_row(tags))
+        value = await loader()
+        
+        if result_tags is not None:
+            extra = [tag for tag in _with_any_row(result_tags(value)) if tag not in versions]
+            versions.update(await authority.versions(extra))
+        
+        entry = CacheEntry(versions, value)
+        if self.local is not None:
+            await self.local.set(key, entry)
+        if self.shared is not None:
+            await self.shared.set(key, entry)
+        
+        return value
+    
+    async def invalidate(self, tags: set[str]) -> None:
+        if not self.enabled or not tags:
+            return
+        
+        await self._authority.invalidate(tags)
@@ -7,6 +7,25 @@ import importlib
 import importlib.util
 import importlib.machinery
 
+# optional, decodes several times faster than the json module
+try:
+    import orjson
+    
+except ImportError:
+    orjson = None
+
+# orjson silently decodes integers outside of the 64 bit range as floats,
+# anything that could be one is left to the json module
+# digits are translated to 0 and anything but - to a space, so they can be found
+# with a substring search, which is much faster than a regex
+# (this also matches long numbers inside strings, which only costs some speed)
+_DIGITS = bytes(48 if 48 <= c <= 57 else c if c == 45 else 32 for c in range(256))
+_BIG_INTS = (b'0' * 20, b'-' + b'0' * 19)
+
+def _may_have_big_ints(data: bytes) -> bool:
+    digits = data.translate(_DIGITS)
+    return any(big_int in digits for big_int in _BIG_INTS)
+
 class GenericEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, set):
@@ -14,19 +33,75 @@ class GenericEncoder(json.JSONEncoder):
         
         return super().default(o)
 
+def _wrap(cls: type, val: Any) -> Any:
+    # only wraps one level, nested objects are wrapped when they're accessed
+    if type(val) is dict:
+        return cls(val)
+    
+    if type(val) is list:
+        for i, item in enumerate(val):
+            if type(item) is dict or type(item) is list:
+                val[i] = _wrap(cls, item)
+    
+    return val
+
 class Dynamic(dict):
+    """
+    A dict whose keys can also be accessed as attributes.
+    Nested objects are wrapped the first time they are accessed and kept wrapped,
+    so the json decoded by orjson only wraps the parts that are used.
+    """
+    
+    __slots__ = ()
+    
+    def __getitem__(self, key: Any) -> Any:
+        val = dict.__getitem__(self, key)
+        if type(val) is dict or type(val) is list:
+            val = _wrap(type(self), val)
+            dict.__setitem__(self, key, val)
+        
+        return val
+    
     def __getattr__(self, name: str) -> Any:
-        if name in self:
-            val = self[name]
-            if isinstance(val, dict):
-                val = Dynamic(val)
-            return val
-        else:
-            raise AttributeError
+        try:
+            return self[name]
+            
+        except KeyError:
+            raise AttributeError(name) from None
     
     def __setattr__(self, name: str, value: Any):
         self[name] = value
     
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self[key] if key in self else default
+    
+    def pop(self, key: Any, *default: Any) -> Any:
+        return _wrap(type(self), dict.pop(self, key, *default))
+    
+    def popitem(self) -> tuple[Any, Any]:
+        key, val = dict.popitem(self)
+        return key, _wrap(type(self), val)
+    
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        
+        return self[key]
+    
+    def _wrap_values(self) -> None:
+        cls = type(self)
+        for key, val in dict.items(self):
+            if type(val) is dict or type(val) is list:
+                dict.__setitem__(self, key, _wrap(cls, val))
+    
+    def values(self):
+        self._wrap_values()
+        return dict.values(self)
+    
+    def items(self):
+        self._wrap_values()
+        return dict.items(self)
+    
     def contains(self, *keys: str) -> bool:
         return all(self.get(key) is not None for key in keys)
     
@@ -67,12 +142,22 @@ class Dynamic(dict):
         if json_string is None:
             return cls()
         
+        if orjson is not None:
+            data = json_string if isinstance(json_string, bytes) else json_string.encode('utf-8', 'surrogatepass')
+            if not _may_have_big_ints(data):
+                try:
+                    return _wrap(cls, orjson.loads(data))
+                    
+                except orjson.JSONDecodeError:
+                    # e.g.: NaN, which the json module accepts
+                    pass
+        
         return json.loads(json_string, object_hook=cls)
     
     @classmethod
     def from_file(cls, filename: str | os.PathLike) -> Any:
-        with open(filename) as json_file:
-            s = json.load(json_file, object_hook=cls)
+        with open(filename, 'rb') as json_file:
+            s = cls.from_json(json_file.read())
         
         if not isinstance(s, cls):
             raise ValueError('json file is not an object')
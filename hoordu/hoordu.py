@@ -1,4 +1,5 @@
 from typing import Type
+from collections.abc import Callable
 
 from . import models
 from .models import *
@@ -9,6 +10,10 @@ from .plugins import *
 from .forms import *
 from .logging import *
 from .plugins.filesystem import Filesystem
+from .thumbnailers.variants import ThumbnailVariant
+from .storage import StorageBackend, create_storage
+from .cache import ResultCache, create_cache
+from .http import HttpPool
 from . import _version
 
 import packaging.version
@@ -37,12 +42,21 @@ class hoordu:
         configure_logger('hoordu', self.settings.get('log_file'))
         self.log: logging.Logger = logging.getLogger('hoordu.hoordu')
         
+        # shared by every session, so it has to exist before them
+        self.cache: ResultCache = create_cache(self.settings)
+        # connections are shared by every plugin in every session
+        self.http: HttpPool = HttpPool(self.settings)
+        
         self._session: HoorduSession = HoorduSession(self)
         
         self._plugins: dict[str, Type[PluginBase]] = dict()
         
-        self.filespath: str = '{}/files'.format(self.settings.base_path)
-        self.thumbspath: str = '{}/thumbs'.format(self.settings.base_path)
+        self.storage: StorageBackend = create_storage(self.settings)
+        
+        # every level is a divisor of the file id, e.g.: [1_000_000, 1_000] -> files/<id // 1e6>/<id // 1e3>/
+        self.bucket_levels: list[int] = list(self.settings.get('files_bucket_levels') or [self.settings.files_bucket_size])
+        # layouts that files may still be stored in while they are being migrated
+        self.previous_bucket_levels: list[list[int]] = [list(levels) for levels in self.settings.get('files_previous_bucket_levels', [])]
         
         self._plugins[Filesystem.id] = Filesystem
         
@@ -62,23 +76,77 @@ class hoordu:
         
         await engine.dispose()
     
-    def _file_bucket(self, file: File) -> int:
-        return file.id // self.settings.files_bucket_size
+    def _file_bucket(self, file: File, levels: Optional[list[int]] = None) -> str:
+        if levels is None:
+            levels = self.bucket_levels
+        
+        return '/'.join(str(file.id // level) for level in levels)
     
-    def get_file_paths(self, file: File) -> tuple[str, str]:
-        file_bucket = self._file_bucket(file)
+    def get_file_keys(self, file: File, levels: Optional[list[int]] = None) -> tuple[str, str]:
+        file_bucket = self._file_bucket(file, levels)
         
         if file.ext:
-            filepath = '{}/{}/{}.{}'.format(self.filespath, file_bucket, file.id, file.ext)
+            filekey = 'files/{}/{}.{}'.format(file_bucket, file.id, file.ext)
         else:
-            filepath = '{}/{}/{}'.format(self.filespath, file_bucket, file.id)
+            filekey = 'files/{}/{}'.format(file_bucket, file.id)
         
         if file.thumb_ext:
-            thumbpath = '{}/{}/{}.{}'.format(self.thumbspath, file_bucket, file.id, file.thumb_ext)
+            thumbkey = 'thumbs/{}/{}.{}'.format(file_bucket, file.id, file.thumb_ext)
         else:
-            thumbpath = '{}/{}/{}'.format(self.thumbspath, file_bucket, file.id)
+            thumbkey = 'thumbs/{}/{}'.format(file_bucket, file.id)
+        
+        return filekey, thumbkey
+    
+    def get_variant_key(self, file: File, variant: ThumbnailVariant, levels: Optional[list[int]] = None) -> str:
+        # variants live next to the default thumbnail
+        _, thumbkey = self.get_file_keys(file, levels)
+        thumbkey = thumbkey.rsplit('/', 1)[0]
         
-        return filepath, thumbpath
+        return '{}/{}_{}.{}'.format(thumbkey, file.id, variant.name, variant.ext)
+    
+    async def find_file_keys(self, file: File) -> tuple[str, str]:
+        """
+        Same as get_file_keys, but falls back to the previous layouts
+        for files that haven't been migrated yet.
+        """
+        
+        filekey, thumbkey = self.get_file_keys(file)
+        if not self.previous_bucket_levels:
+            return filekey, thumbkey
+        
+        return (
+            await self._find_key(filekey, lambda levels: self.get_file_keys(file, levels)[0]),
+            await self._find_key(thumbkey, lambda levels: self.get_file_keys(file, levels)[1])
+        )
+    
+    async def find_variant_key(self, file: File, variant: ThumbnailVariant) -> str:
+        """
+        Same as get_variant_key, but falls back to the previous layouts.
+        """
+        
+        key = self.get_variant_key(file, variant)
+        if not self.previous_bucket_levels:
+            return key
+        
+        return await self._find_key(key, lambda levels: self.get_variant_key(file, variant, levels))
+    
+    async def _find_key(self, key: str, previous_key: Callable[[list[int]], str]) -> str:
+        if await self.storage.stat(key) is not None:
+            return key
+        
+        for levels in self.previous_bucket_levels:
+            old_key = previous_key(levels)
+            if await self.storage.stat(old_key) is not None:
+                return old_key
+        
+        return key
+    
+    def get_file_paths(self, file: File) -> tuple[str, str]:
+        filekey, thumbkey = self.get_file_keys(file)
+        return self.storage.path(filekey), self.storage.path(thumbkey)
+    
+    def get_variant_path(self, file: File, variant: ThumbnailVariant) -> str:
+        return self.storage.path(self.get_variant_key(file, variant))
     
     async def _create_plugin(self,
         plugin_class: Type[PluginBase],
@@ -189,3 +257,14 @@ class hoordu:
     
     def session(self) -> HoorduSession:
         return HoorduSession(self)
+    
+    async def close(self) -> None:
+        await self.http.close()
+        await self.storage.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
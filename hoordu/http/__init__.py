@@ -1,2 +1,6 @@
 from .rfc6266 import safe_filename as safe_rfc6266_filename
 from .download import save_response
+from .pool import HttpPool
+from .cache import HttpCache, CachingClient, CachedResponse
+from .limit import ConcurrencyMiddleware
+from .retry import RetryBudget, RetryStats, RetryMiddleware
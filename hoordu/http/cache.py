@@ -0,0 +1,260 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import aiohttp
+import yarl
+from aiohttp.helpers import parse_mimetype
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from ..util import wrap_async
+
+__all__ = [
+    'HttpCache',
+    'CachedResponse',
+    'CachingClient',
+]
+
+
+# the only headers kept with cached bodies
+_KEPT_HEADERS = ('content-type', 'etag', 'last-modified')
+
+# request headers that identify the account a response was requested for
+_CREDENTIAL_HEADERS = ('authorization', 'cookie')
+
+@dataclass
+class _Entry:
+    url: str
+    stored_time: float
+    headers: list[tuple[str, str]]
+    body: bytes = field(repr=False)
+    
+    @property
+    def etag(self) -> Optional[str]:
+        return next((v for k, v in self.headers if k.lower() == 'etag'), None)
+    
+    @property
+    def last_modified(self) -> Optional[str]:
+        return next((v for k, v in self.headers if k.lower() == 'last-modified'), None)
+
+
+class HttpCache:
+    """
+    Response bodies and their validators stored on disk, evicting the least
+    recently used ones when they take more than max_size bytes.
+    """
+    
+    def __init__(self, path: str, max_size: int):
+        self.path: str = path
+        self.max_size: int = max_size
+        
+        # file name -> size, least recently used first
+        self._index: Optional[OrderedDict[str, int]] = None
+        self._size: int = 0
+        # reads and writes run in the default executor
+        self._lock: threading.Lock = threading.Lock()
+    
+    def _load_index(self) -> OrderedDict[str, int]:
+        if self._index is None:
+            os.makedirs(self.path, exist_ok=True)
+            entries = []
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+            
+            entries.sort()
+            self._index = OrderedDict((name, size) for _, name, size in entries)
+            self._size = sum(self._index.values())
+        
+        return self._index
+    
+    def _read(self, name: str) -> Optional[_Entry]:
+        index = self._load_index()
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+            
+            # recently used, also across restarts
+            os.utime(path)
+            
+        except (FileNotFoundError, ValueError):
+            self._size -= index.pop(name, 0)
+            return None
+        
+        index.move_to_end(name)
+        return _Entry(meta['url'], meta['stored_time'], [tuple(h) for h in meta['headers']], body)
+    
+    def _write(self, name: str, entry: _Entry) -> None:
+        index = self._load_index()
+        path = os.path.join(self.path, name)
+        meta = json.dumps({'url': entry.url, 'stored_time': entry.stored_time, 'headers': entry.headers}).encode()
+        
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(meta + b'\n')
+            f.write(entry.body)
+        
+        os.replace(tmp, path)
+        
+        size = len(meta) + 1 + len(entry.body)
+        self._size += size - index.pop(name, 0)
+        index[name] = size
+        
+        while self._size > self.max_size and len(index) > 1:
+            evicted, evicted_size = index.popitem(last=False)
+            self._size -= evicted_size
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(os.path.join(self.path, evicted))
+    
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    def _get_sync(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            return self._read(self._name(key))
+    
+    def _set_sync(self, key: str, entry: _Entry) -> None:
+        with self._lock:
+            self._write(self._name(key), entry)
+    
+    get = wrap_async(_get_sync)
+    set = wrap_async(_set_sync)
+
+
+class CachedResponse:
+    """
+    A response that was already read, either from the network or from the cache.
+    Only the parts of aiohttp.ClientResponse plugins use are available.
+    """
+    
+    def __init__(self,
+        url: str,
+        status: int,
+        reason: Optional[str],
+        headers: Mapping[str, str],
+        body: bytes,
+        from_cache: bool = False,
+        request_info: Optional[aiohttp.RequestInfo] = None
+    ):
+        self.url: yarl.URL = yarl.URL(url)
+        self.status: int = status
+        self.reason: Optional[str] = reason
+        self.headers: CIMultiDictProxy[str] = CIMultiDictProxy(CIMultiDict(headers))
+        self.body: bytes = body
+        self.from_cache: bool = from_cache
+        self.request_info: Optional[aiohttp.RequestInfo] = request_info
+    
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+    
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise aiohttp.ClientResponseError(
+                self.request_info, (),
+                status=self.status,
+                message=self.reason or '',
+                headers=self.headers
+            )
+    
+    @property
+    def charset(self) -> Optional[str]:
+        content_type = self.headers.get('Content-Type')
+        if content_type is None:
+            return None
+        
+        return parse_mimetype(content_type).parameters.get('charset')
+    
+    async def read(self) -> bytes:
+        return self.body
+    
+    async def text(self, encoding: Optional[str] = None, errors: str = 'strict') -> str:
+        return self.body.decode(encoding or self.charset or 'utf-8', errors)
+    
+    async def json(self, **kwargs) -> Any:
+        return json.loads(self.body, **kwargs)
+
+
+class CachingClient:
+    """
+    Makes GET requests through a plugin's client, but caches the responses:
+    - responses with an ETag or a Last-Modified are revalidated with a conditional
+      request and the cached body is used when the server returns 304
+    - with a ttl, cached responses are used without any request until they expire
+      (for endpoints without validators)
+    Responses are cached by url (including params) and by the credentials they were
+    requested with (the Authorization and Cookie headers and the cookies the client
+    sends to that url), separately for every plugin.
+    Nothing is cached if the cache isn't enabled.
+    """
+    
+    def __init__(self, http: aiohttp.ClientSession, cache: Optional[HttpCache], namespace: str):
+        self.http: aiohttp.ClientSession = http
+        self.cache: Optional[HttpCache] = cache
+        self.namespace: str = namespace
+    
+    def _credentials(self, url: yarl.URL, headers: Mapping[str, str]) -> str:
+        # authenticated endpoints return something else for every account
+        # only a hash of the credentials ends up in the key
+        merged = CIMultiDict(self.http.headers)
+        merged.update(headers)
+        parts = [f'{k.lower()}:{v}' for k, v in merged.items() if k.lower() in _CREDENTIAL_HEADERS]
+        parts.extend(f'cookie:{name}={morsel.value}' for name, morsel in self.http.cookie_jar.filter_cookies(url).items())
+        if not parts:
+            return ''
+        
+        return hashlib.sha256('\n'.join(sorted(parts)).encode()).hexdigest()
+    
+    @contextlib.asynccontextmanager
+    async def get(self,
+        url: str,
+        *,
+        params: Optional[Mapping[str, Any]] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        ttl: Optional[float] = None,
+        **kwargs
+    ) -> AsyncIterator[CachedResponse]:
+        full_url = yarl.URL(url).update_query(params) if params else yarl.URL(url)
+        key = f'{self.namespace}:{self._credentials(full_url, headers or {})}:{full_url}'
+        
+        entry = await self.cache.get(key) if self.cache is not None else None
+        if entry is not None and ttl is not None and time.time() - entry.stored_time < ttl:
+            yield CachedResponse(entry.url, 200, 'OK', entry.headers, entry.body, from_cache=True)
+            return
+        
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.etag is not None:
+                request_headers['If-None-Match'] = entry.etag
+            if entry.last_modified is not None:
+                request_headers['If-Modified-Since'] = entry.last_modified
+        
+        async with self.http.get(url, params=params, headers=request_headers, **kwargs) as resp:
+            if resp.status == 304 and entry is not None:
+                entry.stored_time = time.time()
+                await self.cache.set(key, entry)
+                response = CachedResponse(entry.url, 200, 'OK', entry.headers, entry.body, from_cache=True)
+                
+            else:
+                body = await resp.read()
+                response = CachedResponse(str(resp.url), resp.status, resp.reason, resp.headers, body, request_info=resp.request_info)
+                
+                cacheable = resp.status == 200 and 'no-store' not in resp.headers.get('Cache-Control', '')
+                has_validators = 'ETag' in resp.headers or 'Last-Modified' in resp.headers
+                if self.cache is not None and cacheable and (has_validators or ttl is not None):
+                    kept = [(k, v) for k, v in resp.headers.items() if k.lower() in _KEPT_HEADERS]
+                    await self.cache.set(key, _Entry(str(resp.url), time.time(), kept, body))
+        
+        yield response
@@ -0,0 +1,27 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+
+import aiohttp
+
+__all__ = [
+    'ConcurrencyMiddleware',
+]
+
+
+class ConcurrencyMiddleware:
+    """
+    aiohttp client middleware that limits the requests in flight, the semaphore
+    is shared by every client of the same source so plugins that request things
+    concurrently (and the download lookahead) can't flood a site.
+    A request counts until its response headers arrive, retries included.
+    """
+    
+    def __init__(self, semaphore: asyncio.Semaphore):
+        self.semaphore: asyncio.Semaphore = semaphore
+    
+    async def __call__(self,
+        request: aiohttp.ClientRequest,
+        handler: Callable[[aiohttp.ClientRequest], Awaitable[aiohttp.ClientResponse]]
+    ) -> aiohttp.ClientResponse:
+        async with self.semaphore:
+            return await handler(request)
@@ -0,0 +1,141 @@
+import asyncio
+import os
+from collections.abc import Mapping
+from typing import Any, Optional
+
+import aiohttp
+
+from .cache import HttpCache
+from .limit import ConcurrencyMiddleware
+from .retry import RetryBudget, RetryStats, RetryMiddleware
+
+__all__ = [
+    'HttpPool',
+]
+
+
+class HttpPool:
+    """
+    The connection pool shared by every plugin in the process, so connections,
+    tls sessions and dns lookups are reused across sessions and plugins
+    (e.g.: pixiv and fanbox both download from i.pximg.net).
+    Every client gets its own cookie jar and headers, and retries transient
+    errors with a retry budget shared by every client of the same source.
+    
+    Configured by the `http` setting:
+    limit, limit_per_host: maximum number of connections (0 is unlimited)
+    limit_per_source: maximum number of requests in flight for every source (0 is unlimited)
+    dns_ttl: seconds dns lookups are cached for
+    keepalive: seconds idle connections are kept open for
+    timeout, connect_timeout, read_timeout: seconds for a whole request,
+    to connect and between reads
+    retries: attempts per request (1 disables retries)
+    retry_backoff, retry_max_backoff: seconds of the first and the longest retry delay
+    retry_ratio, retry_minimum: retries allowed per request made and in a burst, per source
+    
+    The responses plugins request through their CachingClient are cached
+    if the `http_cache` setting is set:
+    path: where responses are stored (defaults to <base_path>/http-cache)
+    size: MB the cached responses can take
+    """
+    
+    def __init__(self, settings: Any):
+        options = dict(settings.get('http') or {})
+        
+        self.limit: int = options.get('limit', 100)
+        self.limit_per_host: int = options.get('limit_per_host', 0)
+        self.limit_per_source: int = options.get('limit_per_source', 4)
+        self._limiters: dict[str, asyncio.Semaphore] = {}
+        self.dns_ttl: Optional[int] = options.get('dns_ttl', 300)
+        self.keepalive: float = options.get('keepalive', 30)
+        
+        connect_timeout = options.get('connect_timeout', 30)
+        read_timeout = options.get('read_timeout', 120)
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(
+            total=options.get('timeout', 300),
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        # file downloads can take as long as they need, as long as data keeps coming
+        self.download_timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        
+        self.retries: int = options.get('retries', 4)
+        self.retry_backoff: float = options.get('retry_backoff', 1)
+        self.retry_max_backoff: float = options.get('retry_max_backoff', 60)
+        self.retry_ratio: float = options.get('retry_ratio', 0.2)
+        self.retry_minimum: int = options.get('retry_minimum', 10)
+        self._budgets: dict[str, RetryBudget] = {}
+        # retry metrics by source
+        self.retry_stats: dict[str, RetryStats] = {}
+        
+        cache_options = settings.get('http_cache')
+        self.cache: Optional[HttpCache] = None
+        if cache_options:
+            self.cache = HttpCache(
+                cache_options.get('path') or os.path.join(settings.base_path, 'http-cache'),
+                int(cache_options.get('size', 256) * (1 << 20))
+            )
+        
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        # connectors are bound to the loop they were created in
+        loop = asyncio.get_running_loop()
+        if self._connector is None or self._connector.closed or self._loop is not loop:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive
+            )
+            # and so are the semaphores
+            self._limiters = {}
+            self._loop = loop
+        
+        return self._connector
+    
+    def client(self, headers: Optional[Mapping[str, str]] = None, source: Optional[str] = None) -> aiohttp.ClientSession:
+        """
+        Returns a client that uses the shared pool, closing it leaves the pool open.
+        Retries count towards the budget of source, and requests towards its limit.
+        """
+        
+        # before the limiters, it resets them for a new loop
+        connector = self.connector
+        
+        middlewares = []
+        if self.limit_per_source > 0:
+            limiter = self._limiters.get(source)
+            if limiter is None:
+                limiter = self._limiters[source] = asyncio.Semaphore(self.limit_per_source)
+            
+            middlewares.append(ConcurrencyMiddleware(limiter))
+        
+        if self.retries > 1:
+            budget = self._budgets.get(source)
+            if budget is None:
+                budget = self._budgets[source] = RetryBudget(self.retry_ratio, self.retry_minimum)
+            
+            stats = self.retry_stats.setdefault(source, RetryStats())
+            middlewares.append(RetryMiddleware(budget, stats, self.retries, self.retry_backoff, self.retry_max_backoff))
+        
+        return aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=False,
+            cookie_jar=aiohttp.CookieJar(),
+            headers=headers,
+            timeout=self.timeout,
+            middlewares=tuple(middlewares)
+        )
+    
+    async def close(self) -> None:
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+            self._loop = None
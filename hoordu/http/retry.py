@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import random
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import aiohttp
+
+__all__ = [
+    'RetryBudget',
+    'RetryStats',
+    'RetryMiddleware',
+]
+
+
+# methods that can be sent again without side effects
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'})
+
+# status -> whether non idempotent requests are retried too
+# (429 and 503 mean the request wasn't processed)
+STATUS_POLICIES: dict[int, bool] = {
+    429: True,
+    500: False,
+    502: False,
+    503: True,
+    504: False,
+}
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of the requests made, so a source that is down
+    doesn't get every request multiplied by the number of attempts.
+    Every request adds `ratio` tokens and every retry takes one, up to `minimum`
+    tokens can be saved up for bursts.
+    """
+    
+    def __init__(self, ratio: float = 0.2, minimum: int = 10):
+        self.ratio: float = ratio
+        self.minimum: int = minimum
+        self._tokens: float = minimum
+    
+    def deposit(self) -> None:
+        self._tokens = min(self._tokens + self.ratio, self.minimum)
+    
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        
+        self._tokens -= 1
+        return True
+
+
+@dataclass
+class RetryStats:
+    requests: int = 0
+    retries: int = 0
+    # retries by status code or exception
+    reasons: Counter = field(default_factory=Counter)
+    # requests that failed after every attempt
+    exhausted: int = 0
+    # retries that were skipped because the budget ran out
+    over_budget: int = 0
+    
+    def summary(self) -> str:
+        reasons = ', '.join(f'{reason}: {count}' for reason, count in self.reasons.most_common())
+        return f'{self.requests} requests, {self.retries} retries ({reasons}), {self.exhausted} failed, {self.over_budget} over budget'
+
+
+class RetryMiddleware:
+    """
+    aiohttp client middleware that retries transient failures (the statuses in
+    STATUS_POLICIES and connection errors) with exponential backoff and full jitter,
+    honoring Retry-After.
+    Non idempotent requests are only retried when the server couldn't have
+    processed them (429, 503 or a failed connection).
+    """
+    
+    def __init__(self,
+        budget: RetryBudget,
+        stats: RetryStats,
+        attempts: int = 4,
+        backoff: float = 1,
+        max_backoff: float = 60
+    ):
+        self.budget: RetryBudget = budget
+        self.stats: RetryStats = stats
+        self.attempts: int = attempts
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.log: logging.Logger = logging.getLogger('hoordu.http')
+    
+    def _delay(self, attempt: int, response: Optional[aiohttp.ClientResponse] = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                delay = float(retry_after)
+                
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                    
+                except (TypeError, ValueError):
+                    delay = None
+            
+            if delay is not None:
+                return min(max(delay, 0), self.max_backoff)
+        
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    
+    def _can_retry(self, attempt: int, reason: str) -> bool:
+        if attempt + 1 >= self.attempts:
+            self.stats.exhausted += 1
+            return False
+        
+        if not self.budget.withdraw():
+            self.stats.over_budget += 1
+            return False
+        
+        self.stats.retries += 1
+        self.stats.reasons[reason] += 1
+        return True
+    
+    async def __call__(self,
+        request: aiohttp.ClientRequest,
+        handler: Callable[[aiohttp.ClientRequest], Awaitable[aiohttp.ClientResponse]]
+    ) -> aiohttp.ClientResponse:
+        self.stats.requests += 1
+        self.budget.deposit()
+        idempotent = request.method in IDEMPOTENT_METHODS
+        
+        attempt = 0
+        while True:
+            try:
+                response = await handler(request)
+                
+            except aiohttp.ClientConnectorError as e:
+                # never connected, safe for every method
+                if not self._can_retry(attempt, type(e).__name__):
+                    raise
+                
+                delay = self._delay(attempt)
+                
+            except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError, asyncio.TimeoutError) as e:
+                if not idempotent or not self._can_retry(attempt, type(e).__name__):
+                    raise
+                
+                delay = self._delay(attempt)
+                
+            else:
+                retry_any = STATUS_POLICIES.get(response.status)
+                if retry_any is None or not (idempotent or retry_any) or not self._can_retry(attempt, str(response.status)):
+                    return response
+                
+                delay = self._delay(attempt, response)
+                response.release()
+            
+            attempt += 1
+            self.log.warning('retrying %s %s in %.1fs (attempt %s)', request.method, request.url, delay, attempt + 1)
+            await asyncio.sleep(delay)
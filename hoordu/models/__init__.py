@@ -1,3 +1,4 @@
 from .common import *
 from .database import *
-from .extra import *
\ No newline at end of file
+from .extra import *
+from .search import *
\ No newline at end of file
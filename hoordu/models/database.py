@@ -3,8 +3,9 @@ from enum import Enum, IntFlag, auto
 import json
 from typing import Any, Optional
 
-from sqlalchemy import Table, Column, Integer, String, Text, LargeBinary, DateTime, Interval, Numeric, ForeignKey, Index, func, inspect, select, insert
-from sqlalchemy.orm import relationship, ColumnProperty, RelationshipProperty, DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Table, Column, Integer, BigInteger, Computed, String, Text, LargeBinary, DateTime, Interval, Numeric, ForeignKey, Index, DDL, event, func, inspect, select, insert, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert as pg_insert
+from sqlalchemy.orm import relationship, ColumnProperty, RelationshipProperty, DeclarativeBase, Mapped, mapped_column, Session
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.ext.asyncio import async_object_session, AsyncAttrs
 from sqlalchemy.ext.compiler import compiles
@@ -21,10 +22,12 @@ __all__ = [
     
     'Base',
     'Tag',
+    'TagStats',
     'Post',
     'Source',
     'Plugin',
     'RemoteTag',
+    'RemoteTagStats',
     'RemotePost',
     'File',
     'FeedEntry',
@@ -39,6 +42,9 @@ __all__ = [
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
+# trigram indexes for tag autocomplete
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 class MetadataHelper:
     def __init__(self, *args, **kwargs):
         pass
@@ -80,7 +86,9 @@ class FlagProperty:
 
 post_tag = Table('post_tag', Base.metadata,
     Column('post_id', Integer, ForeignKey('post.id', ondelete='CASCADE'), nullable=False, index=True),
-    Column('tag_id', Integer, ForeignKey('tag.id', ondelete='CASCADE'), nullable=False)
+    Column('tag_id', Integer, ForeignKey('tag.id', ondelete='CASCADE'), nullable=False),
+    # covers tag queries, which start from the tag
+    Index('ix_post_tag_tag_id', 'tag_id', 'post_id')
 )
 
 class TagFlags(IntFlag):
@@ -105,6 +113,8 @@ class Tag(Base):
     
     __table_args__ = (
         Index('idx_tags', 'category', 'tag', unique=True),
+        Index('ix_tag_tag_prefix', text('lower(tag) text_pattern_ops')),
+        Index('ix_tag_tag_trgm', 'tag', postgresql_using='gin', postgresql_ops={'tag': 'gin_trgm_ops'}),
     )
     
     def __init__(self, **kwargs):
@@ -115,6 +125,22 @@ class Tag(Base):
     def __str__(self):
         return '{}:{}'.format(self.category.name, self.tag)
 
+# unlike RemoteTagStats, only updated by reconcile_tag_stats (local posts have no add_tag that counts links)
+class TagStats(Base):
+    __tablename__ = 'tag_stats'
+    
+    tag_id: Mapped[int] = mapped_column(Integer, ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+    
+    post_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_used_time: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    
+    # references
+    tag: Mapped[Tag] = relationship('Tag')
+    
+    __table_args__ = (
+        Index('ix_tag_stats_post_count', 'post_count'),
+    )
+
 class PostFlags(IntFlag):
     none = 0
     favorite = auto()
@@ -192,7 +218,9 @@ class Plugin(Base):
 
 remote_post_tag = Table('remote_post_tag', Base.metadata,
     Column('post_id', Integer, ForeignKey('remote_post.id', ondelete='CASCADE'), nullable=False, index=True),
-    Column('tag_id', Integer, ForeignKey('remote_tag.id', ondelete='CASCADE'), nullable=False)
+    Column('tag_id', Integer, ForeignKey('remote_tag.id', ondelete='CASCADE'), nullable=False),
+    # covers tag queries, which start from the tag
+    Index('ix_remote_post_tag_tag_id', 'tag_id', 'post_id')
 )
 
 class RemoteTag(Base, MetadataHelper):
@@ -221,6 +249,8 @@ class RemoteTag(Base, MetadataHelper):
     
     __table_args__ = (
         Index('idx_remote_tags', 'source_id', 'category', 'tag', unique=True),
+        Index('ix_remote_tag_tag_prefix', text('lower(tag) text_pattern_ops')),
+        Index('ix_remote_tag_tag_trgm', 'tag', postgresql_using='gin', postgresql_ops={'tag': 'gin_trgm_ops'}),
     )
     
     def __init__(self, **kwargs):
@@ -231,6 +261,21 @@ class RemoteTag(Base, MetadataHelper):
     def __str__(self):
         return '{}:{}'.format(self.category.name, self.tag)
 
+class RemoteTagStats(Base):
+    __tablename__ = 'remote_tag_stats'
+    
+    tag_id: Mapped[int] = mapped_column(Integer, ForeignKey('remote_tag.id', ondelete='CASCADE'), primary_key=True)
+    
+    post_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_used_time: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    
+    # references
+    tag: Mapped[RemoteTag] = relationship('RemoteTag')
+    
+    __table_args__ = (
+        Index('ix_remote_tag_stats_post_count', 'post_count'),
+    )
+
 class RemotePost(Base, MetadataHelper):
     __tablename__ = 'remote_post'
     
@@ -254,6 +299,9 @@ class RemotePost(Base, MetadataHelper):
     created_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     updated_time: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
+    # title, comment and tags, maintained by triggers (see models/search.py)
+    search_vector: Mapped[Optional[Any]] = mapped_column(TSVECTOR, deferred=True)
+    
     # references
     source: Mapped[Source] = relationship('Source')
     tags: Mapped[list[RemoteTag]] = relationship('RemoteTag', secondary=remote_post_tag)
@@ -268,6 +316,7 @@ class RemotePost(Base, MetadataHelper):
     
     __table_args__ = (
         Index('idx_remote_posts', 'source_id', 'original_id', unique=True),
+        Index('ix_remote_post_search_vector', 'search_vector', postgresql_using='gin'),
     )
     
     def __init__(self, **kwargs):
@@ -278,6 +327,12 @@ class RemotePost(Base, MetadataHelper):
         if 'type' not in kwargs:
             self.type = PostType.set
     
+    def touch(self) -> None:
+        # changes to the rows that link to the post don't update it by themselves,
+        # incremental exports only include the links of updated posts
+        # (tags are handled by the search vector trigger)
+        self.updated_time = datetime.utcnow()
+    
     async def add_tag(self, new_tag: RemoteTag) -> bool:
         if not hasattr(self, '_existing_tags'):
             self._existing_tags = {(t.category, t.tag) for t in await self.awaitable_attrs.tags}
@@ -286,6 +341,12 @@ class RemotePost(Base, MetadataHelper):
         if t not in self._existing_tags:
             self.tags.append(new_tag)
             self._existing_tags.add(t)
+            
+            # counted once the link is flushed, see _flush_tag_counts
+            session = async_object_session(self)
+            if session is not None:
+                session.sync_session.info.setdefault('tag_counts', []).append(new_tag)
+            
             return True
             
         else:
@@ -298,12 +359,41 @@ class RemotePost(Base, MetadataHelper):
         if url not in self._existing_urls:
             self.related.append(Related(url=url))
             self._existing_urls.add(url)
+            self.touch()
             return True
             
         else:
             return False
 
 
+@event.listens_for(Session, 'after_flush')
+def _flush_tag_counts(session, flush_context):
+    tags = session.info.pop('tag_counts', None)
+    if not tags:
+        return
+    
+    counts = {}
+    for tag in tags:
+        counts[tag.id] = counts.get(tag.id, 0) + 1
+    
+    # a single upsert per flush, through the connection so it doesn't invalidate
+    # the cached autocomplete results on every post (the counts are only approximate anyway)
+    # drift (e.g.: deleted posts) is fixed by hoordu.tagstats.reconcile_tag_stats
+    statement = pg_insert(RemoteTagStats) \
+            .values([{'tag_id': id, 'post_count': count, 'last_used_time': func.now()} for id, count in sorted(counts.items())])
+    session.connection().execute(statement.on_conflict_do_update(
+        index_elements=[RemoteTagStats.tag_id],
+        set_={
+            'post_count': RemoteTagStats.post_count + statement.excluded.post_count,
+            'last_used_time': func.now()
+        }
+    ))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_tag_counts(session, previous_transaction):
+    session.info.pop('tag_counts', None)
+
+
 class FileFlags(IntFlag):
     none = 0
     favorite = auto()
@@ -327,6 +417,12 @@ class File(Base, MetadataHelper):
     
     # hash is md5 for compatibility
     hash: Mapped[Optional[bytes]] = mapped_column(LargeBinary(length=16), index=True)
+    # perceptual hash (64 bit dhash) for images, split into indexed 16 bit chunks to look up near duplicates
+    phash: Mapped[Optional[int]] = mapped_column(BigInteger)
+    phash_0: Mapped[Optional[int]] = mapped_column(Integer, Computed('(phash >> 48) & 65535'), index=True)
+    phash_1: Mapped[Optional[int]] = mapped_column(Integer, Computed('(phash >> 32) & 65535'), index=True)
+    phash_2: Mapped[Optional[int]] = mapped_column(Integer, Computed('(phash >> 16) & 65535'), index=True)
+    phash_3: Mapped[Optional[int]] = mapped_column(Integer, Computed('phash & 65535'), index=True)
     filename: Mapped[Optional[str]] = mapped_column(Text)
     mime: Mapped[Optional[str]] = mapped_column(String(length=255, collation='NOCASE'))
     ext: Mapped[Optional[str]] = mapped_column(String(length=20, collation='NOCASE'))
@@ -367,6 +463,11 @@ class FeedEntry(Base):
     # references
     post: Mapped[RemotePost] = relationship('RemotePost')
     subscription: Mapped['Subscription'] = relationship('Subscription', back_populates='feed')
+    
+    __table_args__ = (
+        # keyset pagination of a subscription's feed
+        Index('ix_feed_sort_index', 'subscription_id', 'sort_index', 'remote_post_id'),
+    )
 
 
 class SubscriptionFlags(IntFlag):
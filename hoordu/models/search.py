@@ -0,0 +1,121 @@
+from typing import Optional
+
+from sqlalchemy import DDL, event, cast, func, literal
+from sqlalchemy.dialects.postgresql import REGCONFIG
+
+from .common import TagCategory
+from .database import RemotePost, remote_post_tag
+
+__all__ = [
+    'post_search_query',
+    'post_search_rank',
+]
+
+# the text search parser and dictionaries come from the extension in psql-text-search/
+# tags are indexed as `category:tag` with hoordu_tags_v, which also adds a lexeme for the bare tag,
+# and are queried with hoordu_tags_q, which doesn't split them
+
+_category_names = ' '.join(f"WHEN {c.value} THEN '{c.name}'" for c in TagCategory)
+
+search_ddl = [
+    'CREATE EXTENSION IF NOT EXISTS hoordu',
+    
+    f"""
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tags(integer) RETURNS text
+    LANGUAGE sql STABLE AS $$
+        SELECT coalesce(string_agg((CASE t.category {_category_names} END) || ':' || replace(t.tag, ' ', '_'), ' '), '')
+        FROM remote_post_tag pt
+        JOIN remote_tag t ON t.id = pt.tag_id
+        WHERE pt.post_id = $1
+    $$
+    """,
+    
+    """
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_vector(title text, comment text, tags text) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('hoordu_tags_v', tags), 'B')
+            || setweight(to_tsvector('simple', coalesce(comment, '')), 'C')
+    $$
+    """,
+    
+    """
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := hoordu_remote_post_vector(NEW.title, NEW.comment, hoordu_remote_post_tags(NEW.id));
+        RETURN NEW;
+    END
+    $$
+    """,
+    
+    """
+    CREATE OR REPLACE FUNCTION hoordu_remote_post_tag_search_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        -- changing the tags also counts as updating the post, for incremental exports
+        -- (except for archive imports, which keep the time the posts were exported with)
+        UPDATE remote_post p
+            SET search_vector = hoordu_remote_post_vector(p.title, p.comment, hoordu_remote_post_tags(p.id)),
+                updated_time = CASE WHEN current_setting('hoordu.keep_updated_time', true) = 'on' THEN p.updated_time ELSE now() END
+            WHERE p.id IN (SELECT DISTINCT post_id FROM changed_tags);
+        RETURN NULL;
+    END
+    $$
+    """,
+    
+    """
+    CREATE TRIGGER remote_post_search_vector
+        BEFORE INSERT OR UPDATE OF title, comment ON remote_post
+        FOR EACH ROW EXECUTE FUNCTION hoordu_remote_post_search_trigger()
+    """,
+    
+    # statement level, so adding every tag of a post only updates the post once
+    """
+    CREATE TRIGGER remote_post_tag_insert_search_vector
+        AFTER INSERT ON remote_post_tag
+        REFERENCING NEW TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION hoordu_remote_post_tag_search_trigger()
+    """,
+    
+    """
+    CREATE TRIGGER remote_post_tag_delete_search_vector
+        AFTER DELETE ON remote_post_tag
+        REFERENCING OLD TABLE AS changed_tags
+        FOR EACH STATEMENT EXECUTE FUNCTION hoordu_remote_post_tag_search_trigger()
+    """,
+]
+
+# create_all creates remote_post_tag after remote_post and remote_tag
+for statement in search_ddl:
+    event.listen(remote_post_tag, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def _tag_text(tags: list[str]) -> str:
+    return ' '.join(tag.replace(' ', '_') for tag in tags)
+
+def post_search_query(text: Optional[str] = None, tags: Optional[list[str]] = None):
+    """
+    Builds a tsquery for RemotePost.search_vector.
+    text uses the websearch syntax ("quoted phrases", or, -word) and matches
+    titles, comments and tag names, tags are `category:tag` strings that must all match.
+    """
+    
+    queries = []
+    if text:
+        queries.append(func.websearch_to_tsquery(cast(literal('simple'), REGCONFIG), text))
+    
+    if tags:
+        queries.append(func.plainto_tsquery(cast(literal('hoordu_tags_q'), REGCONFIG), _tag_text(tags)))
+    
+    if not queries:
+        return None
+    
+    query = queries[0]
+    for q in queries[1:]:
+        query = query.op('&&')(q)
+    
+    return query
+
+def post_search_rank(query):
+    return func.ts_rank_cd(RemotePost.search_vector, query)
@@ -7,6 +7,7 @@ from dataclasses import dataclass, field
 from sqlalchemy import select
 
 from ..dynamic import Dynamic
+from ..http.cache import CachingClient
 from ..forms import *
 from ..logging import *
 from ..models import *
@@ -105,6 +106,10 @@ class PluginBase:
     config: Any
     
     http: aiohttp.ClientSession
+    # same as http, but caches responses (opt-in, for api pages that rarely change)
+    http_cache: CachingClient
+    # directory the plugin can keep its own files in (e.g.: derived tokens), created by the plugin
+    data_path: str
     
     # to be set by plugin developer
     source: ClassVar[str]
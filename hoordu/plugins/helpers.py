@@ -1,4 +1,28 @@
 import re
+import asyncio
+import collections
+import itertools
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from typing import TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# lxml builds the same trees several times faster than the pure python parser
+try:
+    import lxml
+    HTML_PARSER = 'lxml'
+    
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+def parse_html(markup: str | bytes):
+    """
+    Parses a page or an html fragment into a BeautifulSoup tree, with lxml if it's installed.
+    """
+    
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, HTML_PARSER)
 
 def parse_href(page_url, href):
     if re.match(r'^[a-zA-Z]+:', href):
@@ -39,3 +63,37 @@ async def unwind_url(http, url, max_iterations=20):
         pass
     
     return final_url
+
+async def prefetch(
+    items: Iterable[T],
+    fetch: Callable[[T], Awaitable[R]],
+    concurrency: int = 4
+) -> AsyncIterator[tuple[T, R]]:
+    """
+    Yields (item, await fetch(item)) for every item, in order, while fetching
+    up to `concurrency` items concurrently (including the ones ahead of the
+    item that was just yielded).
+    Errors are raised when their item is reached, the requests still in flight
+    are cancelled if the iteration stops early.
+    """
+    
+    items = iter(items)
+    pending = collections.deque()
+    
+    def fill():
+        for item in itertools.islice(items, concurrency - len(pending)):
+            pending.append((item, asyncio.ensure_future(fetch(item))))
+    
+    try:
+        fill()
+        while pending:
+            item, task = pending.popleft()
+            result = await task
+            fill()
+            yield item, result
+            
+    finally:
+        for _, task in pending:
+            task.cancel()
+        
+        await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
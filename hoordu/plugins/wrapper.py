@@ -6,6 +6,7 @@ from collections.abc import AsyncGenerator, AsyncIterable, Iterable
 from sqlalchemy import select
 
 from hoordu.http.download import save_response
+from hoordu.http.cache import CachingClient
 
 from ..dynamic import Dynamic
 from ..forms import *
@@ -18,6 +19,9 @@ from datetime import datetime, timezone
 import pathlib
 import logging
 import os
+import asyncio
+import collections
+import copy
 import contextlib
 import yarl
 import aiohttp
@@ -35,6 +39,8 @@ class PluginWrapper:
         self.session = session
         self.plugin_class: Type[PluginBase] = plugin_class
         self.log: logging.Logger = logging.getLogger(f'hoordu.{self.plugin_class.source}')
+        # posts downloaded at the same time while iterating (including the one being converted)
+        self.lookahead: int = max(1, session.hoordu.settings.get('download_lookahead', 1))
         
         self.source: Source
         self.plugin: Plugin
@@ -83,6 +89,17 @@ class PluginWrapper:
             
             return False, post
     
+    async def _complete_posts(self, original_ids: list[str]) -> set[str]:
+        if not original_ids:
+            return set()
+        
+        return set(await self.session.select(RemotePost.original_id) \
+            .where(
+                RemotePost.source == self.source,
+                RemotePost.original_id.in_(original_ids),
+                RemotePost.flags.op('&')(int(PostFlags.complete)) != 0
+            ).all())
+    
     async def _get_tag(self, category: TagCategory, tagstr: str) -> RemoteTag:
         tag = await self.session.select(RemoteTag) \
                 .where(
@@ -115,7 +132,8 @@ class PluginWrapper:
             'User-Agent': useragent,
         }
         
-        self.http = aiohttp.ClientSession(headers=headers)
+        # shares the connection pool, but not the cookies
+        self.http = self.session.hoordu.http.client(headers=headers, source=self.plugin_class.source)
         
         self.instance = self.plugin_class()
         self.instance.log = self.log
@@ -123,6 +141,8 @@ class PluginWrapper:
         
         async with self.http:
             self.instance.http = self.http
+            self.instance.http_cache = CachingClient(self.http, self.session.hoordu.http.cache, self.name)
+            self.instance.data_path = os.path.join(self.session.hoordu.settings.base_path, 'plugins', self.name)
             await self.instance.init()
             yield self
     
@@ -204,7 +224,7 @@ class PluginWrapper:
                     
                     case 'http' | 'https':
                         self.log.debug(f'downloading file: {url}')
-                        async with self.http.get(file_details.url, timeout=aiohttp.ClientTimeout(total=None)) as resp:
+                        async with self.http.get(file_details.url, timeout=self.session.hoordu.http.download_timeout) as resp:
                             resp.raise_for_status()
                             orig = await save_response(resp, suffix=file_details.filename)
                         is_move = True
@@ -233,6 +253,7 @@ class PluginWrapper:
                 
                 if not any(r.remote_id == related_post.id for r in existing_related):
                     self.session.add(Related(related_to=remote_post, remote=related_post))
+                    remote_post.touch()
                 
                 related_post = await self._convert_post(related_post, related_post_details)
         
@@ -321,11 +342,59 @@ class PluginWrapper:
             if custom_state is None:
                 custom_state = {k: v for k, v in state.items() if k not in ('head_id', 'tail_id')}
         
+        # (sort_index, post_id, post_data, download task, custom state before its batch was iterated)
+        pending = collections.deque()
+        # the plugin's state is ahead of the post being converted when looking ahead
+        resume_state = None
+        
         exc = False
         try:
             iterator = self.instance.iterate_query(query, custom_state, begin_at=begin_at)
             async with contextlib.aclosing(iterator) as it:
-                async for sort_index, post_id, post_data in it:
+                exhausted = False
+                while True:
+                    if not pending and not exhausted:
+                        if self.lookahead > 1:
+                            # resuming from the state before the batch lists it again,
+                            # so it's only copied once per batch instead of once per post
+                            batch_state = copy.deepcopy(custom_state)
+                            batch = []
+                            while not exhausted and len(batch) < self.lookahead:
+                                try:
+                                    sort_index, post_id, post_data = await anext(it)
+                                    
+                                except StopAsyncIteration:
+                                    exhausted = True
+                                    break
+                                
+                                stop = end_at is not None and sort_index <= end_at
+                                skip = begin_at is not None and sort_index >= begin_at
+                                batch.append((sort_index, post_id, post_data, not stop and not skip))
+                                exhausted = stop
+                            
+                            complete = await self._complete_posts([post_id for _, post_id, _, wanted in batch if wanted and post_id is not None])
+                            for sort_index, post_id, post_data, wanted in batch:
+                                download = None
+                                if wanted and post_id is not None and post_id not in complete:
+                                    download = asyncio.ensure_future(self.instance.download(post_id, post_data))
+                                
+                                pending.append((sort_index, post_id, post_data, download, batch_state))
+                            
+                        else:
+                            try:
+                                sort_index, post_id, post_data = await anext(it)
+                                pending.append((sort_index, post_id, post_data, None, None))
+                                exhausted = end_at is not None and sort_index <= end_at
+                                
+                            except StopAsyncIteration:
+                                exhausted = True
+                    
+                    if not pending:
+                        resume_state = None
+                        break
+                    
+                    sort_index, post_id, post_data, download, resume_state = pending.popleft()
+                    
                     if not is_head:
                         self.log.info('iterating %s(id %s)', sort_index, post_id)
                     else:
@@ -345,8 +414,16 @@ class PluginWrapper:
                             await self.session.commit()
                         
                         if not remote_post.complete:
-                            post_details = await self.instance.download(post_id, post_data)
+                            if download is None:
+                                download = self.instance.download(post_id, post_data)
+                            
+                            post_details = await download
                             remote_post = await self._convert_post(remote_post, post_details)
+                            
+                        elif download is not None:
+                            # completed in the meantime (e.g.: listed twice)
+                            download.cancel()
+                            await asyncio.gather(download, return_exceptions=True)
                     
                     if is_first:
                         is_first = False
@@ -362,6 +439,15 @@ class PluginWrapper:
             raise
             
         finally:
+            downloads = [download for _, _, _, download, _ in pending if download is not None]
+            for download in downloads:
+                download.cancel()
+            
+            await asyncio.gather(*downloads, return_exceptions=True)
+            
+            if resume_state is not None:
+                custom_state = resume_state
+            
             if subscription is not None:
                 state = Dynamic.from_json(subscription.state)
                 
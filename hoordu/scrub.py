@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from hashlib import md5 as _md5
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from .models import File, FileFlags
+
+__all__ = [
+    'ScrubReport',
+    'Scrubber'
+]
+
+
+def _has_flag(flag: FileFlags):
+    return File.flags.op('&')(int(flag)) != 0
+
+def md5_mmap_sync(path: str) -> bytes:
+    digest = _md5()
+    with open(path, 'rb') as f:
+        # mmap can't map empty files
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.digest()
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            
+            # hashlib releases the gil for large buffers and reads straight from the page cache
+            digest.update(mm)
+    
+    return digest.digest()
+
+
+class _Throttle:
+    """
+    Limits the throughput to `rate` bytes per second, averaged over the whole run.
+    """
+    
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, size: int) -> None:
+        if not self.rate:
+            return
+        
+        async with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + size / self.rate
+            delay = start - now
+        
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class ScrubReport:
+    last_id: int = 0
+    checked: int = 0
+    bytes: int = 0
+    elapsed: float = 0
+    # the ids are in the log
+    missing: int = 0
+    corrupt: int = 0
+    errors: int = 0
+    log: str = ''
+    
+    def summary(self) -> str:
+        rate = self.bytes / self.elapsed / (1 << 20) if self.elapsed else 0
+        return '\n'.join([
+            f'checked {self.checked} files ({self.bytes / (1 << 30):.2f} GiB, {rate:.1f} MB/s)',
+            f'missing: {self.missing}',
+            f'corrupt: {self.corrupt}',
+            f'errors: {self.errors}',
+            f'every file that failed is listed in {self.log}',
+        ])
+
+
+class Scrubber:
+    """
+    Verifies that every file marked as present is still in the storage and
+    still matches its md5, files that don't have their `present` flag cleared.
+    Progress is saved to a checkpoint after every batch, an interrupted scrub
+    resumes from there and the checkpoint is removed once it finishes.
+    The files that failed are appended to a log as `<status> <file id>` lines,
+    which is kept after the scrub finishes.
+    """
+    
+    def __init__(self,
+        session,
+        workers: Optional[int] = None,
+        rate: Optional[float] = None,
+        batch_size: int = 256
+    ):
+        self.session = session
+        self.hoordu = session.hoordu
+        self.log: logging.Logger = logging.getLogger('hoordu.scrub')
+        
+        settings = self.hoordu.settings
+        if workers is None:
+            workers = settings.get('scrub_workers') or os.cpu_count() or 1
+        
+        # MB/s, 0 or None means unlimited
+        if rate is None:
+            rate = settings.get('scrub_rate')
+        
+        self.workers: int = workers
+        self.batch_size: int = batch_size
+        self.throttle: _Throttle = _Throttle(rate * (1 << 20) if rate else None)
+        self.checkpoint: str = settings.get('scrub_checkpoint') or os.path.join(settings.base_path, 'scrub.json')
+        self.log_path: str = settings.get('scrub_log') or os.path.join(settings.base_path, 'scrub.log')
+    
+    def _load_checkpoint(self) -> Optional[ScrubReport]:
+        try:
+            with open(self.checkpoint) as f:
+                checkpoint = json.load(f)
+                
+        except FileNotFoundError:
+            return None
+        
+        return ScrubReport(**checkpoint)
+    
+    def _save_checkpoint(self, report: ScrubReport) -> None:
+        tmp = f'{self.checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(asdict(report), f)
+        
+        os.replace(tmp, self.checkpoint)
+    
+    async def check(self, pool: ProcessPoolExecutor, file: File) -> tuple[str, int]:
+        """
+        Returns ('ok' | 'missing' | 'corrupt' | 'error', size).
+        """
+        
+        filekey, _ = await self.hoordu.find_file_keys(file)
+        storage = self.hoordu.storage
+        
+        try:
+            stat = await storage.stat(filekey)
+            if stat is None:
+                return 'missing', 0
+            
+            if file.hash is None:
+                return 'ok', 0
+            
+            await self.throttle.acquire(stat.size)
+            
+            loop = asyncio.get_running_loop()
+            async with storage.local_path(filekey) as path:
+                digest = await loop.run_in_executor(pool, md5_mmap_sync, path)
+            
+            return ('ok' if digest == file.hash else 'corrupt'), stat.size
+            
+        except Exception:
+            self.log.exception('failed to check file %s', file.id)
+            return 'error', 0
+    
+    async def _flag(self, ids: list[int]) -> None:
+        if not ids:
+            return
+        
+        await self.session.execute(update(File) \
+                .where(File.id.in_(ids)) \
+                .values(flags=File.flags.op('&')(~int(FileFlags.present))))
+    
+    async def run(self, restart: bool = False) -> ScrubReport:
+        report = None if restart else self._load_checkpoint()
+        if report is not None:
+            self.log.info('resuming scrub after file %s', report.last_id)
+            
+        else:
+            report = ScrubReport()
+            # a new scrub starts a new log
+            with open(self.log_path, 'w'):
+                pass
+        
+        report.log = self.log_path
+        
+        semaphore = asyncio.Semaphore(self.workers)
+        started = time.monotonic() - report.elapsed
+        
+        async def worker(pool, file):
+            async with semaphore:
+                return file.id, *(await self.check(pool, file))
+        
+        # the rows are streamed from a server side cursor on the priority session,
+        # so committing the flags on the main session doesn't close it
+        statement = select(File) \
+                .where(_has_flag(FileFlags.present), File.id > report.last_id) \
+                .order_by(File.id) \
+                .execution_options(yield_per=self.batch_size)
+        
+        with ProcessPoolExecutor(self.workers) as pool:
+            result = await self.session.priority.stream_scalars(statement)
+            async for files in result.partitions():
+                results = await asyncio.gather(*(worker(pool, file) for file in files))
+                
+                missing = [id for id, status, _ in results if status == 'missing']
+                corrupt = [id for id, status, _ in results if status == 'corrupt']
+                for id in missing:
+                    self.log.warning('file %s is missing', id)
+                for id in corrupt:
+                    self.log.warning('file %s is corrupt', id)
+                
+                await self._flag(missing + corrupt)
+                await self.session.commit()
+                
+                failed = [(status, id) for id, status, _ in results if status != 'ok']
+                if failed:
+                    with open(self.log_path, 'a') as log:
+                        log.writelines(f'{status} {id}\n' for status, id in failed)
+                
+                report.missing += len(missing)
+                report.corrupt += len(corrupt)
+                report.errors += sum(1 for status, _ in failed if status == 'error')
+                report.checked += len(results)
+                report.bytes += sum(size for _, _, size in results)
+                report.last_id = files[-1].id
+                report.elapsed = time.monotonic() - started
+                self._save_checkpoint(report)
+                
+                # the priority session would otherwise keep every file in memory
+                self.session.priority.expunge_all()
+                self.log.info('scrubbed %s files (last file id: %s)', report.checked, report.last_id)
+        
+        if os.path.exists(self.checkpoint):
+            os.unlink(self.checkpoint)
+        
+        return report
@@ -1,15 +1,18 @@
 from collections.abc import Callable, Awaitable
 from typing import Coroutine, Type
 import contextlib
+import json
 import pathlib
 import shutil
 import os
 from typing import Optional
 import logging
+import itertools
+from decimal import Decimal
 
-from sqlalchemy import select
+from sqlalchemy import select, exists, or_, tuple_, union_all, event
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, selectinload, aliased
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 from .config import *
@@ -18,7 +21,11 @@ from .models.sql import SqlStatement
 from .util import *
 from .plugins import *
 from .plugins.wrapper import PluginWrapper
-from .thumbnailers import generate_thumbnail
+from .thumbnailers import THUMB_EXT, MAX_SIZE, ARCHIVE_MIME_TYPES, Unzip, resize_image
+from .thumbnailers.variants import thumbnail_variants
+from .thumbnailers.phash import CHUNKS, hamming, hash_chunks, chunk_neighbors
+from .tagquery import TagQueryCompiler
+from .cache import entity_tags, table_tags
 
 
 class HoorduSession:
@@ -40,6 +47,12 @@ class HoorduSession:
         
         self._callbacks: list[tuple[Callable[['HoorduSession', bool], Awaitable], bool, bool]] = []
         self._stack: contextlib.AsyncExitStack = contextlib.AsyncExitStack()
+        
+        # cache tags of everything written in the current transaction
+        self._invalidations: set[str] = set()
+        if self.hoordu.cache.enabled:
+            event.listen(self.raw.sync_session, 'after_flush', self._collect_flush)
+            event.listen(self.raw.sync_session, 'do_orm_execute', self._collect_statement)
     
     async def __aenter__(self):
         async with contextlib.AsyncExitStack() as stack:
@@ -83,6 +96,37 @@ class HoorduSession:
         self._plugins[plugin_name] = plugin
         return plugin
     
+    def _invalidate(self, tags: set[str]) -> None:
+        # published once the transaction commits
+        if not self._invalidations:
+            self.callback(self._publish_invalidations, on_commit=True, on_rollback=True)
+        
+        self._invalidations |= tags
+    
+    async def _publish_invalidations(self, session, is_commit: bool) -> None:
+        tags, self._invalidations = self._invalidations, set()
+        if is_commit:
+            await self.hoordu.cache.invalidate(tags)
+    
+    def _collect_flush(self, session, flush_context) -> None:
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            self._invalidate(entity_tags(obj))
+    
+    def _collect_statement(self, state) -> None:
+        # statements that bypass the orm (e.g.: Subscription.add_post)
+        if not (state.is_insert or state.is_update or state.is_delete):
+            return
+        
+        statement = state.statement
+        try:
+            params = statement.compile(dialect=state.session.get_bind().dialect).params
+            
+        except Exception:
+            params = None
+        
+        # the ids of the rows that bulk updates and deletes change aren't known
+        self._invalidate(table_tags(statement.table, params, any_row=state.is_update or state.is_delete))
+    
     def callback(self,
         callback: Callable[['HoorduSession', bool], Awaitable],
         on_commit: bool = False,
@@ -100,14 +144,16 @@ class HoorduSession:
         return await self.raw.refresh(*args, **kwargs)
     
     async def delete(self, instance: Base) -> None:
-        def delete_file(sess, is_commit):
-            files = self.hoordu.get_file_paths(instance)
-            for f in files:
-                path = pathlib.Path(f)
-                path.unlink(missing_ok=True)
+        async def delete_file(sess, is_commit):
+            keys = []
+            for levels in [self.hoordu.bucket_levels, *self.hoordu.previous_bucket_levels]:
+                keys.extend(self.hoordu.get_file_keys(instance, levels))
+                keys.extend(self.hoordu.get_variant_key(instance, v, levels) for v in thumbnail_variants.values())
+            for key in keys:
+                await self.hoordu.storage.delete(key)
         
         if isinstance(instance, File):
-            self.callback(wrap_async(delete_file), on_commit=True)
+            self.callback(delete_file, on_commit=True)
         
         await self.raw.delete(instance)
     
@@ -149,14 +195,39 @@ class HoorduSession:
     def select(self, *args, **kwargs):
         return SqlStatement(self.raw, select(*args, **kwargs))
     
+    @contextlib.asynccontextmanager
+    async def cache_session(self):
+        """
+        A separate session to load results that are going to be cached, so they
+        don't include changes that weren't committed yet and the instances are
+        detached (and can be shared and pickled) once it closes.
+        The instances have to be passed through merge_cached before they're used.
+        """
+        
+        if not self.hoordu.cache.enabled:
+            yield self.raw
+            return
+        
+        async with self._sessionmaker() as session:
+            yield session
+    
+    async def merge_cached(self, instance: Base) -> Base:
+        """
+        Returns the copy of a cached instance (and everything that was loaded with it)
+        that belongs to this session, without querying the database.
+        """
+        
+        if not self.hoordu.cache.enabled:
+            return instance
+        
+        return await self.raw.merge(instance, load=False)
+    
     
     async def import_file(self,
         file: File,
         path: str,
         move: bool = False
     ) -> None:
-        mvfun: Callable[[str, str], Awaitable[None]] = wrap_async(shutil.move if move else shutil.copy)
-        
         file.hash = await md5(path)
         file.mime = await mime_from_file(path)
         suffixes = pathlib.Path(path).suffixes
@@ -165,30 +236,308 @@ class HoorduSession:
         else:
             file.ext = None
         
-        file.thumb_ext = 'jpg'
+        # thumbnails are generated in the background by the thumbnail queue
+        file.thumb_ext = THUMB_EXT
+        file.thumb_present = False
         
-        dst, tdst = self.hoordu.get_file_paths(file)
+        dst, _ = self.hoordu.get_file_keys(file)
         
-        await mkpath(pathlib.Path(dst).parent)
-        await mvfun(path, dst)
-        os.chmod(dst, self.hoordu.config.settings.perms)
+        await self.hoordu.storage.put(dst, path, move=move)
         file.present = True
         
-        await mkpath(pathlib.Path(tdst).parent)
-        has_thumbnail = False
-        try:
-            has_thumbnail = await generate_thumbnail(dst, tdst, file.mime)
+        self.add(file)
+        await self.commit()
+    
+    async def archive_members(self, file: File, path: Optional[str] = None, load: bool = True) -> Optional[list[tuple[str, int]]]:
+        """
+        Returns the (path, size) of every file inside an archive.
+        The listing is cached in the file's metadata so archives are only listed once.
+        path can be a local copy of the file, if the caller already has one.
+        If load is False only the cached listing is returned, None if there's none.
+        """
+        
+        if file.mime not in ARCHIVE_MIME_TYPES:
+            return None
+        
+        metadata = json.loads(file.metadata_) if file.metadata_ else {}
+        members = metadata.get('archive_members')
+        if members is not None:
+            return [tuple(member) for member in members]
+        
+        if not load:
+            return None
+        
+        if path is not None:
+            members = await Unzip(path, file.mime).list()
             
-        except Exception as e:
-            self.log.exception('failed to generate a thumbnail')
-            pass
+        else:
+            filekey, _ = await self.hoordu.find_file_keys(file)
+            async with self.hoordu.storage.local_path(filekey) as filepath:
+                members = await Unzip(filepath, file.mime).list()
+        
+        file.update_metadata('archive_members', members)
+        self.add(file)
+        
+        return members
+    
+    async def thumbnail_variant(self, file: File, name: str) -> Optional[str]:
+        """
+        Returns the path (or the url, for remote storage) to a thumbnail variant,
+        generating it if it wasn't requested before.
+        Returns None if the file has nothing to generate it from.
+        """
+        
+        variant = thumbnail_variants.get(name)
+        if variant is None:
+            raise ValueError(f'unknown thumbnail variant: {name}')
         
-        if has_thumbnail:
-            os.chmod(tdst, self.hoordu.config.settings.perms)
-            file.thumb_present = True
+        metadata = json.loads(file.metadata_) if file.metadata_ else {}
+        generated = metadata.get('thumb_variants', [])
+        if name in generated:
+            # it may still be in a previous layout
+            return await self.hoordu.storage.url(await self.hoordu.find_variant_key(file, variant))
+        
+        key = self.hoordu.get_variant_key(file, variant)
+        
+        filekey, thumbkey = await self.hoordu.find_file_keys(file)
+        
+        # variants bigger than the default thumbnail need the original image,
+        # anything else (and videos, archives, etc) is cheaper to make from the thumbnail
+        if variant.size > MAX_SIZE and file.present and file.mime and file.mime.startswith('image/'):
+            srckey = filekey
+            
+        elif file.thumb_present:
+            srckey = thumbkey
             
         else:
-            file.thumb_ext = None
+            return None
+        
+        async with self.hoordu.storage.local_path(srckey) as src, \
+                self.hoordu.storage.writable_path(key) as dst:
+            await resize_image(src, dst, variant.size, variant.ext, variant.quality)
         
+        file.update_metadata('thumb_variants', sorted({*generated, name}))
         self.add(file)
-        await self.commit()
+        
+        return await self.hoordu.storage.url(key)
+    
+    async def similar_files(self,
+        target: File | int,
+        max_distance: int = 6,
+        limit: Optional[int] = None
+    ) -> list[tuple[File, int]]:
+        """
+        Returns the files whose perceptual hash is at most max_distance bits away
+        from the target (a file or a hash), sorted by distance.
+        """
+        
+        exclude_id = None
+        if isinstance(target, File):
+            exclude_id = target.id
+            target = target.phash
+        
+        if target is None:
+            return []
+        
+        # multi-index hashing: only files that share a chunk within this radius can match
+        radius = max_distance // CHUNKS
+        columns = (File.phash_0, File.phash_1, File.phash_2, File.phash_3)
+        
+        candidates = await self.select(File) \
+                .where(
+                    or_(*(column.in_(chunk_neighbors(chunk, radius)) for column, chunk in zip(columns, hash_chunks(target)))),
+                    File.id != exclude_id if exclude_id is not None else True
+                ) \
+                .all()
+        
+        similar = [(file, hamming(file.phash, target)) for file in candidates]
+        similar = sorted(((file, distance) for file, distance in similar if distance <= max_distance), key=lambda x: x[1])
+        
+        if limit is not None:
+            similar = similar[:limit]
+        
+        return similar
+    
+    async def search(self,
+        text: Optional[str] = None,
+        tags: Optional[list[str]] = None,
+        source: Optional[Source] = None,
+        page: int = 0,
+        page_size: int = 50
+    ) -> list[tuple[RemotePost, float]]:
+        """
+        Full text search over the title, comment and tags of remote posts,
+        sorted by rank. text uses the websearch syntax ("quoted phrases", or, -word),
+        tags are `category:tag` strings that every post must have.
+        """
+        
+        query = post_search_query(text, tags)
+        if query is None:
+            return []
+        
+        rank = post_search_rank(query)
+        
+        statement = select(RemotePost, rank) \
+                .where(RemotePost.search_vector.op('@@')(query)) \
+                .order_by(rank.desc(), RemotePost.id.desc()) \
+                .offset(page * page_size) \
+                .limit(page_size)
+        
+        if source is not None:
+            statement = statement.where(RemotePost.source_id == source.id)
+        
+        result = await self.execute(statement)
+        return [(post, r) for post, r in result.all()]
+    
+    async def query_posts(self,
+        query: str,
+        local: bool = False,
+        source: Optional[Source] = None,
+        page: int = 0,
+        page_size: int = 50
+    ) -> list[RemotePost] | list[Post]:
+        """
+        Returns the posts that match a tag query (see hoordu.tagquery), newest first.
+        local searches posts and their tags instead of remote posts.
+        """
+        
+        compiler = TagQueryCompiler(self, local=local, source_id=source.id if source is not None else None)
+        ids = await compiler(query)
+        
+        model = Post if local else RemotePost
+        return await self.select(model) \
+                .where(model.id.in_(ids)) \
+                .order_by(model.id.desc()) \
+                .offset(page * page_size) \
+                .limit(page_size) \
+                .all()
+    
+    async def feed(self,
+        subscriptions: Subscription | int | list[Subscription | int],
+        cursor: Optional[tuple[Decimal, int]] = None,
+        page_size: int = 50,
+        oldest_first: bool = False
+    ) -> tuple[list[RemotePost], Optional[tuple[Decimal, int]]]:
+        """
+        Returns a page of posts from the feed of one or more subscriptions,
+        ordered by (sort_index, remote_post_id), and the cursor for the next page
+        (None when there are no more posts).
+        Pages are fetched with keyset cursors, so every page costs the same,
+        and files and tags are loaded in two extra queries.
+        """
+        
+        if not isinstance(subscriptions, list):
+            subscriptions = [subscriptions]
+        
+        ids = [s.id if isinstance(s, Subscription) else s for s in subscriptions]
+        if not ids:
+            return [], None
+        
+        page, next_cursor = await self.hoordu.cache.get_or_load(
+            f'feed:{ids}:{cursor}:{page_size}:{oldest_first}',
+            [f'subscription:{id}' for id in ids],
+            lambda: self._load_feed(ids, cursor, page_size, oldest_first),
+            lambda page: [f'remote_post:{post.id}' for post in page[0]]
+        )
+        
+        return [await self.merge_cached(post) for post in page], next_cursor
+    
+    async def _load_feed(self,
+        ids: list[int],
+        cursor: Optional[tuple[Decimal, int]],
+        page_size: int,
+        oldest_first: bool
+    ) -> tuple[list[RemotePost], Optional[tuple[Decimal, int]]]:
+        key = tuple_(FeedEntry.sort_index, FeedEntry.remote_post_id)
+        if oldest_first:
+            order = (FeedEntry.sort_index.asc(), FeedEntry.remote_post_id.asc())
+        else:
+            order = (FeedEntry.sort_index.desc(), FeedEntry.remote_post_id.desc())
+        
+        # a post can be in more than one of the feeds, it's only kept where it comes first,
+        # otherwise it would show up again on the pages of its other entries
+        other = aliased(FeedEntry)
+        comes_before = other.sort_index < FeedEntry.sort_index if oldest_first else other.sort_index > FeedEntry.sort_index
+        listed_before = exists().where(
+            other.remote_post_id == FeedEntry.remote_post_id,
+            other.subscription_id.in_(ids),
+            comes_before
+        )
+        
+        # one ordered index scan per subscription, merged afterwards
+        scans = []
+        for id in ids:
+            scan = select(FeedEntry.sort_index, FeedEntry.remote_post_id) \
+                    .where(FeedEntry.subscription_id == id) \
+                    .order_by(*order) \
+                    .limit(page_size)
+            
+            if len(ids) > 1:
+                scan = scan.where(~listed_before)
+            
+            if cursor is not None:
+                scan = scan.where(key > tuple_(*cursor) if oldest_first else key < tuple_(*cursor))
+            
+            scans.append(scan)
+        
+        if len(scans) == 1:
+            statement = scans[0]
+            
+        else:
+            merged = union_all(*(scan.subquery().select() for scan in scans)).subquery()
+            
+            # entries of the same post with the same sort_index are left, so the limit applies to distinct posts
+            first = select(merged.c.sort_index, merged.c.remote_post_id) \
+                    .distinct(merged.c.remote_post_id) \
+                    .order_by(
+                        merged.c.remote_post_id,
+                        merged.c.sort_index.asc() if oldest_first else merged.c.sort_index.desc()
+                    ) \
+                    .subquery()
+            
+            statement = select(first.c.sort_index, first.c.remote_post_id) \
+                    .order_by(
+                        *((first.c.sort_index.asc(), first.c.remote_post_id.asc()) if oldest_first
+                            else (first.c.sort_index.desc(), first.c.remote_post_id.desc()))
+                    ) \
+                    .limit(page_size)
+        
+        async with self.cache_session() as session:
+            entries = (await session.execute(statement)).all()
+            if not entries:
+                return [], None
+            
+            post_ids = [post_id for _, post_id in entries]
+            
+            posts = await SqlStatement(session, select(RemotePost)) \
+                    .options(
+                        selectinload(RemotePost.files),
+                        selectinload(RemotePost.tags)
+                    ) \
+                    .where(RemotePost.id.in_(post_ids)) \
+                    .all()
+        
+        by_id = {post.id: post for post in posts}
+        page = [by_id[id] for id in post_ids if id in by_id]
+        
+        next_cursor = tuple(entries[-1]) if len(entries) == page_size else None
+        return page, next_cursor
+    
+    async def get_post(self, id: int) -> Optional[RemotePost]:
+        """
+        Returns a remote post with its files, tags and related urls loaded.
+        """
+        
+        async def load():
+            async with self.cache_session() as session:
+                return await SqlStatement(session, select(RemotePost)) \
+                        .options(
+                            selectinload(RemotePost.files),
+                            selectinload(RemotePost.tags),
+                            selectinload(RemotePost.related)
+                        ) \
+                        .where(RemotePost.id == id) \
+                        .one_or_none()
+        
+        post = await self.hoordu.cache.get_or_load(f'post:{id}', [f'remote_post:{id}'], load)
+        return await self.merge_cached(post) if post is not None else None
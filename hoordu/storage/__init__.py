@@ -0,0 +1,24 @@
+from typing import Any
+
+from .base import *
+from .local import *
+
+def create_storage(settings: Any) -> StorageBackend:
+    """
+    Creates the storage backend from the `storage` setting, files are stored
+    under base_path on the local disk if it isn't set.
+    """
+    
+    options = dict(settings.get('storage') or {})
+    backend = options.pop('backend', 'local')
+    
+    if backend == 'local':
+        return LocalStorage(options.get('base_path', settings.base_path), settings.get('perms'))
+        
+    elif backend == 's3':
+        # optional dependency
+        from .s3 import S3Storage
+        return S3Storage(**options)
+        
+    else:
+        raise ValueError(f'unknown storage backend: {backend}')
@@ -0,0 +1,108 @@
+import abc
+import contextlib
+from collections.abc import AsyncGenerator, AsyncIterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional, Protocol
+
+__all__ = [
+    'StorageStat',
+    'StorageReader',
+    'StorageBackend',
+]
+
+
+@dataclass
+class StorageStat:
+    size: int
+    modified_time: datetime
+
+
+class StorageReader(Protocol):
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+class StorageBackend:
+    """
+    Stores files under keys like `files/<bucket>/<id>.<ext>`.
+    Keys always use / as the separator and never start with one.
+    """
+    
+    @abc.abstractmethod
+    def path(self, key: str) -> str:
+        """
+        Returns a human readable location for the key (a path or an url).
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def put(self, key: str, src: str, move: bool = False) -> None:
+        """
+        Stores the local file src under key, replacing anything that was there.
+        """
+        pass
+    
+    @abc.abstractmethod
+    def open(self, key: str) -> contextlib.AbstractAsyncContextManager[StorageReader]:
+        """
+        Opens the key for reading.
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def link(self, src_key: str, dst_key: str) -> None:
+        """
+        Makes dst_key refer to the same contents as src_key.
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Deletes the key, it's not an error if the key doesn't exist.
+        """
+        pass
+    
+    @abc.abstractmethod
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        """
+        Returns None if the key doesn't exist.
+        """
+        pass
+    
+    @abc.abstractmethod
+    def iterate(self, prefix: str = '') -> AsyncGenerator[str]:
+        """
+        Yields every key that starts with prefix, in no particular order.
+        """
+        pass
+    
+    @abc.abstractmethod
+    def local_path(self, key: str) -> contextlib.AbstractAsyncContextManager[str]:
+        """
+        Yields a path on the local disk with the contents of the key,
+        for tools that can only work with paths (magick, ffmpeg, 7z).
+        """
+        pass
+    
+    @abc.abstractmethod
+    def writable_path(self, key: str) -> contextlib.AbstractAsyncContextManager[str]:
+        """
+        Yields a path on the local disk to be written to, which is stored
+        under key once the context exits, if the file was created.
+        """
+        pass
+    
+    async def url(self, key: str) -> str:
+        """
+        Returns a location other programs can read the key from
+        (a path on the local disk, or an url the file is served from).
+        """
+        
+        return self.path(key)
+    
+    async def close(self) -> None:
+        """
+        Releases any connections the backend keeps open.
+        """
+        pass
@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import os
+import pathlib
+import shutil
+from collections.abc import AsyncGenerator, AsyncIterator
+from datetime import datetime, timezone
+from typing import Optional
+
+from ..util import wrap_async, mkpath
+from .base import *
+
+__all__ = [
+    'LocalStorage'
+]
+
+
+class _LocalReader:
+    def __init__(self, file):
+        self._file = file
+        self._read = wrap_async(file.read)
+    
+    async def read(self, size: int = -1) -> bytes:
+        return await self._read(size)
+
+
+def _scan(path: str) -> tuple[list[str], list[str]]:
+    directories, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                else:
+                    files.append(entry.path)
+                    
+    except FileNotFoundError:
+        pass
+    
+    return directories, files
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, base_path: str, perms: Optional[int] = None):
+        self.base_path: str = str(base_path)
+        self.perms: Optional[int] = perms
+    
+    def path(self, key: str) -> str:
+        return '{}/{}'.format(self.base_path, key)
+    
+    def _chmod(self, path: str) -> None:
+        if self.perms is not None:
+            os.chmod(path, self.perms)
+    
+    async def put(self, key: str, src: str, move: bool = False) -> None:
+        dst = self.path(key)
+        await mkpath(pathlib.Path(dst).parent)
+        await wrap_async(shutil.move if move else shutil.copy)(src, dst)
+        self._chmod(dst)
+    
+    @contextlib.asynccontextmanager
+    async def open(self, key: str) -> AsyncIterator[_LocalReader]:
+        file = await wrap_async(open)(self.path(key), 'rb')
+        with file:
+            yield _LocalReader(file)
+    
+    async def link(self, src_key: str, dst_key: str) -> None:
+        src, dst = self.path(src_key), self.path(dst_key)
+        await mkpath(pathlib.Path(dst).parent)
+        
+        try:
+            os.link(src, dst)
+            
+        except OSError:
+            # different filesystems or no hard link support
+            await wrap_async(shutil.copy)(src, dst)
+            self._chmod(dst)
+    
+    async def delete(self, key: str) -> None:
+        pathlib.Path(self.path(key)).unlink(missing_ok=True)
+    
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        try:
+            st = os.stat(self.path(key))
+            
+        except FileNotFoundError:
+            return None
+        
+        return StorageStat(
+            size=st.st_size,
+            modified_time=datetime.fromtimestamp(st.st_mtime, timezone.utc)
+        )
+    
+    async def iterate(self, prefix: str = '') -> AsyncGenerator[str]:
+        # only the directory part of the prefix can be walked
+        directory, _, _ = prefix.rpartition('/')
+        scan = wrap_async(_scan)
+        
+        # directories are scanned in parallel on the default executor,
+        # every bucket is handed to a thread as soon as its parent is listed
+        pending = {asyncio.ensure_future(scan(self.path(directory) if directory else self.base_path))}
+        
+        start = len(self.base_path) + 1
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    directories, files = task.result()
+                    pending.update(asyncio.ensure_future(scan(d)) for d in directories)
+                    
+                    for path in files:
+                        key = path[start:]
+                        if key.startswith(prefix):
+                            yield key
+                            
+        finally:
+            # the consumer may stop early
+            for task in pending:
+                task.cancel()
+    
+    @contextlib.asynccontextmanager
+    async def local_path(self, key: str) -> AsyncIterator[str]:
+        yield self.path(key)
+    
+    @contextlib.asynccontextmanager
+    async def writable_path(self, key: str) -> AsyncIterator[str]:
+        path = self.path(key)
+        await mkpath(pathlib.Path(path).parent)
+        
+        yield path
+        
+        if os.path.exists(path):
+            self._chmod(path)
@@ -0,0 +1,213 @@
+import asyncio
+import contextlib
+import os
+import pathlib
+import tempfile
+from collections.abc import AsyncGenerator, AsyncIterator
+from typing import Any, Optional
+
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+
+from ..util import wrap_async
+from .base import *
+
+__all__ = [
+    'S3Storage'
+]
+
+
+# files over this size are uploaded in parts of this size (s3 takes up to 10000 parts)
+MULTIPART_SIZE = 64 << 20
+
+def _read_chunk(path: str, offset: int, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+class S3Storage(StorageBackend):
+    """
+    Stores files in an S3 compatible bucket (aws, minio, garage, etc).
+    A single client is kept open until close() is called.
+    """
+    
+    def __init__(self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        prefix: str = '',
+        url_expires: int = 3600
+    ):
+        self.bucket: str = bucket
+        self.prefix: str = prefix
+        # seconds the presigned urls returned by url() are valid for
+        self.url_expires: int = url_expires
+        
+        self._session = get_session()
+        self._client_options: dict[str, Any] = {
+            'endpoint_url': endpoint_url,
+            'aws_access_key_id': access_key,
+            'aws_secret_access_key': secret_key,
+            'region_name': region,
+        }
+        
+        self._exit_stack: Optional[contextlib.AsyncExitStack] = None
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+    
+    async def client(self):
+        # clients are bound to the loop they were created in
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._exit_stack = None
+            self._client = None
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        
+        async with self._lock:
+            if self._client is None:
+                exit_stack = contextlib.AsyncExitStack()
+                self._client = await exit_stack.enter_async_context(
+                    self._session.create_client('s3', **self._client_options)
+                )
+                self._exit_stack = exit_stack
+        
+        return self._client
+    
+    async def close(self) -> None:
+        if self._exit_stack is not None and self._loop is asyncio.get_running_loop():
+            await self._exit_stack.aclose()
+        
+        self._exit_stack = None
+        self._client = None
+        self._loop = None
+    
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+    
+    def path(self, key: str) -> str:
+        return 's3://{}/{}'.format(self.bucket, self._key(key))
+    
+    async def url(self, key: str) -> str:
+        client = await self.client()
+        return await client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(key)},
+            ExpiresIn=self.url_expires
+        )
+    
+    async def _put_multipart(self, client, key: str, src: str, size: int) -> None:
+        upload = await client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        upload_id = upload['UploadId']
+        read_chunk = wrap_async(_read_chunk)
+        
+        try:
+            parts = []
+            for number, offset in enumerate(range(0, size, MULTIPART_SIZE), 1):
+                chunk = await read_chunk(src, offset, MULTIPART_SIZE)
+                part = await client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=chunk
+                )
+                parts.append({'PartNumber': number, 'ETag': part['ETag']})
+            
+            await client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            
+        except BaseException:
+            await client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+    
+    async def put(self, key: str, src: str, move: bool = False) -> None:
+        client = await self.client()
+        size = (await wrap_async(os.stat)(src)).st_size
+        
+        if size > MULTIPART_SIZE:
+            await self._put_multipart(client, self._key(key), src, size)
+            
+        else:
+            body = await wrap_async(_read_chunk)(src, 0, size)
+            await client.put_object(Bucket=self.bucket, Key=self._key(key), Body=body)
+        
+        if move:
+            await wrap_async(os.unlink)(src)
+    
+    @contextlib.asynccontextmanager
+    async def open(self, key: str) -> AsyncIterator[StorageReader]:
+        client = await self.client()
+        response = await client.get_object(Bucket=self.bucket, Key=self._key(key))
+        async with response['Body'] as body:
+            yield body
+    
+    async def link(self, src_key: str, dst_key: str) -> None:
+        client = await self.client()
+        await client.copy_object(
+            Bucket=self.bucket,
+            Key=self._key(dst_key),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(src_key)}
+        )
+    
+    async def delete(self, key: str) -> None:
+        client = await self.client()
+        await client.delete_object(Bucket=self.bucket, Key=self._key(key))
+    
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        client = await self.client()
+        try:
+            response = await client.head_object(Bucket=self.bucket, Key=self._key(key))
+            
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            
+            raise
+        
+        return StorageStat(
+            size=response['ContentLength'],
+            modified_time=response['LastModified']
+        )
+    
+    async def iterate(self, prefix: str = '') -> AsyncGenerator[str]:
+        start = len(self.prefix)
+        client = await self.client()
+        paginator = client.get_paginator('list_objects_v2')
+        async for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][start:]
+    
+    @contextlib.asynccontextmanager
+    async def local_path(self, key: str) -> AsyncIterator[str]:
+        fd, path = tempfile.mkstemp(suffix=pathlib.PurePosixPath(key).suffix)
+        try:
+            with os.fdopen(fd, 'w+b') as f:
+                write = wrap_async(f.write)
+                async with self.open(key) as body:
+                    while chunk := await body.read(1 << 20):
+                        await write(chunk)
+            
+            yield path
+            
+        finally:
+            os.unlink(path)
+    
+    @contextlib.asynccontextmanager
+    async def writable_path(self, key: str) -> AsyncIterator[str]:
+        with tempfile.TemporaryDirectory() as dir:
+            # keep the extension, some tools pick the format from it
+            path = os.path.join(dir, pathlib.PurePosixPath(key).name)
+            
+            yield path
+            
+            if os.path.exists(path):
+                await self.put(key, path, move=True)
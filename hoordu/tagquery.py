@@ -0,0 +1,323 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import select, exists, func, intersect, union, except_, and_, or_, literal
+from sqlalchemy.sql import Select
+
+from .models import TagCategory, Tag, RemoteTag, Post, RemotePost, post_tag, remote_post_tag
+
+__all__ = [
+    'TagTerm',
+    'TagNot',
+    'TagAnd',
+    'TagOr',
+    'parse_tag_query',
+    'TagQueryCompiler',
+]
+
+
+# ast
+
+@dataclass
+class TagTerm:
+    category: Optional[TagCategory]
+    tag: str
+    
+    # resolved by the compiler
+    ids: list[int] = field(default_factory=list)
+    count: int = 0
+
+@dataclass
+class TagNot:
+    node: 'TagNode'
+
+@dataclass
+class TagAnd:
+    nodes: list['TagNode']
+
+@dataclass
+class TagOr:
+    nodes: list['TagNode']
+
+TagNode = TagTerm | TagNot | TagAnd | TagOr
+
+
+# parser
+
+_TOKEN_REGEX = re.compile(r'\s*(?:(?P<op>[()|-])|(?P<term>(?:[^\s()|"]|"[^"]*")+))')
+
+def _tokenize(query: str) -> list[str]:
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = _TOKEN_REGEX.match(query, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f'invalid tag query at {pos}: {query[pos:]!r}')
+        
+        tokens.append(match.group('op') or match.group('term'))
+        pos = match.end()
+    
+    return tokens
+
+def _parse_term(token: str) -> TagTerm:
+    category = None
+    tag = token
+    
+    name, sep, rest = token.partition(':')
+    if sep and not name.startswith('"'):
+        try:
+            category = TagCategory[name.lower()]
+            
+        except KeyError:
+            raise ValueError(f'unknown tag category: {name}')
+        
+        tag = rest
+    
+    if len(tag) >= 2 and tag.startswith('"') and tag.endswith('"'):
+        tag = tag[1:-1]
+    
+    if not tag:
+        raise ValueError(f'empty tag: {token}')
+    
+    return TagTerm(category, tag)
+
+def parse_tag_query(query: str) -> TagNode:
+    """
+    Parses a boolean tag expression like:
+        artist:123 general:landscape -meta:nsfw (character:a | character:b)
+    Terms next to each other must all match, `|` matches either side, `-` negates
+    the next term or group and tags with spaces can be quoted: artist:"some name".
+    Tags without a category match any category.
+    """
+    
+    tokens = _tokenize(query)
+    pos = 0
+    
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+    
+    def parse_or():
+        nonlocal pos
+        nodes = [parse_and()]
+        while peek() == '|':
+            pos += 1
+            nodes.append(parse_and())
+        
+        return nodes[0] if len(nodes) == 1 else TagOr(nodes)
+    
+    def parse_and():
+        nodes = []
+        while peek() not in (None, '|', ')'):
+            nodes.append(parse_unary())
+        
+        if not nodes:
+            raise ValueError(f'expected a tag at token {pos} of {query!r}')
+        
+        return nodes[0] if len(nodes) == 1 else TagAnd(nodes)
+    
+    def parse_unary():
+        nonlocal pos
+        token = peek()
+        pos += 1
+        
+        if token == '-':
+            return TagNot(parse_unary())
+            
+        elif token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError(f'unbalanced parenthesis in {query!r}')
+            pos += 1
+            return node
+            
+        else:
+            return _parse_term(token)
+    
+    node = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f'unexpected {tokens[pos]!r} in {query!r}')
+    
+    return node
+
+
+# compiler
+
+class TagQueryCompiler:
+    """
+    Compiles a tag query into a select of post ids.
+
+    All tags are resolved to ids first, then their cardinality is estimated
+    (capped, so huge tags don't have to be counted) and every intersection is
+    ordered from the rarest term.
+    When the rarest term is much smaller than the rest, it drives the query and the
+    other terms are checked with EXISTS semi-joins on (post_id, tag_id), otherwise
+    the post id lists are combined with INTERSECT/EXCEPT.
+    """
+    
+    # counts are capped here, anything bigger is just "big"
+    COUNT_CAP = 100_000
+    # use semi-joins when the rarest term is this many times smaller than the next one
+    SEMIJOIN_RATIO = 10
+    
+    def __init__(self, session, local: bool = False, source_id: Optional[int] = None):
+        self.session = session
+        self.local = local
+        self.source_id = source_id
+        
+        if local:
+            self.tag_model, self.post_model, self.association = Tag, Post, post_tag
+            
+        else:
+            self.tag_model, self.post_model, self.association = RemoteTag, RemotePost, remote_post_tag
+    
+    @staticmethod
+    def _terms(node: TagNode) -> list[TagTerm]:
+        if isinstance(node, TagTerm):
+            return [node]
+            
+        elif isinstance(node, TagNot):
+            return TagQueryCompiler._terms(node.node)
+            
+        else:
+            return [term for n in node.nodes for term in TagQueryCompiler._terms(n)]
+    
+    async def resolve(self, node: TagNode) -> None:
+        terms = self._terms(node)
+        model = self.tag_model
+        
+        # every tag in a single query
+        # tags are case insensitive, lower(tag) uses the same index as autocomplete
+        conditions = []
+        for term in terms:
+            if term.category is not None:
+                conditions.append(and_(model.category == term.category, func.lower(model.tag) == term.tag.lower()))
+            else:
+                conditions.append(func.lower(model.tag) == term.tag.lower())
+        
+        statement = select(model.id, model.category, model.tag).where(or_(*conditions))
+        if not self.local and self.source_id is not None:
+            statement = statement.where(model.source_id == self.source_id)
+        
+        rows = (await self.session.execute(statement)).all()
+        for term in terms:
+            term.ids = [id for id, category, tag in rows
+                    if tag.lower() == term.tag.lower() and (term.category is None or category == term.category)]
+        
+        # one capped count per term, in a single query
+        counted = [term for term in terms if term.ids]
+        if not counted:
+            return
+        
+        assoc = self.association.c
+        counts = []
+        for term in counted:
+            capped = select(literal(1)).where(assoc.tag_id.in_(term.ids)).limit(self.COUNT_CAP).subquery()
+            counts.append(select(func.count()).select_from(capped).scalar_subquery())
+        
+        row = (await self.session.execute(select(*counts))).one()
+        for term, count in zip(counted, row):
+            term.count = count
+    
+    def estimate(self, node: TagNode) -> int:
+        if isinstance(node, TagTerm):
+            return node.count
+            
+        elif isinstance(node, TagOr):
+            return sum(self.estimate(n) for n in node.nodes)
+            
+        elif isinstance(node, TagAnd):
+            positive = [self.estimate(n) for n in node.nodes if not isinstance(n, TagNot)]
+            return min(positive) if positive else self.COUNT_CAP
+            
+        else:
+            return self.COUNT_CAP
+    
+    def _all_posts(self) -> Select:
+        statement = select(self.post_model.id.label('post_id'))
+        if not self.local and self.source_id is not None:
+            statement = statement.where(self.post_model.source_id == self.source_id)
+        
+        return statement
+    
+    def _empty(self) -> Select:
+        return select(self.post_model.id.label('post_id')).where(False)
+    
+    def _condition(self, node: TagNode, post_id):
+        # a condition on post_id for the semi-join plan
+        if isinstance(node, TagTerm):
+            alias = self.association.alias()
+            return exists().where(alias.c.post_id == post_id, alias.c.tag_id.in_(node.ids))
+        
+        return post_id.in_(self.compile(node))
+    
+    def compile(self, node: TagNode) -> Select:
+        assoc = self.association.c
+        
+        if isinstance(node, TagTerm):
+            if not node.ids:
+                return self._empty()
+            
+            return select(assoc.post_id).where(assoc.tag_id.in_(node.ids))
+            
+        elif isinstance(node, TagNot):
+            return self.compile(TagAnd([node]))
+            
+        elif isinstance(node, TagOr):
+            nodes = [n for n in node.nodes if not (isinstance(n, TagTerm) and not n.ids)]
+            if not nodes:
+                return self._empty()
+            
+            if len(nodes) == 1:
+                return self.compile(nodes[0])
+            
+            return union(*(self.compile(n) for n in nodes))
+        
+        # and
+        positive = [n for n in node.nodes if not isinstance(n, TagNot)]
+        # negated tags that don't exist can't exclude anything
+        negative = [n.node for n in node.nodes if isinstance(n, TagNot) and not (isinstance(n.node, TagTerm) and not n.node.ids)]
+        
+        if any(isinstance(n, TagTerm) and not n.ids for n in positive):
+            return self._empty()
+        
+        positive.sort(key=self.estimate)
+        
+        if not positive:
+            driver = self._all_posts()
+            rest = []
+            
+        else:
+            driver = self.compile(positive[0])
+            rest = positive[1:]
+        
+        if not rest and not negative:
+            return driver
+        
+        estimates = [self.estimate(n) for n in positive]
+        use_semijoin = not rest or len(estimates) < 2 or estimates[0] * self.SEMIJOIN_RATIO <= estimates[1]
+        
+        if use_semijoin:
+            # probe the index for every candidate of the rarest term
+            candidates = driver.subquery()
+            post_id = candidates.c.post_id
+            conditions = [self._condition(n, post_id) for n in rest]
+            conditions.extend(~self._condition(n, post_id) for n in negative)
+            return select(post_id).distinct().where(*conditions)
+        
+        # comparable sizes, merge the id lists instead
+        statement = intersect(*(self.compile(n) for n in positive))
+        if negative:
+            statement = except_(statement, *(self.compile(n) for n in negative))
+        
+        return statement
+    
+    async def __call__(self, query: str | TagNode):
+        """
+        Returns a select of the ids of every post that matches the query.
+        """
+        
+        node = parse_tag_query(query) if isinstance(query, str) else query
+        await self.resolve(node)
+        return self.compile(node)
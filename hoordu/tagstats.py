@@ -0,0 +1,117 @@
+from typing import Optional
+
+from sqlalchemy import select, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import Tag, TagStats, TagCategory, Post, RemoteTag, RemoteTagStats, RemotePost, post_tag, remote_post_tag
+
+__all__ = [
+    'reconcile_tag_stats',
+    'autocomplete_tags',
+]
+
+
+# autocomplete only searches inside the tags (through the trigram index) after this many characters
+TRIGRAM_MIN_LENGTH = 3
+
+def _reconcile(tag_model, stats_model, post_model, association):
+    assoc = association.c
+    counts = select(
+                tag_model.id,
+                func.count(assoc.post_id),
+                func.max(post_model.created_time)
+            ) \
+            .select_from(tag_model) \
+            .outerjoin(association, assoc.tag_id == tag_model.id) \
+            .outerjoin(post_model, post_model.id == assoc.post_id) \
+            .group_by(tag_model.id)
+    
+    statement = pg_insert(stats_model) \
+            .from_select(['tag_id', 'post_count', 'last_used_time'], counts)
+    
+    # only rows that drifted are written
+    return statement.on_conflict_do_update(
+        index_elements=[stats_model.tag_id],
+        set_={
+            'post_count': statement.excluded.post_count,
+            'last_used_time': func.coalesce(stats_model.last_used_time, statement.excluded.last_used_time)
+        },
+        where=or_(
+            stats_model.post_count != statement.excluded.post_count,
+            stats_model.last_used_time == None
+        )
+    )
+
+async def reconcile_tag_stats(session) -> int:
+    """
+    Recounts the posts of every tag and fixes the stats that drifted
+    (posts that were deleted, tags that were linked without add_tag).
+    Returns the number of corrected rows.
+    """
+    
+    total = 0
+    for models in ((RemoteTag, RemoteTagStats, RemotePost, remote_post_tag), (Tag, TagStats, Post, post_tag)):
+        result = await session.execute(_reconcile(*models))
+        total += result.rowcount
+    
+    await session.commit()
+    return total
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+async def autocomplete_tags(session,
+    prefix: str,
+    category: Optional[TagCategory] = None,
+    source_id: Optional[int] = None,
+    local: bool = False,
+    limit: int = 10
+) -> list[tuple[Tag | RemoteTag, int]]:
+    """
+    Returns up to limit tags that start with (or contain, for longer inputs) prefix,
+    the ones that start with it come first and then the most used ones.
+    """
+    
+    if local:
+        tag_model, stats_model = Tag, TagStats
+        
+    else:
+        tag_model, stats_model = RemoteTag, RemoteTagStats
+    
+    async def load():
+        async with session.cache_session() as cache_session:
+            return await _autocomplete(cache_session, tag_model, stats_model, prefix, category, source_id, local, limit)
+    
+    tags = await session.hoordu.cache.get_or_load(
+        f'autocomplete:{tag_model.__tablename__}:{source_id}:{category}:{limit}:{prefix}',
+        [f'table:{tag_model.__tablename__}', f'table:{stats_model.__tablename__}'],
+        load
+    )
+    
+    return [(await session.merge_cached(tag), count) for tag, count in tags]
+
+async def _autocomplete(session, tag_model, stats_model, prefix, category, source_id, local, limit):
+    prefix = prefix.lower()
+    escaped = _escape_like(prefix)
+    
+    # lower(tag) LIKE 'x%' uses the text_pattern_ops index, ILIKE '%x%' the trigram one
+    starts_with = func.lower(tag_model.tag).like(f'{escaped}%', escape='\\')
+    matches = starts_with
+    if len(prefix) >= TRIGRAM_MIN_LENGTH:
+        matches = or_(starts_with, tag_model.tag.ilike(f'%{escaped}%', escape='\\'))
+    
+    post_count = func.coalesce(stats_model.post_count, 0)
+    statement = select(tag_model, post_count) \
+            .outerjoin(stats_model, stats_model.tag_id == tag_model.id) \
+            .where(matches) \
+            .order_by(starts_with.desc(), post_count.desc(), tag_model.tag) \
+            .limit(limit)
+    
+    if category is not None:
+        statement = statement.where(tag_model.category == category)
+    
+    if not local and source_id is not None:
+        statement = statement.where(tag_model.source_id == source_id)
+    
+    result = await session.execute(statement)
+    return [(tag, count) for tag, count in result.all()]
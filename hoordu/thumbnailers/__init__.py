@@ -1,16 +1,25 @@
-import tempfile
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import contextlib
+import logging
 import mimetypes
 import functools
 import re
+import os
+import tempfile
 import os.path
 
 from .common import *
-from .unzip import Unzip
+from .unzip import ARCHIVE_MIME_TYPES, Unzip
+from .video import keyframe_thumbnail
+from .variants import *
 
 
 # always jpeg
 MAX_SIZE = 500
+QUALITY = 85
+THUMB_EXT = 'jpg'
 
 
 mimetypes.init()
@@ -18,6 +27,14 @@ mimetypes.init()
 
 thumbnailers = {}
 
+@functools.cache
+def _find_thumbnailer(mime_type: str):
+    for rexp, thumbnailer in thumbnailers.items():
+        if rexp.fullmatch(mime_type):
+            return thumbnailer
+    
+    return None
+
 def register(match):
     if isinstance(match, str):
         rexp = re.compile(match)
@@ -26,10 +43,41 @@ def register(match):
     
     def dec(f):
         thumbnailers[rexp] = f
+        _find_thumbnailer.cache_clear()
         return f
     return dec
 
 
+log = logging.getLogger('hoordu.thumbnails')
+
+# optional, magick is used for everything if pillow isn't installed
+try:
+    from .pillow import MIME_TYPES as PILLOW_MIME_TYPES, pillow_thumbnail_sync, dhash_sync
+except ImportError:
+    pillow_thumbnail_sync = None
+    dhash_sync = None
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    
+    if _pool is None:
+        _pool = ProcessPoolExecutor()
+    
+    return _pool
+
+if pillow_thumbnail_sync is not None:
+    @register(PILLOW_MIME_TYPES)
+    async def pillow_thumbnail(src: str, dst: str):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_pool(), pillow_thumbnail_sync, src, dst, MAX_SIZE, QUALITY)
+            
+        except Exception:
+            log.warning('pillow failed to thumbnail %s, falling back to magick', src, exc_info=True)
+            return await magick_thumbnail(src, dst)
+
 @register(r'image\/.*')
 @register('application/pdf')
 async def magick_thumbnail(src: str, dst: str):
@@ -37,13 +85,20 @@ async def magick_thumbnail(src: str, dst: str):
         'magick',
         f'{src}[0]',
         '-resize', f'{MAX_SIZE}x{MAX_SIZE}>',
-        '-quality', f'85',
+        '-quality', f'{QUALITY}',
         dst
     )
     return True
 
 @register(r'video\/.*')
 async def ffmpeg_thumbnail(src: str, dst: str):
+    try:
+        if await keyframe_thumbnail(src, dst, MAX_SIZE):
+            return True
+            
+    except Exception:
+        log.warning('failed to seek %s, using the first frame instead', src, exc_info=True)
+    
     await async_exec(
         'ffmpeg',
         '-i', src,
@@ -55,38 +110,126 @@ async def ffmpeg_thumbnail(src: str, dst: str):
     )
     return True
 
+async def thumbnail_data(data: bytes, dst: str, mime_type: str) -> bool:
+    """
+    Generates a thumbnail from the contents of an image file without writing it to disk.
+    """
+    
+    thumbnailer = _find_thumbnailer(mime_type)
+    if thumbnailer is None:
+        return False
+    
+    if pillow_thumbnail_sync is not None and thumbnailer == pillow_thumbnail:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_pool(), pillow_thumbnail_sync, data, dst, MAX_SIZE, QUALITY)
+            
+        except Exception:
+            log.warning('pillow failed to thumbnail archive member, falling back to magick', exc_info=True)
+    
+    await async_exec(
+        'magick',
+        '-[0]',
+        '-resize', f'{MAX_SIZE}x{MAX_SIZE}>',
+        '-quality', f'{QUALITY}',
+        dst,
+        input=data
+    )
+    return True
+
 @register('application/zip')
 @register('application/x-rar')
 @register('application/x-7z-compressed')
-async def zip_thumbnail(src: str, dst: str):
-    zip = Unzip(src)
-    files = await zip.list()
-    
-    for file in files:
-        ext = os.path.splitext(file['path'])[1].decode()
-        mime_type = mimetypes.types_map.get(ext, None)
-        if mime_type is None:
-            continue
+async def zip_thumbnail(src: str, dst: str, members: Optional[list[tuple[str, int]]] = None, mime_type: Optional[str] = None):
+    """
+    Thumbnails the first file in the archive that can be thumbnailed.
+    members can be a cached listing of the archive, otherwise the archive is
+    only listed until that file is found.
+    """
+    
+    zip = Unzip(src, mime_type)
+    
+    async def iterate():
+        if members is not None:
+            for member in members:
+                yield member
         
-        for rexp, thumbnailer in thumbnailers.items():
-            if rexp.fullmatch(mime_type):
-                if thumbnailer != zip_thumbnail:
-                    break
         else:
-            continue
-        
-        with tempfile.TemporaryDirectory() as dir:
-            filename = file['path']
-            tmpdst = f'{dir}/{filename.split(b'/')[-1]}'
-            await zip.extract(filename, tmpdst)
-            return await thumbnailer(tmpdst, dst)
+            async for member in zip.members():
+                yield member
+    
+    async with contextlib.aclosing(iterate()) as it:
+        async for path, size in it:
+            ext = os.path.splitext(path)[1].lower()
+            member_mime = mimetypes.types_map.get(ext, None)
+            if member_mime is None:
+                continue
+            
+            thumbnailer = _find_thumbnailer(member_mime)
+            if thumbnailer is None or thumbnailer == zip_thumbnail:
+                continue
+            
+            # images can be thumbnailed without extracting them
+            if member_mime.startswith('image/'):
+                data = await zip.read(path)
+                return await thumbnail_data(data, dst, member_mime)
+            
+            with tempfile.TemporaryDirectory() as dir:
+                tmpdst = os.path.join(dir, os.path.basename(path))
+                await zip.extract(path, tmpdst)
+                return await thumbnailer(tmpdst, dst)
     
     return False
 
 
 async def generate_thumbnail(src: str, dst: str, mime_type: str) -> bool:
-    for rexp, thumbnailer in thumbnailers.items():
-        if rexp.fullmatch(mime_type):
-            return await thumbnailer(src, dst)
+    thumbnailer = _find_thumbnailer(mime_type)
+    if thumbnailer is not None:
+        return await thumbnailer(src, dst)
     
     return False
+
+
+async def resize_image(src: str, dst: str, size: int, ext: str, quality: int) -> bool:
+    """
+    Resizes an image to fit size x size, the format is picked from ext.
+    The image is written to a temporary file first, so dst is never incomplete.
+    """
+    
+    tmpdst = f'{dst}.tmp'
+    try:
+        if pillow_thumbnail_sync is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(_get_pool(), pillow_thumbnail_sync, src, tmpdst, size, quality, ext)
+                os.replace(tmpdst, dst)
+                return True
+                
+            except Exception:
+                log.debug('pillow failed to resize %s, falling back to magick', src, exc_info=True)
+        
+        await async_exec(
+            'magick',
+            f'{src}[0]',
+            '-resize', f'{size}x{size}>',
+            '-quality', f'{quality}',
+            f'{ext}:{tmpdst}'
+        )
+        os.replace(tmpdst, dst)
+        return True
+        
+    finally:
+        if os.path.exists(tmpdst):
+            os.unlink(tmpdst)
+
+
+async def perceptual_hash(src: str) -> Optional[int]:
+    """
+    Returns the dhash of an image as a signed 64 bit integer, or None if pillow isn't available.
+    """
+    
+    if dhash_sync is None:
+        return None
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), dhash_sync, src)
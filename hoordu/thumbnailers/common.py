@@ -5,7 +5,7 @@ __all__ = [
     'async_exec'
 ]
 
-async def async_exec(*args, out=None):
+async def async_exec(*args, out=None, input=None):
     with contextlib.ExitStack() as stack:
         if out is not None:
             proc_out = stack.enter_context(open(out, 'w+'))
@@ -15,10 +15,11 @@ async def async_exec(*args, out=None):
         
         proc = await asyncio.create_subprocess_exec(
             *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
             stdout=proc_out,
             stderr=asyncio.subprocess.PIPE
         )
-        stdout, stderr = await proc.communicate()
+        stdout, stderr = await proc.communicate(input)
         
         if proc.returncode != 0:
             message = f'Command {args[0]} failed with {proc.returncode}'
@@ -0,0 +1,37 @@
+import itertools
+
+__all__ = [
+    'HASH_BITS',
+    'CHUNKS',
+    'hamming',
+    'hash_chunks',
+    'chunk_neighbors'
+]
+
+# 64 bit dhash, split into 4 chunks of 16 bits for multi-index hashing:
+# two hashes within distance d always share a chunk within distance d // 4
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+def to_signed(value: int) -> int:
+    # postgres bigint is signed
+    return value - (1 << HASH_BITS) if value >= (1 << (HASH_BITS - 1)) else value
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << HASH_BITS) - 1)).bit_count()
+
+def hash_chunks(value: int) -> list[int]:
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & CHUNK_MASK for i in range(CHUNKS)]
+
+def chunk_neighbors(chunk: int, radius: int) -> list[int]:
+    neighbors = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), distance):
+            value = chunk
+            for bit in bits:
+                value ^= 1 << bit
+            neighbors.append(value)
+    
+    return neighbors
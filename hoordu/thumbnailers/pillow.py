@@ -0,0 +1,66 @@
+import io
+
+from PIL import Image, ImageOps
+
+from .phash import to_signed
+
+__all__ = [
+    'MIME_TYPES',
+    'pillow_thumbnail_sync',
+    'dhash_sync'
+]
+
+# formats that pillow decodes reliably, everything else goes to magick
+MIME_TYPES = r'image\/(?:jpeg|png|gif|webp|bmp|tiff)'
+
+FORMATS = {
+    'jpg': 'JPEG',
+    'webp': 'WEBP',
+    'avif': 'AVIF',
+    'png': 'PNG',
+}
+
+def pillow_thumbnail_sync(src: str | bytes, dst: str, size: int, quality: int = 85, ext: str = 'jpg') -> bool:
+    # src can also be the contents of the file
+    if isinstance(src, bytes):
+        src = io.BytesIO(src)
+    
+    with Image.open(src) as img:
+        # lets the jpeg decoder downscale by up to 8x during the dct
+        # so the full resolution image is never decoded
+        img.draft('RGB', (size, size))
+        
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if has_alpha:
+            img = img.convert('RGBA')
+            
+            # jpeg has no alpha channel
+            if ext == 'jpg':
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+                
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        img.save(dst, FORMATS[ext], quality=quality)
+    
+    return True
+
+def dhash_sync(src: str, hash_size: int = 8) -> int:
+    with Image.open(src) as img:
+        img.draft('L', (hash_size * 4, hash_size * 4))
+        img = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = img.tobytes()
+    
+    # one bit per pixel, set if it's brighter than the next pixel in the row
+    value = 0
+    for y in range(hash_size):
+        row = pixels[y * (hash_size + 1):(y + 1) * (hash_size + 1)]
+        for x in range(hash_size):
+            value = (value << 1) | (row[x] > row[x + 1])
+    
+    return to_signed(value)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import and_, update
+
+from ..models import File, FileFlags
+from . import generate_thumbnail, zip_thumbnail, perceptual_hash, THUMB_EXT, ARCHIVE_MIME_TYPES
+
+__all__ = [
+    'ThumbnailQueue'
+]
+
+
+def _has_flag(flag: FileFlags):
+    return File.flags.op('&')(int(flag)) != 0
+
+
+class ThumbnailQueue:
+    """
+    The queue is the file table itself: every file that is present on disk,
+    has no thumbnail yet and still has a thumbnail extension is pending.
+    Files that can't be thumbnailed get their thumb_ext cleared so they
+    aren't picked up again until the next backfill.
+    """
+    
+    def __init__(self,
+        session,
+        workers: Optional[int] = None,
+        batch_size: int = 256
+    ):
+        self.session = session
+        self.hoordu = session.hoordu
+        self.log: logging.Logger = logging.getLogger('hoordu.thumbnails')
+        
+        if workers is None:
+            workers = self.hoordu.settings.get('thumbnail_workers') or os.cpu_count() or 1
+        
+        self.workers: int = workers
+        self.batch_size: int = batch_size
+        self.duplicate_distance: int = self.hoordu.settings.get('duplicate_distance', 6)
+    
+    @staticmethod
+    def pending():
+        return and_(
+            _has_flag(FileFlags.present),
+            ~_has_flag(FileFlags.thumb_present),
+            File.thumb_ext != None
+        )
+    
+    async def process(self, file: File) -> bool:
+        srckey, _ = await self.hoordu.find_file_keys(file)
+        _, dstkey = self.hoordu.get_file_keys(file)
+        storage = self.hoordu.storage
+        
+        has_thumbnail = False
+        try:
+            async with storage.local_path(srckey) as src, storage.writable_path(dstkey) as dst:
+                if file.mime in ARCHIVE_MIME_TYPES:
+                    # listing the whole archive would read all of it, the thumbnail only needs the first usable file
+                    members = await self.session.archive_members(file, src, load=False)
+                    has_thumbnail = await zip_thumbnail(src, dst, members, file.mime)
+                    
+                else:
+                    has_thumbnail = await generate_thumbnail(src, dst, file.mime)
+                
+                if has_thumbnail:
+                    # the thumbnail is much cheaper to decode and hashes the same as the original
+                    await self.hash(file, dst)
+                    
+        except Exception:
+            self.log.exception('failed to generate a thumbnail for file %s', file.id)
+            has_thumbnail = False
+        
+        if has_thumbnail:
+            file.thumb_present = True
+            
+        else:
+            file.thumb_ext = None
+            
+            # a thumbnailer may have failed halfway through writing it
+            try:
+                await storage.delete(dstkey)
+                
+            except Exception:
+                self.log.exception('failed to delete the partial thumbnail of file %s', file.id)
+        
+        return has_thumbnail
+    
+    async def hash(self, file: File, thumbpath: str) -> None:
+        if not file.mime or not file.mime.startswith('image/'):
+            return
+        
+        try:
+            file.phash = await perceptual_hash(thumbpath)
+            
+        except Exception:
+            self.log.exception('failed to hash file %s', file.id)
+    
+    async def flag_duplicates(self, files: list[File]) -> None:
+        for file in files:
+            if file.phash is None:
+                continue
+            
+            similar = await self.session.similar_files(file, self.duplicate_distance)
+            if similar:
+                ids = [f.id for f, _ in similar]
+                file.update_metadata('near_duplicates', ids)
+                self.log.info('file %s looks like %s', file.id, ids)
+    
+    async def drain(self) -> int:
+        """
+        Generates thumbnails for every pending file.
+        Returns the number of files that were processed.
+        """
+        
+        semaphore = asyncio.Semaphore(self.workers)
+        
+        async def worker(file):
+            async with semaphore:
+                return await self.process(file)
+        
+        total = 0
+        last_id = 0
+        while True:
+            files = await self.session.select(File) \
+                    .where(self.pending(), File.id > last_id) \
+                    .order_by(File.id) \
+                    .limit(self.batch_size) \
+                    .all()
+            
+            if len(files) == 0:
+                return total
+            
+            await asyncio.gather(*(worker(file) for file in files))
+            
+            self.session.add(*files)
+            await self.flag_duplicates(files)
+            await self.session.commit()
+            
+            total += len(files)
+            last_id = files[-1].id
+            self.log.info('processed %s thumbnails (last file id: %s)', total, last_id)
+    
+    async def run(self, interval: float = 60) -> None:
+        while True:
+            await self.drain()
+            await asyncio.sleep(interval)
+    
+    async def backfill(self) -> int:
+        """
+        Requeues every file that is present but has no thumbnail,
+        including the ones that failed before, then drains the queue.
+        """
+        
+        await self.session.execute(update(File) \
+                .where(
+                    _has_flag(FileFlags.present),
+                    ~_has_flag(FileFlags.thumb_present)
+                ) \
+                .values(thumb_ext=THUMB_EXT))
+        await self.session.commit()
+        
+        return await self.drain()
+    
+    async def backfill_hashes(self) -> int:
+        """
+        Computes the perceptual hash of every image that has a thumbnail but no hash.
+        """
+        
+        semaphore = asyncio.Semaphore(self.workers)
+        
+        async def worker(file):
+            async with semaphore:
+                _, thumbkey = await self.hoordu.find_file_keys(file)
+                async with self.hoordu.storage.local_path(thumbkey) as thumbpath:
+                    return await self.hash(file, thumbpath)
+        
+        total = 0
+        last_id = 0
+        while True:
+            files = await self.session.select(File) \
+                    .where(
+                        _has_flag(FileFlags.thumb_present),
+                        File.phash == None,
+                        File.mime.like('image/%'),
+                        File.id > last_id
+                    ) \
+                    .order_by(File.id) \
+                    .limit(self.batch_size) \
+                    .all()
+            
+            if len(files) == 0:
+                return total
+            
+            await asyncio.gather(*(worker(file) for file in files))
+            
+            self.session.add(*files)
+            await self.flag_duplicates(files)
+            await self.session.commit()
+            
+            total += len(files)
+            last_id = files[-1].id
+            self.log.info('hashed %s files (last file id: %s)', total, last_id)
@@ -1,35 +1,105 @@
+import asyncio
+import contextlib
+import zipfile
+from collections.abc import AsyncGenerator
+from typing import Optional
+
 from .common import async_exec
+from ..util import wrap_async
 
 __all__ = [
+    'ARCHIVE_MIME_TYPES',
     'Unzip'
 ]
 
+ARCHIVE_MIME_TYPES = (
+    'application/zip',
+    'application/x-rar',
+    'application/x-7z-compressed',
+)
+
 class Unzip:
-    def __init__(self, archive: str):
+    def __init__(self, archive: str, mime: Optional[str] = None):
         self.archive = archive
+        
+        if mime is not None:
+            self.is_zip = (mime == 'application/zip')
+        else:
+            self.is_zip = zipfile.is_zipfile(archive)
     
-    async def list(self):
-        stdout = await async_exec(
+    def _list_zip(self) -> list[tuple[str, int]]:
+        with zipfile.ZipFile(self.archive) as zip:
+            return [(info.filename, info.file_size) for info in zip.infolist() if not info.is_dir()]
+    
+    def _read_zip(self, path: str) -> bytes:
+        with zipfile.ZipFile(self.archive) as zip:
+            return zip.read(path)
+    
+    async def _members_7z(self) -> AsyncGenerator[tuple[str, int]]:
+        proc = await asyncio.create_subprocess_exec(
             '7z', 'l',
             '-slt',
             '-ba',
-            '-p',
-            self.archive
+            '-p', #  to guarantee it doesn't block
+            self.archive,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
         )
         
-        sections = stdout.strip().split(b'\n\n')
-        files = []
-        for s in sections:
-            parts = s.split(b'\n')
-            
+        try:
             details = {}
-            for p in parts:
-                k, v = p.split(b'=')
-                details[k.decode().strip().lower().replace(' ', '_')] = v.strip()
+            async for line in proc.stdout:
+                line = line.strip()
+                if line:
+                    k, _, v = line.partition(b' = ')
+                    details[k.decode().strip().lower().replace(' ', '_')] = v
+                    continue
+                
+                if 'path' in details and details.get('folder') != b'+':
+                    yield details['path'].decode('utf-8', 'surrogateescape'), int(details.get('size') or 0)
+                
+                details = {}
             
-            files.append(details)
+            if 'path' in details and details.get('folder') != b'+':
+                yield details['path'].decode('utf-8', 'surrogateescape'), int(details.get('size') or 0)
+                
+        finally:
+            # the consumer may stop early, there's no need to list the rest
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+    
+    async def members(self) -> AsyncGenerator[tuple[str, int]]:
+        """
+        Yields (path, size) for every file in the archive, in archive order.
+        7z is only read until the consumer stops iterating.
+        """
         
-        return files
+        if self.is_zip:
+            for member in await wrap_async(self._list_zip)():
+                yield member
+                
+        else:
+            async with contextlib.aclosing(self._members_7z()) as it:
+                async for member in it:
+                    yield member
+    
+    async def list(self) -> list[tuple[str, int]]:
+        return [member async for member in self.members()]
+    
+    async def read(self, path: str) -> bytes:
+        if self.is_zip:
+            return await wrap_async(self._read_zip)(path)
+        
+        return await async_exec(
+            '7z', 'x',
+            '-p', #  to guarantee it doesn't block
+            f'-so',
+            '--',
+            self.archive,
+            path
+        )
     
     async def extract(self, file, dst):
         stdout = await async_exec(
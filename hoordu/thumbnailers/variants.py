@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+
+__all__ = [
+    'ThumbnailVariant',
+    'thumbnail_variants',
+    'register_variant'
+]
+
+@dataclass(frozen=True)
+class ThumbnailVariant:
+    name: str
+    size: int
+    ext: str
+    quality: int = 80
+
+
+thumbnail_variants: dict[str, ThumbnailVariant] = {}
+
+def register_variant(name: str, size: int, ext: str, quality: int = 80) -> ThumbnailVariant:
+    variant = ThumbnailVariant(name, size, ext, quality)
+    thumbnail_variants[name] = variant
+    return variant
+
+
+# the default thumbnail (MAX_SIZE, jpg) is always generated on import,
+# these are only generated when they are requested
+register_variant('small', 160, 'webp')
+register_variant('medium', 320, 'webp')
+register_variant('large', 1280, 'webp')
+register_variant('large-avif', 1280, 'avif', 60)
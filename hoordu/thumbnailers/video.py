@@ -0,0 +1,106 @@
+import logging
+import os
+from typing import Optional
+
+from .common import async_exec
+
+__all__ = [
+    'probe_duration',
+    'keyframe_thumbnail'
+]
+
+# points in the video (as a fraction of its duration) that are considered for the thumbnail
+CANDIDATES = (0.1, 0.3, 0.5, 0.7)
+# width and height of the grayscale sample used to score each candidate
+SAMPLE_SIZE = 16
+
+log = logging.getLogger('hoordu.thumbnails')
+
+async def probe_duration(src: str) -> Optional[float]:
+    stdout = await async_exec(
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        src
+    )
+    
+    try:
+        return float(stdout.strip())
+        
+    except ValueError:
+        # N/A
+        return None
+
+def score_sample(sample: bytes) -> float:
+    if not sample:
+        return 0
+    
+    mean = sum(sample) / len(sample)
+    variance = sum((p - mean) ** 2 for p in sample) / len(sample)
+    
+    # dark frames (intros, fades) are penalized even if they have some detail
+    return variance * min(1.0, mean / 48)
+
+async def extract_candidate(src: str, dst: str, position: float, size: int) -> float:
+    # seeking before the input only decodes from the closest keyframe,
+    # and skip_frame makes sure that keyframe is the frame that gets used
+    sample = await async_exec(
+        'ffmpeg',
+        '-v', 'error',
+        '-skip_frame', 'nokey',
+        '-noaccurate_seek',
+        '-ss', f'{position:.3f}',
+        '-i', src,
+        '-filter_complex', (
+            f'[0:v:0]scale=w={size}:h={size}:force_original_aspect_ratio=decrease,split=2[thumb][sample];'
+            f'[sample]scale={SAMPLE_SIZE}:{SAMPLE_SIZE},format=gray[gray]'
+        ),
+        '-map', '[thumb]', '-frames:v', '1', '-q:v', '2', '-y', dst,
+        '-map', '[gray]', '-frames:v', '1', '-f', 'rawvideo', 'pipe:1'
+    )
+    
+    if not os.path.exists(dst) or os.path.getsize(dst) == 0:
+        return -1
+    
+    return score_sample(sample)
+
+async def keyframe_thumbnail(src: str, dst: str, size: int) -> bool:
+    """
+    Thumbnails the most representative keyframe out of a few points in the video.
+    Returns False if the duration of the video can't be determined.
+    """
+    
+    duration = await probe_duration(src)
+    if not duration:
+        return False
+    
+    candidates = [f'{dst}.{i}.jpg' for i in range(len(CANDIDATES))]
+    best = None
+    best_score = -1
+    try:
+        # one at a time, the queue already thumbnails as many files as there are workers
+        # and every ffmpeg process can use more than one core
+        for path, fraction in zip(candidates, CANDIDATES):
+            try:
+                score = await extract_candidate(src, path, duration * fraction, size)
+                
+            except Exception:
+                # e.g.: a corrupt section of the video, the other candidates can still be used
+                log.warning('failed to extract a keyframe from %s', src, exc_info=True)
+                continue
+            
+            if score > best_score:
+                best = path
+                best_score = score
+        
+        if best is None:
+            return False
+        
+        os.replace(best, dst)
+        return True
+        
+    finally:
+        for path in candidates:
+            if os.path.exists(path):
+                os.unlink(path)
@@ -1,12 +1,11 @@
 import re
 import dateutil.parser
 
-from bs4 import BeautifulSoup
-
 from hoordu.dynamic import Dynamic
 from hoordu.plugins import *
 from hoordu.models.common import *
 from hoordu.forms import *
+from hoordu.plugins.helpers import parse_html
 
 
 POST_FORMAT = 'https://baraag.net/@{user}/{post_id}'
@@ -79,7 +78,7 @@ class Baraag(PluginBase):
         
         user = post_data.account.acct
         text = post_data.content if post_data.spoiler_text is None else f'{post_data.spoiler_text}\n{post_data.content}'
-        text_html = BeautifulSoup(text, 'html.parser')
+        text_html = parse_html(text)
         
         for p in text_html.find_all('p'):
             p.replace_with(p.text + '\n')
@@ -135,7 +134,7 @@ class Baraag(PluginBase):
         
         thumb_url = user.avatar
         
-        desc_html = BeautifulSoup(user.note, 'html.parser')
+        desc_html = parse_html(user.note)
         
         for p in desc_html.find_all('p'):
             p.replace_with(p.text + '\n')
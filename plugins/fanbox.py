@@ -3,12 +3,11 @@ import dateutil.parser
 import itertools
 import yarl
 
-from bs4 import BeautifulSoup
-
 from hoordu.dynamic import Dynamic
 from hoordu.plugins import *
 from hoordu.models.common import *
 from hoordu.forms import *
+from hoordu.plugins.helpers import parse_html
 
 CREATOR_URL_REGEXP = re.compile(r'https?:\/\/(?P<creator>[^\.]+)\.fanbox\.cc\/', flags=re.IGNORECASE)
 
@@ -215,7 +214,7 @@ class Fanbox(PluginBase):
                             url = POST_FORMAT.format(creator=related_creator_id, post_id=related_post_id)
                             
                         elif urlembed.type in ('html', 'html.card'):
-                            embed_html = BeautifulSoup(urlembed.html, 'html.parser')
+                            embed_html = parse_html(urlembed.html)
                             iframes = embed_html.select('iframe')
                             if len(iframes) >= 1:
                                 src = iframes[0]['src']
@@ -289,7 +288,7 @@ class Fanbox(PluginBase):
         page_params = {
             'creatorId': query.creator
         }
-        async with self.http.get('https://api.fanbox.cc/post.paginateCreator', params=page_params) as response:
+        async with self.http_cache.get('https://api.fanbox.cc/post.paginateCreator', params=page_params) as response:
             response.raise_for_status()
             pages = Dynamic.from_json(await response.text()).body
         
@@ -1,12 +1,11 @@
 import re
 import dateutil.parser
-from bs4 import BeautifulSoup
 
 from hoordu.dynamic import Dynamic
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, parse_html
 
 POST_FORMAT = 'https://fantia.jp/posts/{post_id}'
 CONTENT_FORMAT = 'https://fantia.jp/posts/{post_id}#post-content-id-{content_id}'
@@ -63,7 +62,7 @@ class Fantia(PluginBase):
     async def _get_csrf_token(self, post_id):
         async with self.http.get(POST_FORMAT.format(post_id=post_id)) as response:
             response.raise_for_status()
-            html = BeautifulSoup(await response.text(), 'html.parser')
+            html = parse_html(await response.text())
             meta_tag = html.select('meta[name="csrf-token"]')[0]
             return str(meta_tag['content'])
     
@@ -264,7 +263,7 @@ class Fantia(PluginBase):
     async def probe_query(self, query):
         async with self.http.get(FANCLUB_URL.format(fanclub_id=query.creator_id)) as html_response:
             html_response.raise_for_status()
-            html = BeautifulSoup(await html_response.text(), 'html.parser')
+            html = parse_html(await html_response.text())
         
         async with self.http.get(FANCLUB_GET_URL.format(fanclub_id=query.creator_id)) as response:
             response.raise_for_status()
@@ -1,12 +1,11 @@
 import re
 import itertools
-from bs4 import BeautifulSoup
 
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
 from hoordu.dynamic import Dynamic
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, parse_html
 
 
 PRODUCT_FORMAT = 'https://{account_code}.gumroad.com/l/{product_code}'
@@ -46,7 +45,7 @@ class Gumroad(PluginBase):
         
         async with self.http.get(main_url) as response:
             response.raise_for_status()
-            doc = BeautifulSoup(await response.text(), 'html.parser')
+            doc = parse_html(await response.text())
         
         post_json = doc.select('script[data-component-name="ProductPage"]')[0].text
         post_data = Dynamic.from_json(post_json)
@@ -57,7 +56,7 @@ class Gumroad(PluginBase):
         post.type = PostType.set
         post.metadata = {'creator': account_code}
         
-        comment_html = BeautifulSoup(post_data.product.description_html, 'html.parser')
+        comment_html = parse_html(post_data.product.description_html)
         
         for a in comment_html.select('a'):
             url = parse_href(main_url, a['href'])
@@ -85,7 +84,7 @@ class Gumroad(PluginBase):
             content_url = parse_href(main_url, post_data.purchase.content_url)
             async with self.http.get(content_url) as response:
                 response.raise_for_status()
-                doc = BeautifulSoup(await response.text(), 'html.parser')
+                doc = parse_html(await response.text())
             
             content_json = doc.select('script[data-component-name="DownloadPageWithContent"]')[0].text
             content: Dynamic = Dynamic.from_json(content_json)
@@ -3,13 +3,11 @@ import itertools
 import dateutil.parser
 import yarl
 
-from bs4 import BeautifulSoup
-
 import hoordu
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, parse_html
 
 POST_URL = ['nijie.info/view.php', 'www.nijie.info/view.php']
 USER_URL = [
@@ -64,7 +62,7 @@ class Nijie(PluginBase):
         if post_data is None:
             async with self.http.get(post_url) as response:
                 response.raise_for_status()
-                post_data = BeautifulSoup(await response.text(), 'html.parser')
+                post_data = parse_html(await response.text())
         
         post_files = post_data.select("#gallery .mozamoza")
         user_id = post_files[0]['user_id']
@@ -118,7 +116,7 @@ class Nijie(PluginBase):
         # files
         async with self.http.get('https://nijie.info/view_popup.php', params={'id': post_id}) as response:
             response.raise_for_status()
-            popup = BeautifulSoup(await response.text(), 'html.parser')
+            popup = parse_html(await response.text())
         
         files = popup.select('#img_window a > *:not(.view_filter)')
         if len(files) != len(post_files):
@@ -141,7 +139,7 @@ class Nijie(PluginBase):
     async def probe_query(self, query):
         async with self.http.get('https://nijie.info/members.php', params={'id': query.user_id}) as response:
             response.raise_for_status()
-            html = BeautifulSoup(await response.text(), 'html.parser')
+            html = parse_html(await response.text())
         
         user_name = list(html.select("#pro .name")[0].children)[2]
         thumbnail_url = html.select("#pro img")[0]['src'].replace("__rs_cs150x150/", "")
@@ -183,7 +181,7 @@ class Nijie(PluginBase):
                 }
                 async with self.http.get('https://nijie.info/members_illust.php', params=params) as response:
                     response.raise_for_status()
-                    html = BeautifulSoup(await response.text(), 'html.parser')
+                    html = parse_html(await response.text())
                 
                 post_urls = [e['href'] for e in html.select('#members_dlsite_left .picture a')]
                 post_ids = [int(yarl.URL(url).query['id']) for url in post_urls]
@@ -2,14 +2,13 @@ import re
 import dateutil.parser
 import itertools
 
-from bs4 import BeautifulSoup
 from collections import OrderedDict
 
 import hoordu
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, parse_html
 from hoordu.dynamic import Dynamic
 
 
@@ -129,7 +128,7 @@ class Patreon(PluginBase):
         content_images = []
         if post_attr.get('content') is not None:
             content = re.sub(r'\s+', ' ', post_attr.content)
-            comment_html = BeautifulSoup(content, 'html.parser')
+            comment_html = parse_html(content)
             
             page_url = POST_FORMAT.format(post_id=post_id)
             for a in comment_html.select('a'):
@@ -1,15 +1,14 @@
 import re
+import contextlib
 import dateutil.parser
 from urllib.parse import unquote
 from xml.sax.saxutils import unescape
 
-from bs4 import BeautifulSoup
-
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
 from hoordu.dynamic import Dynamic
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, prefetch, parse_html
 
 POST_FORMAT = 'https://www.pixiv.net/artworks/{post_id}'
 FANBOX_URL_FORMAT = 'https://www.pixiv.net/fanbox/creator/{user_id}'
@@ -33,6 +32,8 @@ POST_UGOIRA_URL = 'https://www.pixiv.net/ajax/illust/{post_id}/ugoira_meta'
 USER_POSTS_URL = 'https://www.pixiv.net/ajax/user/{user_id}/profile/all'
 USER_BOOKMARKS_URL = 'https://www.pixiv.net/ajax/user/{user_id}/illusts/bookmarks'
 BOOKMARKS_LIMIT = 48
+# post details requested at the same time while iterating bookmarks (`details_concurrency` in the plugin config)
+DETAILS_CONCURRENCY = 2
 
 class Pixiv(PluginBase):
     source = 'pixiv'
@@ -118,7 +119,7 @@ class Pixiv(PluginBase):
         # there is no visual difference in multiple whitespace (or newlines for that matter)
         # unless inside <pre>, but that's too hard to deal with :(
         description = re.sub(r'\s+', ' ', post_data.description)
-        comment_html = BeautifulSoup(description, 'html.parser')
+        comment_html = parse_html(description)
         
         page_url = POST_FORMAT.format(post_id=post_id)
         for a in comment_html.select('a'):
@@ -221,7 +222,7 @@ class Pixiv(PluginBase):
         if isinstance(user.social, dict):
             related_urls.update(s.url for s in user.social.values())
         
-        comment_html = BeautifulSoup(user.commentHtml, 'html.parser')
+        comment_html = parse_html(user.commentHtml)
         related_urls.update(a.text for a in comment_html.select('a'))
         
         async with self.http.get(FANBOX_URL_FORMAT.format(user_id=query.user_id), allow_redirects=False) as creator_response:
@@ -238,7 +239,8 @@ class Pixiv(PluginBase):
         )
     
     async def iterate_user(self, query, state, begin_at=None):
-        async with self.http.get(USER_POSTS_URL.format(user_id=query.user_id)) as resp:
+        # revalidated with its etag, if it has one
+        async with self.http_cache.get(USER_POSTS_URL.format(user_id=query.user_id)) as resp:
             resp.raise_for_status()
             user_info = Dynamic.from_json(await resp.text())
         
@@ -259,6 +261,20 @@ class Pixiv(PluginBase):
             sort_index = int(post_id)
             yield sort_index, str(post_id), None
     
+    async def _get_bookmarked_post(self, bookmark):
+        async with self.http.get(POST_GET_URL.format(post_id=bookmark.id)) as resp:
+            # skip this post if 404 (deleted bookmarks)
+            if resp.status == 404:
+                return None
+            
+            resp.raise_for_status()
+            post_resp = Dynamic.from_json(await resp.text())
+        
+        if post_resp.error is True:
+            raise APIError(post_resp.message)
+        
+        return post_resp.body
+    
     async def iterate_bookmarks(self, query, state, begin_at=None):
         first_time = 'offset' in state
         offset = state.get('offset', 0) if begin_at is not None else 0
@@ -280,32 +296,22 @@ class Pixiv(PluginBase):
                     raise APIError(bookmarks_resp.message)
                 
                 bookmarks = bookmarks_resp.body.works
-                
-                if len(bookmarks) == 0:
-                    return
-                
-                for bookmark in bookmarks:
-                    bookmark_id = int(bookmark.bookmarkData.id)
-                    post_id = bookmark.id
+            
+            if len(bookmarks) == 0:
+                return
+            
+            # the details are requested a few posts ahead, but still yielded in order
+            concurrency = self.config.get('details_concurrency', DETAILS_CONCURRENCY)
+            async with contextlib.aclosing(prefetch(bookmarks, self._get_bookmarked_post, concurrency)) as posts:
+                async for bookmark, post in posts:
+                    if post is not None:
+                        yield int(bookmark.bookmarkData.id), str(bookmark.id), post
                     
-                    async with self.http.get(POST_GET_URL.format(post_id=post_id)) as resp:
-                        # skip this post if 404 (deleted bookmarks)
-                        was_deleted = (resp.status == 404)
-                        
-                        if not was_deleted:
-                            resp.raise_for_status()
-                            post_resp = Dynamic.from_json(await resp.text())
-                            
-                            if post_resp.error is True:
-                                raise APIError(post_resp.message)
-                            
-                            yield bookmark_id, str(post_id), post_resp.body
-                        
-                        if first_time or begin_at is not None:
-                            state['offset'] += 1
-                
-                # offset for the next page
-                offset += len(bookmarks)
+                    if first_time or begin_at is not None:
+                        state['offset'] += 1
+            
+            # offset for the next page
+            offset += len(bookmarks)
     
     def iterate_query(self, query, state, begin_at=None):
         if query.method == 'illusts':
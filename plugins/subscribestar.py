@@ -5,13 +5,11 @@ import functools
 import dateutil.parser
 import yarl
 
-from bs4 import BeautifulSoup
-
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
 from hoordu.dynamic import Dynamic
-from hoordu.plugins.helpers import parse_href
+from hoordu.plugins.helpers import parse_href, parse_html
 
 
 POST_REGEXP = [
@@ -223,7 +221,7 @@ class SubStar(PluginBase):
         if post_data is None:
             async with self.http.get(url) as response:
                 response.raise_for_status()
-                post_data = BeautifulSoup(await response.text(), 'html.parser')
+                post_data = parse_html(await response.text())
         
         post_id_el = post_data.select('[data-post_id]')
         is_accessible = len(post_id_el) > 0
@@ -240,7 +238,7 @@ class SubStar(PluginBase):
             url = f'https://subscribestar.adult/{query.user}'
             async with self.http.get(url) as response:
                 response.raise_for_status()
-                page_html = BeautifulSoup(await response.text(), 'html.parser')
+                page_html = parse_html(await response.text())
             
             posts_href = page_html.select('.posts-more')[0].attrs['href']
             query.user_id = yarl.URL(posts_href).query['star_id']
@@ -268,7 +266,7 @@ class SubStar(PluginBase):
             if next_page is None:
                 async with self.http.get(main_url) as response:
                     response.raise_for_status()
-                    page_html = BeautifulSoup(await response.text(), 'html.parser')
+                    page_html = parse_html(await response.text())
                     posts_html = page_html.select('.posts')[0]
                 
             else:
@@ -277,7 +275,7 @@ class SubStar(PluginBase):
                 async with self.http.get(next_page) as response:
                     response.raise_for_status()
                     json_response = Dynamic.from_json(await response.text())
-                    page_html = BeautifulSoup(json_response.html, 'html.parser')
+                    page_html = parse_html(json_response.html)
                     posts_html = page_html
             
             next_page_sel = page_html.select('.posts-more')
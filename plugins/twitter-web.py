@@ -1,4 +1,7 @@
+import contextlib
 import re
+import os
+import time
 import dateutil.parser
 import json
 import yarl
@@ -7,6 +10,7 @@ from hoordu.dynamic import Dynamic
 from hoordu.models import *
 from hoordu.plugins import *
 from hoordu.forms import *
+from hoordu.util import wrap_async, mkpath
 
 
 DOMAIN = 'x.com'
@@ -36,6 +40,58 @@ ORIG_SIZE = 'orig'
 PROFILE_THUMB_SIZE = '200x200'
 
 PAGE_LIMIT = 20
+# seconds user lookups are cached for
+USER_CACHE_TTL = 6 * 60 * 60
+# seconds the pages client transaction ids are generated from are reused for
+TRANSACTION_CACHE_TTL = 24 * 60 * 60
+TRANSACTION_CACHE_FILE = 'client-transaction-pages.json'
+
+
+# the parsing runs in a worker thread, the pages are big enough to stall the event loop
+@wrap_async
+def _ondemand_file_url(home_page_content):
+    import bs4
+    from x_client_transaction.utils import get_ondemand_file_url
+    
+    return get_ondemand_file_url(response=bs4.BeautifulSoup(home_page_content, 'html.parser'))
+
+@wrap_async
+def _client_transaction(home_page_content, ondemand_file_content):
+    import bs4
+    from x_client_transaction import ClientTransaction
+    
+    home_page = bs4.BeautifulSoup(home_page_content, 'html.parser')
+    ondemand_file = bs4.BeautifulSoup(ondemand_file_content, 'html.parser')
+    return ClientTransaction(home_page_response=home_page, ondemand_file_response=ondemand_file)
+
+@wrap_async
+def _load_transaction_pages(path):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+            
+    except FileNotFoundError:
+        return None
+        
+    except ValueError:
+        cached = {}
+    
+    if time.time() - cached.get('stored_time', 0) >= TRANSACTION_CACHE_TTL or not {'home_page', 'ondemand_file'} <= cached.keys():
+        # the pages are a few hundred KB, stale ones aren't kept around
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        
+        return None
+    
+    return cached['home_page'], cached['ondemand_file']
+
+@wrap_async
+def _save_transaction_pages(path, home_page_content, ondemand_file_content):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'stored_time': time.time(), 'home_page': home_page_content, 'ondemand_file': ondemand_file_content}, f)
+    
+    os.replace(tmp, path)
 
 
 class Twitter(PluginBase):
@@ -86,26 +142,31 @@ class Twitter(PluginBase):
         
         return None
     
-    async def init(self):
+    async def _init_transaction(self):
         # transaction id hacks
-        import bs4
-        import requests
-        from x_client_transaction.utils import generate_headers, handle_x_migration, get_ondemand_file_url
-        from x_client_transaction import ClientTransaction
-        
-        session = requests.Session()
-        session.headers = generate_headers()
-        
-        # TODO convert this to async
-        home_page = session.get(url="https://x.com")
-        home_page_response = bs4.BeautifulSoup(home_page.content, 'html.parser')
-        ondemand_file_url = get_ondemand_file_url(response=home_page_response)
-        ondemand_file = session.get(url=ondemand_file_url)
-        ondemand_file_response = bs4.BeautifulSoup(ondemand_file.content, 'html.parser')
-        #ondemand_file_response = ondemand_file.text
+        from x_client_transaction.utils import generate_headers
+        
+        # the pages are cached, downloading them is most of the startup time
+        # but they are still parsed with bs4 on every start
+        cache_path = os.path.join(self.data_path, TRANSACTION_CACHE_FILE)
+        pages = await _load_transaction_pages(cache_path)
+        if pages is None:
+            headers = generate_headers()
+            async with self.http.get(f'https://{DOMAIN}', headers=headers) as resp:
+                resp.raise_for_status()
+                home_page = await resp.text()
+            
+            async with self.http.get(await _ondemand_file_url(home_page), headers=headers) as resp:
+                resp.raise_for_status()
+                pages = home_page, await resp.text()
+            
+            await mkpath(self.data_path)
+            await _save_transaction_pages(cache_path, *pages)
         
-        self.ct = ClientTransaction(home_page_response=home_page_response, ondemand_file_response=ondemand_file_response)
-        #
+        self.ct = await _client_transaction(*pages)
+    
+    async def init(self):
+        await self._init_transaction()
         
         self.http.headers.update({
             'Accept': '*/*',
@@ -363,7 +424,8 @@ class Twitter(PluginBase):
         headers = {
             'x-client-transaction-id': self.ct.generate_transaction_id('GET', yarl.URL(url).path),
         }
-        async with self.http.get(url, params=params, headers=headers) as resp:
+        # users are looked up on every update, but rarely change
+        async with self.http_cache.get(url, params=params, headers=headers, ttl=USER_CACHE_TTL) as resp:
             body = Dynamic.from_json(await resp.text())
         
         user = body.get_path('data', 'user', 'result')
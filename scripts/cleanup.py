@@ -1,64 +1,275 @@
 #!/usr/bin/env python3
 
+# reconciles the storage with the file table:
+# - deletes files and thumbnails that don't belong to any file in the database
+# - moves the ones that aren't where they should be
+# - reports files that are marked as present but weren't found
+#
+# files imported while it runs are left alone, as are the temporary files of
+# thumbnails that are being generated unless they're older than a day
+#
+# python cleanup.py [--apply]
+# nothing is changed unless --apply is passed, the plan is printed either way
+
 import asyncio
-import shutil
+import bisect
 import pathlib
+import re
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
 
 import hoordu
 from hoordu.models import *
-from hoordu.session import HoorduSession
+from hoordu.thumbnailers.variants import thumbnail_variants
 
 config = hoordu.load_config()
 hrd = hoordu.hoordu(config)
-basepath = pathlib.Path(config.settings.base_path)
+storage = hrd.storage
 
-debug = True
+debug = '--apply' not in sys.argv
 
-def delete_file(path):
-    print('rm "{}"'.format(path))
-    if not debug:
-        try: path.unlink()
-        except: pass
+concurrency = 16
 
-def move_file(src, dst):
-    print('mv "{}" "{}"'.format(src, dst))
-    if not debug:
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        try: shutil.move(src, dst)
-        except: pass
-
-async def check(path, isorig=True):
-    for bucket in path.iterdir():
-        for file in bucket.iterdir():
-            file_id = None
+SEEN_FILE = 1
+SEEN_THUMB = 2
+
+# `<id>.<ext>.tmp` written by the thumbnailers and `<id>.jpg.<n>.jpg` keyframe candidates
+TEMPORARY = re.compile(r'.+\.tmp|\d+\.jpg\.\d+\.jpg')
+TEMPORARY_MIN_AGE = timedelta(days=1)
+
+
+class Entry(NamedTuple):
+    # enough of a File for get_file_keys
+    id: int
+    ext: Optional[str]
+    thumb_ext: Optional[str]
+
+
+class KnownFiles:
+    """
+    Every file in the database, sorted by id.
+    The extensions are interned, so this takes a few bytes per file.
+    """
+    
+    def __init__(self):
+        self.ids = array('q')
+        self.exts = array('H')
+        self.thumb_exts = array('H')
+        self.flags = array('q')
+        self.ext_table: list[Optional[str]] = []
+        self._ext_index: dict[Optional[str], int] = {}
+        
+        self.seen = bytearray()
+        # files with higher ids were imported after the snapshot
+        self.max_id = 0
+    
+    def _intern(self, ext: Optional[str]) -> int:
+        index = self._ext_index.get(ext)
+        if index is None:
+            index = self._ext_index[ext] = len(self.ext_table)
+            self.ext_table.append(ext)
+        
+        return index
+    
+    def append(self, id: int, ext: Optional[str], thumb_ext: Optional[str], flags: int) -> None:
+        self.ids.append(id)
+        self.exts.append(self._intern(ext))
+        self.thumb_exts.append(self._intern(thumb_ext))
+        self.flags.append(flags)
+    
+    def find(self, id: int) -> Optional[int]:
+        i = bisect.bisect_left(self.ids, id)
+        if i < len(self.ids) and self.ids[i] == id:
+            return i
+        
+        return None
+    
+    def entry(self, i: int) -> Entry:
+        return Entry(self.ids[i], self.ext_table[self.exts[i]], self.ext_table[self.thumb_exts[i]])
+    
+    async def load(self) -> None:
+        # a single streamed query instead of one per file
+        async with hrd.session() as session:
+            result = await session.stream(
+                    select(File.id, File.ext, File.thumb_ext, File.flags) \
+                        .order_by(File.id) \
+                        .execution_options(yield_per=10000))
             
-            stem = file.stem
-            try:
-                file_id = int(stem)
-            except:
-                # not a valid file id
-                delete_file(file)
+            async for id, ext, thumb_ext, flags in result:
+                self.append(id, ext, thumb_ext, int(flags))
+        
+        self.seen = bytearray(len(self.ids))
+        self.max_id = self.ids[-1] if self.ids else 0
+
+
+class Delete(NamedTuple):
+    key: str
+    # the file the key belonged to, if it was a file that wasn't in the database
+    file_id: Optional[int] = None
+    # whether it was a thumbnail, which is also deleted if the file has no thumb_ext
+    thumb: bool = False
+
+
+class Plan:
+    def __init__(self):
+        self.deletes: list[Delete] = []
+        self.moves: list[tuple[str, str]] = []
+    
+    def delete(self, key: str, file_id: Optional[int] = None, thumb: bool = False) -> None:
+        self.deletes.append(Delete(key, file_id, thumb))
+    
+    def move(self, src: str, dst: str) -> None:
+        self.moves.append((src, dst))
+
+
+async def check(known: KnownFiles, plan: Plan, prefix: str, isorig: bool = True):
+    async for key in storage.iterate(prefix + '/'):
+        path = pathlib.PurePosixPath(key)
+        if TEMPORARY.fullmatch(path.name):
+            # probably a thumbnail that is being generated right now
+            stat = await storage.stat(key)
+            if stat is not None and datetime.now(timezone.utc) - stat.modified_time > TEMPORARY_MIN_AGE:
+                plan.delete(key)
+            continue
+        
+        stem = path.stem
+        variant = None
+        if not isorig and '_' in stem:
+            stem, variant_name = stem.split('_', 1)
+            variant = thumbnail_variants.get(variant_name)
+            if variant is None:
+                plan.delete(key)
                 continue
+        
+        try:
+            file_id = int(stem)
+        except:
+            # not a valid file id
+            plan.delete(key)
+            continue
+        
+        if file_id > known.max_id:
+            continue
+        
+        i = known.find(file_id)
+        if i is None:
+            plan.delete(key, file_id, not isorig and variant is None)
+            continue
+        
+        entry = known.entry(i)
+        if variant is not None:
+            actual_key = hrd.get_variant_key(entry, variant)
+            
+        elif isorig:
+            actual_key, _ = hrd.get_file_keys(entry)
+            known.seen[i] |= SEEN_FILE
             
-            async with hrd.session() as session:
-                db_file = await session.select(File).where(File.id == file_id).one_or_none()
+        else:
+            if entry.thumb_ext is None:
+                # the thumbnail failed or was never generated
+                plan.delete(key, file_id, True)
+                continue
             
-            if db_file is None:
-                delete_file(file)
-                
-            else:
-                # check if this file is in the right place, if not move it
-                orig, thumb = hrd.get_file_paths(db_file)
-                actual_path = pathlib.Path(orig if isorig else thumb)
-                
-                if file != actual_path:
-                    move_file(file, actual_path)
+            _, actual_key = hrd.get_file_keys(entry)
+            known.seen[i] |= SEEN_THUMB
+        
+        if key != actual_key:
+            plan.move(key, actual_key)
+
+def find_missing(known: KnownFiles) -> tuple[list[int], list[int]]:
+    missing, missing_thumbs = [], []
+    for i, id in enumerate(known.ids):
+        flags = known.flags[i]
+        seen = known.seen[i]
+        if flags & FileFlags.present and not seen & SEEN_FILE:
+            missing.append(id)
+        
+        if flags & FileFlags.thumb_present and not seen & SEEN_THUMB:
+            missing_thumbs.append(id)
+    
+    return missing, missing_thumbs
+
+async def recheck(deletes: list[Delete]) -> list[Delete]:
+    """
+    Drops the deletes of files that were imported (or thumbnailed)
+    since the snapshot was taken.
+    """
+    
+    ids = sorted({d.file_id for d in deletes if d.file_id is not None})
+    thumb_exts = {}
+    async with hrd.session() as session:
+        for i in range(0, len(ids), 10000):
+            result = await session.execute(
+                    select(File.id, File.thumb_ext) \
+                        .where(File.id.in_(ids[i:i + 10000])))
+            thumb_exts.update(result.all())
+    
+    def still_unused(d):
+        if d.file_id is None or d.file_id not in thumb_exts:
+            return True
+        
+        return d.thumb and thumb_exts[d.file_id] is None
+    
+    checked = [d for d in deletes if still_unused(d)]
+    if len(checked) < len(deletes):
+        print(f'# {len(deletes) - len(checked)} deletes skipped, their files were added since')
+    
+    return checked
+
+async def apply(plan: Plan) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def move(src, dst):
+        async with semaphore:
+            try:
+                await storage.link(src, dst)
+                await storage.delete(src)
+            except: pass
+    
+    async def delete(key):
+        async with semaphore:
+            try: await storage.delete(key)
+            except: pass
+    
+    await asyncio.gather(*(move(src, dst) for src, dst in plan.moves))
+    deletes = await recheck(plan.deletes)
+    await asyncio.gather(*(delete(d.key) for d in deletes))
 
 async def main():
-    #async with hrd.session() as session:
-    await check(basepath / 'files', True)
-    await check(basepath / 'thumbs', False)
+    known = KnownFiles()
+    await known.load()
+    print(f'# {len(known.ids)} files in the database')
+    
+    plan = Plan()
+    await asyncio.gather(
+        check(known, plan, 'files', True),
+        check(known, plan, 'thumbs', False)
+    )
+    
+    missing, missing_thumbs = find_missing(known)
+    
+    for src, dst in plan.moves:
+        print('mv "{}" "{}"'.format(storage.path(src), storage.path(dst)))
+    
+    for d in plan.deletes:
+        print('rm "{}"'.format(storage.path(d.key)))
+    
+    print(f'# {len(plan.moves)} moves, {len(plan.deletes)} deletes')
+    if missing:
+        print(f'# {len(missing)} files marked as present were not found: {missing}')
+    if missing_thumbs:
+        print(f'# {len(missing_thumbs)} thumbnails marked as present were not found: {missing_thumbs}')
+    
+    if not debug:
+        await apply(plan)
 
+async def run():
+    async with hrd:
+        await main()
 
-asyncio.run(main())
 
+asyncio.run(run())
@@ -10,6 +10,10 @@ from hoordu.models import *
 from hoordu.forms import *
 from hoordu.oauth.server import OAuthServer
 from hoordu.plugins.wrapper import PluginWrapper
+from hoordu.thumbnailers.queue import ThumbnailQueue
+from hoordu.scrub import Scrubber
+from hoordu.tagstats import reconcile_tag_stats
+from hoordu.archive import ArchiveExporter, ArchiveImporter, open_archive
 
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
@@ -65,6 +69,30 @@ def usage():
     print("    related <url> <related url> [<related url>...]")
     print("        downloads 'url' and all 'related url's")
     print("")
+    print("    thumbnails")
+    print("        generates thumbnails for every file that doesn't have one")
+    print("")
+    print("    hashes")
+    print("        computes the perceptual hash of every image that doesn't have one")
+    print("")
+    print("    similar <url>")
+    print("        lists files similar to the files of a post")
+    print("")
+    print("    tagstats")
+    print("        recounts the posts of every tag")
+    print("")
+    print("    scrub [<MB/s>]")
+    print("        checks that every file is still present and matches its hash")
+    print("        an interrupted scrub resumes where it stopped")
+    print("")
+    print("    export <path> [<since>]")
+    print("        exports the archive as json lines, compressed with zstd if 'path' ends in .zst")
+    print("        only rows updated after 'since' (an iso date) are exported if it's specified")
+    print("")
+    print("    import <path> [<manifest>]")
+    print("        imports an exported archive, merging it with the existing one")
+    print("        the old and new ids of files that got new ids are written to 'manifest'")
+    print("")
     print("alternative usage:")
     print("    when passed a list of urls, this command will attempt to download")
     print("    all of them, unless one of them corresponds to a list of posts")
@@ -130,6 +158,10 @@ async def parse_args(hrd):
     args.disabled = False
     args.local = False
     args.skip_prompts = False
+    args.rate = None
+    args.path = None
+    args.since = None
+    args.manifest = None
     
     argi = 1
     sargi = 0 # sub argument count
@@ -162,7 +194,7 @@ async def parse_args(hrd):
             
         elif args.command is None:
             # pick command, or append to list or urls
-            if arg in ('createdb', 'setup', 'list', 'enable', 'disable', 'update', 'fetch', 'rfetch', 'related', 'info', 'files'):
+            if arg in ('createdb', 'setup', 'list', 'enable', 'disable', 'update', 'fetch', 'rfetch', 'related', 'info', 'files', 'thumbnails', 'hashes', 'similar', 'scrub', 'tagstats', 'export', 'import'):
                 args.command = arg
                 sargi = 0
                 
@@ -184,10 +216,34 @@ async def parse_args(hrd):
                 
                 sargi += 1
                 
-            elif args.command in ('related', 'info', 'files'):
+            elif args.command in ('related', 'info', 'files', 'similar'):
                 args.urls.append(await parse_url(hrd, arg, args))
                 sargi += 1
                 
+            elif args.command == 'scrub' and sargi < 1:
+                args.rate = float(arg)
+                sargi += 1
+                
+            elif args.command == 'export' and sargi < 2:
+                if sargi == 0:
+                    args.path = arg
+                    
+                else:
+                    args.since = datetime.fromisoformat(arg)
+                    if args.since.tzinfo is None:
+                        args.since = args.since.replace(tzinfo=timezone.utc)
+                
+                sargi += 1
+                
+            elif args.command == 'import' and sargi < 2:
+                if sargi == 0:
+                    args.path = arg
+                    
+                else:
+                    args.manifest = arg
+                
+                sargi += 1
+                
             else:
                 fail(f'unknown argument: {arg}')
     
@@ -210,6 +266,9 @@ async def parse_args(hrd):
     if args.command in ('enable', 'disable', 'fetch', 'rfetch') and args.subscription is None:
         fail(f'{args.command} sub-command requires a subscription to be specified')
     
+    if args.command in ('export', 'import') and args.path is None:
+        fail(f'{args.command} sub-command requires a path')
+    
     if args.command == 'update' and args.subscription is None and args.plugin_id is None and args.source is None:
         fail(f'update sub-command requires a plugin, a source or a subscription to be specified')
     
@@ -425,7 +484,10 @@ async def main():
         await hoordu.hoordu.create_all(config)
         return
     
-    hrd = hoordu.hoordu(config)
+    async with hoordu.hoordu(config) as hrd:
+        await run(hrd)
+
+async def run(hrd):
     await hrd.reload_plugins()
     
     args = await parse_args(hrd)
@@ -550,7 +612,37 @@ async def main():
                 session.add(Related(related_to=post, remote=related_post))
                 await session.commit()
             
-        elif args.command in ('info', 'files'):
+        elif args.command == 'thumbnails':
+            total = await ThumbnailQueue(session).backfill()
+            print(f'processed {total} files')
+            
+        elif args.command == 'hashes':
+            total = await ThumbnailQueue(session).backfill_hashes()
+            print(f'hashed {total} files')
+            
+        elif args.command == 'tagstats':
+            total = await reconcile_tag_stats(session)
+            print(f'corrected {total} tags')
+            
+        elif args.command == 'scrub':
+            report = await Scrubber(session, rate=args.rate).run()
+            print(report.summary())
+            
+        elif args.command == 'export':
+            with open_archive(args.path, 'wb') as out:
+                counts = await ArchiveExporter(session).export(out, args.since)
+            
+            for table, count in counts.items():
+                print(f'{table}: {count}')
+                
+        elif args.command == 'import':
+            with open_archive(args.path, 'rb') as inp:
+                counts = await ArchiveImporter(session).run(inp, args.manifest)
+            
+            for table, count in counts.items():
+                print(f'{table}: {count.loaded} loaded, {count.inserted} inserted, {count.updated} updated, {count.skipped} skipped')
+                
+        elif args.command in ('info', 'files', 'similar'):
             if not args.local:
                 plugin, id = args.urls[0]
                 
@@ -585,6 +677,11 @@ async def main():
             for f in post.files:
                 orig, thumb = hrd.get_file_paths(f)
                 print(orig)
+                
+                if args.command == 'similar':
+                    for similar, distance in await session.similar_files(f):
+                        similar_orig, _ = hrd.get_file_paths(similar)
+                        print(f'    {distance}: {similar_orig}')
 
 
 asyncio.run(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import time
+
+import hoordu.dynamic
+from hoordu.dynamic import Dynamic
+
+# compares decoding and reading typical plugin payloads with and without orjson,
+# after checking that both decode them (and a few edge cases) the same way
+# usage: dynamic-benchmark.py [<response.json>...]
+
+rounds = 50
+repeat = 5
+
+def timeline_entry(i):
+    user = {
+        'rest_id': '12345',
+        'legacy': {
+            'screen_name': 'user',
+            'name': 'name',
+            'description': 'description ' * 10,
+            'entities': {'url': {'urls': []}},
+        },
+    }
+    media = {
+        'media_url_https': f'https://pbs.twimg.com/media/{i}.jpg',
+        'type': 'photo',
+        'sizes': {'large': {'w': 2048, 'h': 1536, 'resize': 'fit'}},
+    }
+    return {
+        'entryId': f'tweet-{i}',
+        'sortIndex': str(i),
+        'content': {
+            'entryType': 'TimelineTimelineItem',
+            'itemContent': {
+                'itemType': 'TimelineTweet',
+                'tweet_results': {
+                    'result': {
+                        '__typename': 'Tweet',
+                        'rest_id': str(i),
+                        'core': {'user_results': {'result': user}},
+                        'legacy': {
+                            'full_text': 'text ' * 40,
+                            'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+                            'entities': {'media': [media] * 4, 'hashtags': [{'text': 'tag'}] * 3, 'urls': []},
+                            'favorite_count': 10,
+                            'retweet_count': 2,
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+def read_timeline(body):
+    for inst in body.data.user.result.timeline_v2.timeline.instructions:
+        for entry in inst.entries:
+            tweet = entry.content.itemContent.tweet_results.result
+            tweet.rest_id, tweet.core.user_results.result.legacy.screen_name
+            for media in tweet.legacy.entities.media:
+                media.media_url_https
+
+def pixiv_post(i):
+    return {
+        'error': False,
+        'message': '',
+        'body': {
+            'illustId': str(i),
+            'illustTitle': 'title',
+            'illustComment': 'comment<br />' * 20,
+            'createDate': '2020-01-01T00:00:00+00:00',
+            'userId': '1',
+            'userName': 'user',
+            'tags': {'tags': [{'tag': f'tag{t}', 'translation': {'en': f'tag {t}'}} for t in range(10)]},
+            'urls': {size: f'https://i.pximg.net/{size}/{i}.jpg' for size in ('mini', 'thumb', 'small', 'regular', 'original')},
+            'pageCount': 3,
+            'userIllusts': {str(p): {'id': str(p), 'title': 'title', 'url': 'https://i.pximg.net/x.jpg', 'tags': ['a', 'b']} for p in range(150)},
+        },
+    }
+
+def read_pixiv(body):
+    post = body.body
+    post.illustTitle, post.urls.original
+    for tag in post.tags.tags:
+        tag.tag, tag.get('translation')
+
+# values orjson can't decode by itself
+edge_cases = [
+    '{"id": 18446744073709551616, "ids": [123456789012345678901234, -9223372036854775809]}',
+    '{"max": 18446744073709551615, "min": -9223372036854775808}',
+    '{"nan": NaN, "inf": Infinity}',
+    '{"large": 1e400, "text": "\\ud83d\\ude00"}',
+]
+
+def decode_all(encoded):
+    # through the accessors, so nested objects are wrapped
+    value = Dynamic.from_json(encoded)
+    return json.dumps(value, sort_keys=True, default=lambda o: dict(o.items()))
+
+def check(backends, payloads):
+    encoded = edge_cases + [json.dumps(payload) for _, payload, _ in payloads]
+    
+    ok = True
+    for i, e in enumerate(encoded):
+        results = []
+        for backend, module in backends:
+            hoordu.dynamic.orjson = module
+            results.append(decode_all(e))
+            results.append(decode_all(e.encode()))
+        
+        if len(set(results)) > 1:
+            print(f'decoders disagree on payload {i}: {e[:100]}', file=sys.stderr)
+            ok = False
+    
+    d = Dynamic.from_json('{"a": {"b": [{"c": 1}]}}')
+    if type(d.setdefault('a', {})) is not Dynamic or type(d.setdefault('x', {'y': 1})) is not Dynamic:
+        print('setdefault returned an unwrapped object', file=sys.stderr)
+        ok = False
+    
+    return ok
+
+def best(func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        
+        times.append((time.perf_counter() - start) / rounds)
+    
+    return min(times)
+
+def bench(name, payload, read):
+    encoded = json.dumps(payload)
+    
+    decode = best(lambda: Dynamic.from_json(encoded))
+    total = best(lambda: read(Dynamic.from_json(encoded)))
+    
+    print(f'  {name} ({len(encoded) / 1024:.0f} KiB): decode {decode * 1000:.2f}ms, decode + read {total * 1000:.2f}ms')
+
+def main(paths):
+    payloads = [
+        ('twitter timeline', {'data': {'user': {'result': {'timeline_v2': {'timeline': {'instructions': [
+            {'type': 'TimelineAddEntries', 'entries': [timeline_entry(i) for i in range(100)]}
+        ]}}}}}}, read_timeline),
+        ('pixiv post', pixiv_post(1), read_pixiv),
+    ]
+    for path in paths:
+        with open(path, 'rb') as f:
+            payloads.append((path, json.loads(f.read()), lambda body: None))
+    
+    orjson = hoordu.dynamic.orjson
+    backends = [('json', None)]
+    if orjson is not None:
+        backends.append(('orjson', orjson))
+        
+    else:
+        print('orjson is not installed', file=sys.stderr)
+    
+    if not check(backends, payloads):
+        sys.exit(1)
+    
+    for backend, module in backends:
+        hoordu.dynamic.orjson = module
+        print(f'{backend}:')
+        for name, payload, read in payloads:
+            bench(name, payload, read)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
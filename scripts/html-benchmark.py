@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+# compares the html parsers BeautifulSoup can use on saved pages
+# usage: html-benchmark.py <page.html> [<page.html>...]
+
+rounds = 5
+parsers = ['html.parser', 'lxml']
+
+def bench(parser, pages):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            html = BeautifulSoup(page, parser)
+            # most plugins select a few elements and read their text
+            for a in html.select('a'):
+                a.text
+    
+    wall = time.perf_counter() - start
+    
+    count = rounds * len(pages)
+    size = rounds * sum(len(page) for page in pages) / (1 << 20)
+    print(f'{parser}: {count} pages in {wall:.2f}s ({count / wall:.1f} pages/s, {size / wall:.1f} MB/s)')
+
+def main(paths):
+    if not paths:
+        print('no pages to benchmark', file=sys.stderr)
+        sys.exit(1)
+    
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    
+    for parser in parsers:
+        try:
+            bench(parser, pages)
+            
+        except FeatureNotFound as e:
+            print(f'{parser}: unavailable ({e})')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
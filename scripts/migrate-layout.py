@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# moves files (and their thumbnails) from the layouts in
+# config.files_previous_bucket_levels to config.files_bucket_levels
+# hoordu keeps working while this runs, files that haven't been moved yet
+# are found through the previous layouts
+#
+# python migrate-layout.py [<start file id>]
+# the last migrated id is printed every batch, so it can be resumed from there
+
+import asyncio
+import os
+import sys
+
+import hoordu
+from hoordu.models import *
+from hoordu.storage import LocalStorage
+from hoordu.thumbnailers.variants import thumbnail_variants
+
+batch_size = 1000
+concurrency = 16
+
+async def move(storage, src, dst):
+    if src == dst or await storage.stat(src) is None:
+        return False
+    
+    if await storage.stat(dst) is None:
+        await storage.link(src, dst)
+    
+    await storage.delete(src)
+    return True
+
+async def migrate_file(hrd, file):
+    storage = hrd.storage
+    moved = 0
+    
+    filekey, thumbkey = hrd.get_file_keys(file)
+    for levels in hrd.previous_bucket_levels:
+        old_filekey, old_thumbkey = hrd.get_file_keys(file, levels)
+        moved += await move(storage, old_filekey, filekey)
+        moved += await move(storage, old_thumbkey, thumbkey)
+        
+        for variant in thumbnail_variants.values():
+            moved += await move(storage, hrd.get_variant_key(file, variant, levels), hrd.get_variant_key(file, variant))
+    
+    return moved
+
+def remove_empty_directories(hrd, files):
+    # only the local storage has directories, the old buckets are removed
+    # (with their parents) once every file in them was moved
+    storage = hrd.storage
+    if not isinstance(storage, LocalStorage):
+        return
+    
+    roots = {storage.path('files'), storage.path('thumbs')}
+    directories = set()
+    for file in files:
+        for levels in hrd.previous_bucket_levels:
+            directories.update(os.path.dirname(storage.path(key)) for key in hrd.get_file_keys(file, levels))
+    
+    for directory in directories:
+        while directory not in roots:
+            try:
+                os.rmdir(directory)
+                
+            except OSError:
+                # not empty, or already removed
+                break
+            
+            directory = os.path.dirname(directory)
+
+async def migrate(hrd):
+    if not hrd.previous_bucket_levels:
+        print('no previous layouts configured in files_previous_bucket_levels')
+        return
+    
+    last_id = int(sys.argv[1]) - 1 if len(sys.argv) == 2 else 0
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def worker(file):
+        async with semaphore:
+            return await migrate_file(hrd, file)
+    
+    total = 0
+    async with hrd.session() as session:
+        while True:
+            files = await session.select(File) \
+                    .where(File.id > last_id) \
+                    .order_by(File.id) \
+                    .limit(batch_size) \
+                    .all()
+            
+            if not files:
+                break
+            
+            total += sum(await asyncio.gather(*(worker(file) for file in files)))
+            last_id = files[-1].id
+            
+            remove_empty_directories(hrd, files)
+            
+            # the session doesn't need to hold on to every file
+            session.raw.expunge_all()
+            print(f'migrated up to file {last_id}, {total} objects moved')
+    
+    print('done, remove files_previous_bucket_levels from the config')
+
+async def main():
+    async with hoordu.hoordu(hoordu.load_config()) as hrd:
+        await migrate(hrd)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
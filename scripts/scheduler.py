@@ -11,6 +11,7 @@ import collections
 
 import hoordu
 from hoordu.models import *
+from hoordu.thumbnailers.queue import ThumbnailQueue
 
 from sqlalchemy.sql import or_, and_, func
 from sqlalchemy.orm import selectinload
@@ -104,8 +105,7 @@ async def fetch(session, plugin, subscription):
             await session.rollback()
             return
 
-async def main(sources):
-    hrd = hoordu.hoordu(hoordu.load_config())
+async def update(hrd, sources):
     async with hrd.session() as session:
         subs = await session.select(Subscription) \
                 .join(Source) \
@@ -153,6 +153,17 @@ async def main(sources):
             plugin = await session.plugin(sub.plugin.name)
             await fetch(session, plugin, sub)
             await session.commit()
+        
+        # generate the thumbnails for everything that was just imported
+        await ThumbnailQueue(session).drain()
+    
+    for source, stats in hrd.http.retry_stats.items():
+        if stats.retries > 0 or stats.exhausted > 0:
+            print(f'{source} http retries: {stats.summary()}')
+
+async def main(sources):
+    async with hoordu.hoordu(hoordu.load_config()) as hrd:
+        await update(hrd, sources)
     
     if USE_SEND_MAIL and len(email_error_log) > 0 and SENDMAIL_TO:
         subject = 'Hoordu update error summary'
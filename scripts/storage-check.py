@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+
+import hoordu
+from hoordu.storage import create_storage
+
+# round trips every storage operation against the configured backend
+# (e.g.: a local minio server set up as `storage` in hoordu.conf),
+# under keys starting with check/ that are deleted at the end
+# usage: storage-check.py [--large]
+
+PREFIX = 'check/'
+
+def write_random(path, size):
+    digest = hashlib.md5()
+    with open(path, 'wb') as f:
+        while size > 0:
+            chunk = os.urandom(min(size, 1 << 20))
+            digest.update(chunk)
+            f.write(chunk)
+            size -= len(chunk)
+    
+    return digest.digest()
+
+async def read_all(storage, key):
+    digest = hashlib.md5()
+    async with storage.open(key) as reader:
+        while chunk := await reader.read(1 << 20):
+            digest.update(chunk)
+    
+    return digest.digest()
+
+def check(name, ok):
+    print(f'{name}: {"ok" if ok else "FAILED"}')
+    if not ok:
+        sys.exit(1)
+
+async def main(large):
+    storage = create_storage(hoordu.load_config().settings)
+    sizes = {'small': 1 << 10, 'medium': 8 << 20}
+    if large:
+        # uploaded in parts by the s3 backend
+        from hoordu.storage.s3 import MULTIPART_SIZE
+        sizes['large'] = MULTIPART_SIZE * 2 + 1
+    
+    try:
+        with tempfile.TemporaryDirectory() as dir:
+            for name, size in sizes.items():
+                key = f'{PREFIX}{name}.bin'
+                src = os.path.join(dir, name)
+                digest = write_random(src, size)
+                
+                await storage.put(key, src)
+                stat = await storage.stat(key)
+                check(f'put {name} ({size} bytes)', stat is not None and stat.size == size)
+                check(f'open {name}', await read_all(storage, key) == digest)
+            
+            await storage.link(f'{PREFIX}small.bin', f'{PREFIX}link.bin')
+            check('link', await read_all(storage, f'{PREFIX}link.bin') == await read_all(storage, f'{PREFIX}small.bin'))
+            
+            async with storage.local_path(f'{PREFIX}small.bin') as path:
+                check('local_path', os.path.getsize(path) == sizes['small'])
+            
+            async with storage.writable_path(f'{PREFIX}written.bin') as path:
+                with open(path, 'wb') as f:
+                    f.write(b'written')
+            
+            check('writable_path', (await storage.stat(f'{PREFIX}written.bin')).size == 7)
+            
+            keys = {key async for key in storage.iterate(PREFIX)}
+            expected = {f'{PREFIX}{name}.bin' for name in (*sizes, 'link', 'written')}
+            check('iterate', keys == expected)
+            
+            for key in keys:
+                await storage.delete(key)
+            
+            await storage.delete(f'{PREFIX}missing.bin')
+            check('delete', all([await storage.stat(key) is None for key in keys]))
+            
+    finally:
+        await storage.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main('--large' in sys.argv[1:]))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import tempfile
+import time
+
+from hoordu.util import mime_from_file_sync
+from hoordu.thumbnailers import MAX_SIZE, QUALITY, magick_thumbnail
+from hoordu.thumbnailers.pillow import pillow_thumbnail_sync
+
+# compares the per core throughput of the in-process thumbnailer against magick
+# usage: thumbnail-benchmark.py <image> [<image>...]
+
+rounds = 3
+
+async def bench(name, thumbnailer, files):
+    with tempfile.TemporaryDirectory() as dir:
+        dst = f'{dir}/thumb.jpg'
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for src in files:
+                await thumbnailer(src, dst)
+        
+        wall = time.perf_counter() - start
+    
+    count = rounds * len(files)
+    # both run one file at a time, so this is the throughput of a single worker
+    print(f'{name}: {count} thumbnails in {wall:.2f}s ({count / wall:.1f} files/s/core)')
+
+async def pillow(src, dst):
+    return pillow_thumbnail_sync(src, dst, MAX_SIZE, QUALITY)
+
+async def main(files):
+    files = [f for f in files if mime_from_file_sync(f).startswith('image/')]
+    if not files:
+        print('no images to benchmark', file=sys.stderr)
+        sys.exit(1)
+    
+    await bench('magick', magick_thumbnail, files)
+    await bench('pillow', pillow, files)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:]))
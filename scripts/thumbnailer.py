@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+import hoordu
+from hoordu.thumbnailers.queue import ThumbnailQueue
+
+poll_interval = 60
+
+async def main():
+    async with hoordu.hoordu(hoordu.load_config()) as hrd, hrd.session() as session:
+        await ThumbnailQueue(session).run(poll_interval)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import hoordu
+from hoordu.config import HoorduConfig
+from hoordu.models import Base
+
+
+async def _recreate(database: str) -> None:
+    engine = create_async_engine(database)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    
+    await engine.dispose()
+
+@pytest.fixture
+def hrd(tmp_path):
+    """
+    A hoordu instance on an empty database, the tests that need one are skipped
+    unless HOORDU_TEST_DATABASE is set (everything in it is dropped).
+    """
+    
+    database = os.environ.get('HOORDU_TEST_DATABASE')
+    if not database:
+        pytest.skip('HOORDU_TEST_DATABASE is not set')
+    
+    (tmp_path / 'hoordu.conf').write_text(
+        f'database = {database!r}\n'
+        f'base_path = {str(tmp_path / "data")!r}\n'
+        'files_bucket_size = 1 << 16\n'
+    )
+    
+    asyncio.run(_recreate(database))
+    
+    instance = hoordu.hoordu(HoorduConfig(tmp_path))
+    yield instance
+    asyncio.run(instance.close())
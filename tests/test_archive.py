@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime, timezone
+import io
+
+from sqlalchemy import select, text, update
+
+from hoordu.archive import ArchiveExporter, ArchiveImporter
+from hoordu.models import *
+
+
+EXPORTED_TIME = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+async def _create_post(hrd):
+    async with hrd.session() as session:
+        source = Source(name='test')
+        session.add(source)
+        await session.flush()
+        
+        tag = RemoteTag(source_id=source.id, category=TagCategory.general, tag='tag')
+        post = RemotePost(source_id=source.id, original_id='1', type=PostType.set)
+        session.add(tag, post)
+        await session.flush()
+        
+        await post.add_tag(tag)
+        await session.flush()
+        
+        await session.execute(update(RemotePost).values(updated_time=EXPORTED_TIME))
+
+async def _clear(hrd):
+    async with hrd.session() as session:
+        tables = ', '.join(Base.metadata.tables)
+        await session.execute(text(f'TRUNCATE {tables} RESTART IDENTITY CASCADE'))
+
+async def _export(hrd, since=None) -> tuple[bytes, dict[str, int]]:
+    out = io.BytesIO()
+    async with hrd.session() as session:
+        counts = await ArchiveExporter(session).export(out, since)
+    
+    return out.getvalue(), counts
+
+async def _import(hrd, archive: bytes):
+    async with hrd.session() as session:
+        return await ArchiveImporter(session).run(io.BytesIO(archive))
+
+async def _updated_time(hrd) -> datetime:
+    async with hrd.session() as session:
+        return (await session.execute(select(RemotePost.updated_time))).scalar_one()
+
+
+def test_import_twice_keeps_updated_time(hrd):
+    async def run():
+        await _create_post(hrd)
+        archive, _ = await _export(hrd)
+        
+        await _clear(hrd)
+        
+        first = await _import(hrd, archive)
+        assert first['remote_post_tag'].inserted == 1
+        assert await _updated_time(hrd) == EXPORTED_TIME
+        
+        second = await _import(hrd, archive)
+        assert second['remote_post'].updated == 0
+        assert await _updated_time(hrd) == EXPORTED_TIME
+        
+        # nothing changed since the export
+        _, counts = await _export(hrd, EXPORTED_TIME)
+        assert counts['remote_post'] == 0
+    
+    asyncio.run(run())
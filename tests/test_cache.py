@@ -0,0 +1,83 @@
+from sqlalchemy import Column, ForeignKey, Integer, Text, create_engine, event
+from sqlalchemy.orm import Session, declarative_base, deferred
+
+from hoordu.cache import entity_tags
+
+
+Base = declarative_base()
+
+class Parent(Base):
+    __tablename__ = 'parent'
+    
+    id = Column(Integer, primary_key=True)
+
+class Child(Base):
+    __tablename__ = 'child'
+    
+    id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, ForeignKey('parent.id'))
+    name = Column(Text)
+    body = deferred(Column(Text))
+
+
+def test_entity_tags_of_deleted_object_with_expired_attributes():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    
+    with Session(engine, expire_on_commit=False) as session:
+        session.add(Parent(id=1))
+        session.add(Child(id=2, parent_id=1, name='child', body='body'))
+        session.commit()
+        
+        child = session.get(Child, 2)
+        session.expire(child, ['parent_id', 'name'])
+        
+        tags = []
+        statements = []
+        
+        @event.listens_for(session, 'after_flush')
+        def collect(session, flush_context):
+            # same as HoorduSession._collect_flush
+            for obj in list(session.deleted):
+                tags.append(entity_tags(obj))
+        
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        session.delete(child)
+        session.flush()
+        
+        assert tags == [{'table:child', 'child:2', 'parent:*'}]
+        assert not any(statement.startswith('SELECT') for statement in statements)
+
+def test_entity_tags_of_moved_object():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    
+    with Session(engine) as session:
+        session.add_all([Parent(id=1), Parent(id=3)])
+        session.add(Child(id=2, parent_id=1))
+        session.commit()
+        
+        child = session.get(Child, 2)
+        child.parent_id = 3
+        
+        assert entity_tags(child) == {'table:child', 'child:2', 'parent:1', 'parent:3'}
+
+def test_entity_tags_of_new_object():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    
+    with Session(engine) as session:
+        tags = []
+        
+        @event.listens_for(session, 'after_flush')
+        def collect(session, flush_context):
+            for obj in list(session.new):
+                tags.append(entity_tags(obj))
+        
+        session.add(Child(id=2))
+        session.flush()
+        
+        assert tags == [{'table:child', 'child:2'}]
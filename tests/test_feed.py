@@ -0,0 +1,54 @@
+import asyncio
+
+from hoordu.models import *
+
+
+def _second_index(i: int) -> int:
+    return i + 5 if i < 5 else i - 5
+
+async def _create_feeds(hrd) -> tuple[int, int]:
+    async with hrd.session() as session:
+        source = Source(name='test')
+        session.add(source)
+        await session.flush()
+        
+        first = Subscription(source_id=source.id, name='first', repr='first')
+        second = Subscription(source_id=source.id, name='second', repr='second')
+        posts = [RemotePost(source_id=source.id, original_id=str(i), type=PostType.set) for i in range(10)]
+        session.add(first, second, *posts)
+        await session.flush()
+        
+        for i, post in enumerate(posts):
+            session.add(FeedEntry(subscription_id=first.id, remote_post_id=post.id, sort_index=i))
+            
+            # the same posts in another feed, some sorted before and some after
+            if i % 2 == 0:
+                session.add(FeedEntry(subscription_id=second.id, remote_post_id=post.id, sort_index=_second_index(i)))
+        
+        return first.id, second.id
+
+async def _page_through(hrd, ids: list[int], oldest_first: bool) -> list[str]:
+    seen = []
+    cursor = None
+    async with hrd.session() as session:
+        while True:
+            page, cursor = await session.feed(ids, cursor, page_size=3, oldest_first=oldest_first)
+            seen.extend(post.original_id for post in page)
+            if cursor is None:
+                return seen
+
+
+def test_feed_of_overlapping_subscriptions(hrd):
+    async def run():
+        ids = await _create_feeds(hrd)
+        
+        # every post is listed once, by its best sort_index across the feeds
+        best = {str(i): max(i, _second_index(i)) if i % 2 == 0 else i for i in range(10)}
+        expected = sorted(best, key=lambda id: (best[id], int(id)), reverse=True)
+        assert await _page_through(hrd, list(ids), False) == expected
+        
+        best = {str(i): min(i, _second_index(i)) if i % 2 == 0 else i for i in range(10)}
+        expected = sorted(best, key=lambda id: (best[id], int(id)))
+        assert await _page_through(hrd, list(ids), True) == expected
+    
+    asyncio.run(run())